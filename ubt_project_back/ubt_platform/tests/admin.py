@@ -1,22 +1,37 @@
-from collections import defaultdict
+import os
 from datetime import datetime
 
 import nested_admin
+from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.admin import DateFieldListFilter
+from django.contrib.admin.views.main import ORDER_VAR
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import AdminPasswordChangeForm
-from django.http import HttpResponse
-from django.shortcuts import redirect, render
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 from django_summernote.widgets import SummernoteWidget
 from django import forms
-from .models import Subject, Question, Answer, MatchingPair, TestResult, SubjectResult, CustomUser, School
+from .admin_filters import IinFilter, FullNameFilter, SchoolFilter, UsageTypeFilter, ActiveFilter, \
+    invalidate_facets
+from .admin_pagination import ApproximateCountPaginator, KEYSET_PARAM, keyset_filter, keyset_next_url, \
+    parse_keyset_cursor
+from .authentication import token_cache
+from .exam_sessions import access_code_rows
+from .exports import XLSX_CONTENT_TYPE, build_access_codes_file, build_results_file, export_file_name, \
+    school_results
+from .models import Subject, Question, Answer, MatchingPair, TestResult, SubjectResult, CustomUser, School, \
+    SubmissionTicket, ExportJob, ExportJobFile, SchoolDailyRollup, SchoolDailySubjectRollup, UserImport, \
+    UserLifecycleJob, ExamSession
+from .rollups import forget_results
+from .user_lifecycle import apply_user_action, parse_iins
+from .variant_registry import DEFAULT_SUBJECTS
 from django.urls import reverse, path
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext_lazy as _
-from openpyxl import Workbook
-from openpyxl.styles import Font
 
 
 # Кастомная форма для Answer с использованием Summernote
@@ -118,18 +133,27 @@ class TotalScoreFilter(admin.SimpleListFilter):
 class TestResultAdmin(nested_admin.NestedModelAdmin):
     change_list_template = "admin/change_list.html"
 
-    date_hierarchy = 'date_taken'
-
+    # Без date_hierarchy: его навигация по годам/месяцам сканирует всю таблицу,
+    # фильтр по дате ниже работает по индексу
     list_display = ['user_full_name', 'user_iin', 'user_school', 'total_score', 'date_taken']
+    list_select_related = ['user', 'user__school']
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    # Ученик ищется по ИИН или началу ФИО, а не выбирается из списка всех пользователей;
+    # у школы и типа использования количества берутся из кэша
+    user_field_prefix = 'user__'
     list_filter = [
         ('date_taken', DateFieldListFilter),
-        'user__usage_type',
+        UsageTypeFilter,
         ('user__created_at', DateFieldListFilter),
-        'user__school',
-        'user',
+        SchoolFilter,
+        IinFilter,
+        FullNameFilter,
         TotalScoreFilter
     ]
-    ordering = ['-date_taken', 'user__full_name']
+    show_facets = admin.ShowFacets.NEVER
+    # Совпадает с индексом testresult_date_id_idx и позволяет листать по курсору
+    ordering = ['-date_taken', '-id']
     inlines = [SubjectResultInline]
     readonly_fields = ['id', 'total_score', 'date_taken', 'user']
 
@@ -148,27 +172,6 @@ class TestResultAdmin(nested_admin.NestedModelAdmin):
 
     user_school.short_description = 'Школа'
 
-    SUBJECT_CODE_TO_RU = {
-        'HIS': 'История',
-        'RL': 'Грам. чтения',
-        'ML': 'Матем. грам.',
-        'BIO': 'Биология',
-        'CHE': 'Химия',
-        'MAT': 'Математика',
-        'PHY': 'Физика',
-        'GEO': 'География',
-        'LF': 'Право',
-        'FL': 'Иностр. язык',
-        'KZ': 'Казахский яз.',
-        'KL': 'Казахская лит.',
-        'INF': 'Информатика',
-        'WHI': 'Всемир. история',
-        'RU': 'Русский язык',
-        'RUL': 'Русская лит.',
-    }
-
-    DEFAULT_CODES = ['HIS', 'RL', 'ML']
-
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -203,158 +206,62 @@ class TestResultAdmin(nested_admin.NestedModelAdmin):
                 })
 
             # Берём результаты тестов за выбранную дату по заданной школе
-            test_results = (
-                TestResult.objects.filter(
-                    user__school_id=school_id,
-                    date_taken__date=selected_date
-                )
-                .select_related("user")
-                .order_by("user", "-total_score")
-                .distinct("user")
-            )
+            test_results = school_results(school.id, selected_date)
 
-            if not test_results.exists():
+            if not test_results:
                 return render(request, "admin/export_results.html", {
                     "schools": School.objects.all(),
                     "error": "Нет данных для выбранной школы и даты!"
                 })
 
-            # -----------------------
-            # Готовим группировку по "паре дополнительных предметов"
-            # -----------------------
-            # Для каждого test_result определяем, какие предметы у него были (кроме 3 статичных),
-            # и группируем результаты по этим парам.
-            # Например, (BIO, CHE) -> [список TestResult], (INF, MAT) -> [список TestResult], ...
-            group_to_results = defaultdict(list)
-
-            for tr in test_results:
-                # Получаем все SubjectResult для данного TestResult
-                subject_res_qs = tr.subject_results.select_related('subject')
-
-                # Выделим коды предметов
-                codes = [sr.subject.name for sr in subject_res_qs]
-                # Оставляем «дополнительные» предметы = те, что не в DEFAULT_CODES
-                optional_codes = [c for c in codes if c not in self.DEFAULT_CODES]
-
-                # На случай, если вдруг там нет 2х предметов, подстрахуемся
-                # Сортируем, чтобы пара (BIO, CHE) была тем же, что и (CHE, BIO)
-                optional_codes = sorted(optional_codes)
-
-                # Превращаем в tuple, чтобы можно было использовать как ключ в dict
-                pair_key = tuple(optional_codes)
-                group_to_results[pair_key].append(tr)
-
-            # Теперь у нас есть словарь: {('BIO','CHE'): [...], ('INF','MAT'): [...], ...}
-
-            # Создаем Excel
-            wb = Workbook()
-            # Удалим стартовый лист "Sheet", чтобы не мешался,
-            # или можем просто переименовать, но удобнее удалить и создавать с нуля
-            default_sheet = wb.active
-            wb.remove(default_sheet)
-
-            # Для каждого "pair_key" (уникальная пара доп. предметов) делаем свой лист
-            for pair_key, results_in_group in group_to_results.items():
-                # Если по каким-то причинам пара пустая или одна, формируем название как есть
-                if not pair_key:
-                    sheet_name = "Без доп. предметов"
-                else:
-                    # Пример: "BIO+CHE"
-                    sheet_name = "+".join(pair_key)
-                ws = wb.create_sheet(title=sheet_name[:31])  # Ограничение Excel в 31 символ
-
-                # Заголовок:
-                #  1) Школа
-                #  2) Имя пользователя
-                #  3) Общий балл
-                #  4) Дата прохождения
-                #  5) 3 столбца для фиксированных предметов
-                #  6) столбцы для предметов из pair_key
-                headers = [
-                    "Название школы",
-                    "Имя пользователя",
-                    "Общий балл",
-                    "Дата прохождения",
-                    # Три статичных предмета
-                    self.SUBJECT_CODE_TO_RU.get('HIS', 'HIS'),
-                    self.SUBJECT_CODE_TO_RU.get('RL', 'RL'),
-                    self.SUBJECT_CODE_TO_RU.get('ML', 'ML')
-                ]
-
-                # Добавляем «дополнительные» предметы в заголовок
-                for code in pair_key:
-                    headers.append(self.SUBJECT_CODE_TO_RU.get(code, code))
-
-                ws.append(headers)
-
-                # Делаем заголовки жирными
-                bold_font = Font(bold=True)
-                for col_num, header in enumerate(headers, 1):
-                    ws.cell(row=1, column=col_num).font = bold_font
-
-                # Заполняем строки данными
-                for test in results_in_group:
-                    row = []
-                    # 1) Название школы
-                    row.append(test.user.school.name if test.user.school else "—")
-                    # 2) Имя пользователя
-                    row.append(test.user.full_name)
-                    # 3) Общий балл
-                    row.append(test.total_score)
-                    # 4) Дата прохождения
-                    row.append(test.date_taken.strftime("%Y-%m-%d %H:%M:%S"))
-
-                    # Нужно вытащить баллы по каждому предмету
-                    # Превратим список SubjectResult в словарь {код:балл}
-                    sr_qs = test.subject_results.select_related('subject')
-                    code_to_score = {}
-                    for sr in sr_qs:
-                        code_to_score[sr.subject.name] = sr.score
-
-                    # Добавляем 3 фиксированных предмета
-                    for def_code in self.DEFAULT_CODES:
-                        row.append(code_to_score.get(def_code, 0))
-
-                    # Добавляем баллы по выбранным предметам
-                    for opt_code in pair_key:
-                        row.append(code_to_score.get(opt_code, 0))
-
-                    ws.append(row)
-
-                    current_row = ws.max_row
-                    ws.cell(row=current_row, column=2).font = bold_font
-
-                    # Автоматическая настройка ширины столбцов
-                    for column_cells in ws.columns:
-                        max_length = 0
-                        column = column_cells[0].column_letter
-                        for cell in column_cells:
-                            try:
-                                cell_length = len(str(cell.value))
-                                if cell_length > max_length:
-                                    max_length = cell_length
-                            except:
-                                pass
-                        ws.column_dimensions[column].width = max_length + 2
-
-            # Формируем имя файла, подставляя школу и дату
-            school_name_cleaned = "".join(c if c.isalnum() else "_" for c in school.name)
-            file_name = f"test_results_{school_name_cleaned}_{selected_date}.xlsx"
-
-            response = HttpResponse(
-                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            # Книга пишется в потоковом режиме во временный файл
+            # и отдаётся клиенту частями
+            return FileResponse(
+                build_results_file(test_results),
+                as_attachment=True,
+                filename=export_file_name(school, selected_date),
+                content_type=XLSX_CONTENT_TYPE,
             )
-            response["Content-Disposition"] = f'attachment; filename="{file_name}"'
-            wb.save(response)
-            return response
 
         # Если не POST, рендерим форму
         return render(request, "admin/export_results.html", {"schools": School.objects.all()})
 
+    # Сводки по дням удаляемых результатов пересчитываются после удаления
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            forget_results(TestResult.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            forget_results(queryset)
+            super().delete_queryset(request, queryset)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        cursor = getattr(request, 'keyset_cursor', None)
+        if cursor is not None:
+            queryset = queryset.filter(keyset_filter(cursor))
+        return queryset
+
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
         extra_context["export_excel_url"] = "export-excel/"
-        return super().changelist_view(request, extra_context)
+
+        # Курсор "после строки" убираем из GET, иначе админка примет его за фильтр
+        if KEYSET_PARAM in request.GET:
+            request.GET = request.GET.copy()
+            request.keyset_cursor = parse_keyset_cursor(request.GET.pop(KEYSET_PARAM)[0])
+
+        response = super().changelist_view(request, extra_context)
+
+        # Листать по курсору можно только при сортировке по умолчанию
+        cl = getattr(response, 'context_data', {}).get('cl')
+        sorted_by_default = ORDER_VAR not in request.GET and TotalScoreFilter.parameter_name not in request.GET
+        if cl is not None and sorted_by_default and len(cl.result_list) == cl.list_per_page:
+            last_obj = cl.result_list[cl.list_per_page - 1]
+            response.context_data['keyset_next_url'] = keyset_next_url(request.GET, last_obj)
+        return response
 
 
 class CustomUserCreationForm(forms.ModelForm):
@@ -382,10 +289,11 @@ class CustomUserAdmin(UserAdmin):
     model = CustomUser
     change_password_form = AdminPasswordChangeForm
 
-    date_hierarchy = 'created_at'
-
     list_display = ('iin', 'full_name', 'school', 'usage_type', 'created_at', 'is_active')
-    list_filter = ('iin', 'full_name', 'is_active', 'usage_type', ('created_at', DateFieldListFilter), 'school')
+    # Без date_hierarchy и списков всех ИИН/ФИО: боковая панель не сканирует таблицу пользователей
+    list_filter = (IinFilter, FullNameFilter, ActiveFilter, UsageTypeFilter, ('created_at', DateFieldListFilter),
+                   SchoolFilter)
+    show_facets = admin.ShowFacets.NEVER
     search_fields = ('iin', 'full_name')
     ordering = ('full_name',)
 
@@ -410,13 +318,19 @@ class CustomUserAdmin(UserAdmin):
     actions = ['activate_selected_users', 'deactivate_selected_users']
 
     def activate_selected_users(self, request, queryset):
+        user_ids = list(queryset.values_list('id', flat=True))
         updated = queryset.update(is_active=True, created_at=timezone.now())
+        invalidate_facets(CustomUser, TestResult)
+        token_cache.invalidate_users(user_ids)
         self.message_user(request, f"Активировано {updated} пользователь(ей).", level=messages.SUCCESS)
 
     activate_selected_users.short_description = "Активировать выбранных пользователей"
 
     def deactivate_selected_users(self, request, queryset):
+        user_ids = list(queryset.values_list('id', flat=True))
         updated = queryset.update(is_active=False)
+        invalidate_facets(CustomUser, TestResult)
+        token_cache.invalidate_users(user_ids)
         self.message_user(request, f"Деактивировано {updated} пользователь(ей).", level=messages.SUCCESS)
 
     deactivate_selected_users.short_description = "Деактивировать выбранных пользователей"
@@ -439,6 +353,17 @@ class CustomUserAdmin(UserAdmin):
         ]
         return custom_urls + urls
 
+    # Вместе с учениками удаляются их результаты: сводки по этим дням пересчитываются
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            forget_results(TestResult.objects.filter(user=obj))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            forget_results(TestResult.objects.filter(user__in=queryset))
+            super().delete_queryset(request, queryset)
+
     def activate_users(self, request):
         return self.process_users(request, action='activate')
 
@@ -450,25 +375,29 @@ class CustomUserAdmin(UserAdmin):
 
     def process_users(self, request, action='activate'):
         if request.method == "POST":
-            iin_list = request.POST.get('iin_list')
-            if iin_list:
-                iins = [iin.strip() for iin in iin_list.splitlines() if iin.strip()]
-                users = CustomUser.objects.filter(iin__in=iins).exclude(is_staff=True).exclude(is_superuser=True)
-                if users.exists():
-                    if action == 'activate':
-                        users.update(is_active=True, created_at=timezone.now())
-                        messages.success(request, "Пользователи с указанными ИИН были Активированы.")
-                    elif action == 'deactivate':
-                        users.update(is_active=False)
-                        messages.success(request, "Пользователи с указанными ИИН были Деактивированы.")
-                    elif action == 'delete':
-                        count = users.count()
-                        users.delete()
-                        messages.success(request, f"Удалено {count} пользователей.")
-                else:
-                    messages.warning(request, "Ни один из указанных ИИН не найден.")
-            else:
+            iins = parse_iins(request.POST.get('iin_list', ''))
+            if not iins:
                 messages.error(request, "Введите хотя бы один ИИН.")
+                return redirect("..")
+
+            if len(iins) > settings.USER_LIFECYCLE_SYNC_LIMIT:
+                # Большой список обрабатывает воркер run_user_lifecycle_jobs
+                job = UserLifecycleJob.objects.create(action=action, iins='\n'.join(iins), created_by=request.user)
+                messages.info(request, format_html(
+                    'Список из {} ИИН поставлен в очередь: <a href="{}">задание {}</a>.',
+                    len(iins), reverse('admin:tests_userlifecyclejob_change', args=[job.id]), job.id
+                ))
+                return redirect("..")
+
+            report = apply_user_action(action, iins)
+            if not report.affected:
+                messages.warning(request, "Ни один из указанных ИИН не найден.")
+            elif action == 'activate':
+                messages.success(request, "Пользователи с указанными ИИН были Активированы.")
+            elif action == 'deactivate':
+                messages.success(request, "Пользователи с указанными ИИН были Деактивированы.")
+            elif action == 'delete':
+                messages.success(request, f"Удалено {report.affected} пользователей.")
             return redirect("..")
 
         action_name = {
@@ -492,15 +421,270 @@ class CustomUserAdmin(UserAdmin):
             '<div style="margin-bottom: 10px;">'
             '<a class="button" style="margin-right: 10px;" href="{}">{}</a>'
             '<a class="button" style="margin-right: 10px;" href="{}">{}</a>'
+            '<a class="button" style="margin-right: 10px;" href="{}">{}</a>'
             '<a class="button" href="{}">{}</a>'
             '</div>',
             reverse('admin:activate_users'), _('Активировать пользователей'),
             reverse('admin:deactivate_users'), _('Деактивировать пользователей'),
-            reverse('admin:delete_users'), _('Удалить пользователей')
+            reverse('admin:delete_users'), _('Удалить пользователей'),
+            reverse('admin:tests_userimport_add'), _('Загрузить учеников из файла')
         )
         return super().changelist_view(request, extra_context=extra_context)
 
 
+class ExportJobFileInline(admin.TabularInline):
+    model = ExportJobFile
+    extra = 0
+    can_delete = False
+    fields = ['school', 'rows', 'download_link']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def download_link(self, obj):
+        if not obj.file:
+            return "Нет данных"
+        url = reverse('admin:export_job_file', args=[obj.id])
+        return format_html('<a href="{}">{}</a>', url, _('Скачать'))
+
+    download_link.short_description = 'Файл'
+
+
+class ExportJobForm(forms.ModelForm):
+    class Meta:
+        model = ExportJob
+        fields = ['schools', 'date_from', 'date_to']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError("Дата начала позже даты окончания!")
+        return cleaned_data
+
+
+class ExportJobAdmin(admin.ModelAdmin):
+    form = ExportJobForm
+    list_display = ['id', 'date_from', 'date_to', 'status', 'progress', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status']
+    list_select_related = ['created_by']
+    filter_horizontal = ['schools']
+    inlines = [ExportJobFileInline]
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return ['schools', 'date_from', 'date_to']
+        return ['date_from', 'date_to', 'status', 'progress', 'created_by', 'created_at', 'finished_at', 'error']
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return []
+        return self.get_fields(request, obj)
+
+    def progress(self, obj):
+        return f'{obj.completed}/{obj.total}' if obj.total else '—'
+
+    progress.short_description = 'Прогресс'
+
+    def save_model(self, request, obj, form, change):
+        # Книги строит воркер run_export_jobs, запрос только ставит задание в очередь
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path("file/<int:file_id>/", self.admin_site.admin_view(self.download_file), name="export_job_file"),
+        ]
+        return custom_urls + urls
+
+    def download_file(self, request, file_id):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        job_file = get_object_or_404(ExportJobFile, id=file_id)
+        if not job_file.file:
+            raise Http404
+        return FileResponse(
+            job_file.file.open('rb'),
+            as_attachment=True,
+            filename=os.path.basename(job_file.file.name),
+            content_type=XLSX_CONTENT_TYPE,
+        )
+
+
+class UserImportForm(forms.ModelForm):
+    class Meta:
+        model = UserImport
+        fields = ['file']
+        help_texts = {
+            'file': 'XLSX или CSV. Первая строка — заголовки: ИИН, ФИО, Школа, Тип использования. '
+                    'Пароль новых учеников — их ИИН.',
+        }
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.xlsx', '.csv')):
+            raise forms.ValidationError("Поддерживаются только файлы XLSX и CSV!")
+        return file
+
+
+class UserImportAdmin(admin.ModelAdmin):
+    form = UserImportForm
+    list_display = ['id', 'file', 'status', 'created', 'updated', 'error_count', 'created_by', 'created_at',
+                    'finished_at']
+    list_filter = ['status']
+    list_select_related = ['created_by']
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return ['file']
+        return ['file', 'status', 'created', 'updated', 'created_by', 'created_at', 'finished_at', 'error',
+                'error_report']
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return []
+        return self.get_fields(request, obj)
+
+    def error_count(self, obj):
+        return len(obj.row_errors)
+
+    error_count.short_description = 'Ошибок'
+
+    def error_report(self, obj):
+        if not obj.row_errors:
+            return '—'
+        return format_html(
+            '<table><tr><th>Строка</th><th>ИИН</th><th>Ошибка</th></tr>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+                             ((e['row'], e['iin'], e['error']) for e in obj.row_errors))
+        )
+
+    error_report.short_description = 'Ошибки по строкам'
+
+    def save_model(self, request, obj, form, change):
+        # Файл обрабатывает воркер run_user_imports, запрос только ставит загрузку в очередь
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+class UserLifecycleJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'action', 'status', 'progress', 'affected', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'action']
+    list_select_related = ['created_by']
+    fields = ['action', 'status', 'progress', 'affected', 'created_by', 'created_at', 'finished_at', 'error']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress(self, obj):
+        return f'{obj.processed}/{obj.total}' if obj.total else '—'
+
+    progress.short_description = 'Прогресс'
+
+
+class ExamSessionForm(forms.ModelForm):
+    selected_subjects = forms.MultipleChoiceField(
+        label="Доп. предметы", required=False, widget=forms.CheckboxSelectMultiple,
+        choices=[(code, label) for code, label in Subject.SUBJECT_CHOICES if code not in DEFAULT_SUBJECTS],
+    )
+
+    class Meta:
+        model = ExamSession
+        fields = ['school', 'starts_at', 'ends_at', 'selected_subjects']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        starts_at, ends_at = cleaned_data.get('starts_at'), cleaned_data.get('ends_at')
+        if starts_at and ends_at and starts_at >= ends_at:
+            raise forms.ValidationError("Начало позже окончания!")
+        return cleaned_data
+
+
+class ExamSessionAdmin(admin.ModelAdmin):
+    form = ExamSessionForm
+    list_display = ['id', 'school', 'starts_at', 'ends_at', 'status', 'progress', 'prepared_at']
+    list_filter = ['status']
+    list_select_related = ['school']
+    readonly_fields = ['status', 'progress', 'created_by', 'created_at', 'prepared_at', 'error']
+    actions = ['download_access_codes']
+
+    def progress(self, obj):
+        return f'{obj.prepared}/{obj.total}' if obj.total else '—'
+
+    progress.short_description = 'Прогресс'
+
+    def save_model(self, request, obj, form, change):
+        # Варианты и токены выдаёт воркер prepare_exam_sessions. Заново экзамен готовится только
+        # после смены школы или предметов (и после ошибки); правка времени не снимает готовый экзамен
+        if not change:
+            obj.created_by = request.user
+        elif {'school', 'selected_subjects'} & set(form.changed_data) or \
+                (form.changed_data and obj.status == ExamSession.FAILED):
+            obj.status = ExamSession.PENDING
+        super().save_model(request, obj, form, change)
+
+    def download_access_codes(self, request, queryset):
+        return FileResponse(
+            build_access_codes_file(access_code_rows(queryset.filter(status=ExamSession.READY))),
+            as_attachment=True,
+            filename="exam_access_codes.xlsx",
+            content_type=XLSX_CONTENT_TYPE,
+        )
+
+    download_access_codes.short_description = "Скачать коды доступа"
+
+
+class RollupAdmin(admin.ModelAdmin):
+    list_filter = [('day', DateFieldListFilter), 'school']
+    list_select_related = ['school']
+    date_hierarchy = 'day'
+    ordering = ['-day', 'school__name']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def mean_score(self, obj):
+        return round(obj.mean, 2) if obj.count else '—'
+
+    mean_score.short_description = 'Средний балл'
+
+    def stddev_score(self, obj):
+        return round(obj.stddev, 2) if obj.count else '—'
+
+    stddev_score.short_description = 'Ст. отклонение'
+
+
+class SchoolDailyRollupAdmin(RollupAdmin):
+    list_display = ['school', 'day', 'subject_pair', 'count', 'mean_score', 'stddev_score', 'score_min', 'score_max']
+
+
+class SchoolDailySubjectRollupAdmin(RollupAdmin):
+    list_display = ['school', 'day', 'subject', 'count', 'mean_score', 'stddev_score', 'score_min', 'score_max']
+    list_filter = RollupAdmin.list_filter + ['subject']
+
+
+class SubmissionTicketAdmin(admin.ModelAdmin):
+    list_display = ['ticket', 'user', 'status', 'attempts', 'created_at', 'processed_at']
+    list_filter = ['status']
+    list_select_related = ['user']
+    readonly_fields = ['ticket', 'user', 'answers', 'status', 'created_at', 'claimed_at', 'processed_at',
+                       'attempts', 'test_result', 'correct_answers', 'error']
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(Subject, SubjectAdmin)
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Answer)
@@ -508,3 +692,10 @@ admin.site.register(MatchingPair, MatchingPairAdmin)
 admin.site.register(TestResult, TestResultAdmin)
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(School)
+admin.site.register(SubmissionTicket, SubmissionTicketAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
+admin.site.register(SchoolDailyRollup, SchoolDailyRollupAdmin)
+admin.site.register(SchoolDailySubjectRollup, SchoolDailySubjectRollupAdmin)
+admin.site.register(UserImport, UserImportAdmin)
+admin.site.register(UserLifecycleJob, UserLifecycleJobAdmin)
+admin.site.register(ExamSession, ExamSessionAdmin)
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.contrib import admin
+from django.db.models import Count
+
+from .caching import model_cache
+from .models import CustomUser, School
+
+
+def invalidate_facets(*models):
+    for model in models:
+        model_cache(model, 'facets').invalidate()
+
+
+def facet_counts(model, field_path):
+    """{значение поля: число строк модели} по всей таблице, из кэша."""
+    def count():
+        rows = model.objects.order_by().values(field_path).annotate(n=Count('pk')).values_list(field_path, 'n')
+        return dict(rows)
+
+    return model_cache(model, 'facets').get_or_set(field_path, count, settings.ADMIN_FACET_CACHE_TIMEOUT)
+
+
+class UserFieldFilterMixin:
+    """
+    Фильтр по полю пользователя. В админке результатов путь к полю
+    начинается с user__ (атрибут user_field_prefix у ModelAdmin).
+    """
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.field_path = getattr(model_admin, 'user_field_prefix', '') + self.field_name
+        super().__init__(request, params, model, model_admin)
+
+
+class InputFilter(UserFieldFilterMixin, admin.SimpleListFilter):
+    """
+    Поле ввода вместо списка значений: боковая панель не выбирает
+    из базы все ИИН и ФИО, а запрос идёт по индексу.
+    """
+    template = 'admin/input_filter.html'
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        # Одна пустая "опция", иначе фильтр не выводится
+        return ((),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        # Остальные фильтры передаются скрытыми полями формы
+        all_choice['query_parts'] = [
+            (key, value)
+            for key, values in changelist.get_filters_params().items()
+            if key != self.parameter_name
+            for value in values
+        ]
+        all_choice['placeholder'] = self.placeholder
+        yield all_choice
+
+    def value(self):
+        value = super().value()
+        return value.strip() if value else None
+
+
+class IinFilter(InputFilter):
+    title = 'ИИН'
+    parameter_name = 'iin'
+    field_name = 'iin'
+    placeholder = '12 цифр'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+
+class FullNameFilter(InputFilter):
+    title = 'ФИО'
+    parameter_name = 'full_name'
+    field_name = 'full_name'
+    placeholder = 'Начало ФИО'
+
+    def queryset(self, request, queryset):
+        # startswith (LIKE 'x%') использует индекс по full_name, icontains — нет
+        if self.value():
+            return queryset.filter(**{f'{self.field_path}__startswith': self.value()})
+        return queryset
+
+
+class CachedCountFilter(UserFieldFilterMixin, admin.SimpleListFilter):
+    """
+    Фильтр с небольшим числом значений и количеством строк у каждого.
+    Количества считаются по всей таблице и берутся из кэша (facet_counts).
+    """
+
+    def choice_values(self):
+        """[(значение, подпись), ...]"""
+        raise NotImplementedError
+
+    def lookups(self, request, model_admin):
+        counts = facet_counts(model_admin.model, self.field_path)
+        return [(str(value), f'{label} ({counts.get(value, 0)})') for value, label in self.choice_values()]
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+
+class SchoolFilter(CachedCountFilter):
+    title = 'Школа'
+    parameter_name = 'school'
+    field_name = 'school'
+
+    def choice_values(self):
+        return School.objects.order_by('name').values_list('id', 'name')
+
+
+class UsageTypeFilter(CachedCountFilter):
+    title = 'Тип использования'
+    parameter_name = 'usage_type'
+    field_name = 'usage_type'
+
+    def choice_values(self):
+        return CustomUser.USAGE_TYPE_CHOICES
+
+
+class ActiveFilter(CachedCountFilter):
+    title = 'Активен'
+    parameter_name = 'is_active'
+    field_name = 'is_active'
+
+    def choice_values(self):
+        return [(True, 'Да'), (False, 'Нет')]
@@ -0,0 +1,65 @@
+from datetime import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+KEYSET_PARAM = 'after'
+
+
+def estimated_row_count(model, using='default'):
+    """Оценка числа строк из статистики PostgreSQL; для других баз None."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц.
+
+    Пока таблица меньше ADMIN_APPROXIMATE_COUNT_THRESHOLD, считает точно.
+    Дальше без фильтров берёт оценку из статистики базы, а с фильтрами
+    считает не дальше порога, чтобы COUNT(*) не проходил всю таблицу.
+    """
+
+    @cached_property
+    def count(self):
+        threshold = settings.ADMIN_APPROXIMATE_COUNT_THRESHOLD
+        queryset = self.object_list
+        estimate = estimated_row_count(queryset.model, queryset.db)
+        if estimate is None or estimate < threshold:
+            return super().count
+        if not queryset.query.has_filters():
+            return estimate
+        return queryset.order_by().values('pk')[:threshold].count()
+
+
+def parse_keyset_cursor(value):
+    """Курсор вида "<date_taken ISO>_<pk>" -> (datetime, pk) или None."""
+    try:
+        date_part, pk_part = value.rsplit('_', 1)
+        return datetime.fromisoformat(date_part), int(pk_part)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_filter(cursor, date_field='date_taken'):
+    """Строки строго после курсора при сортировке (-date_field, -id)."""
+    date_value, pk = cursor
+    return Q(**{f'{date_field}__lt': date_value}) | Q(**{date_field: date_value, 'id__lt': pk})
+
+
+def keyset_next_url(params, last_obj, date_field='date_taken'):
+    """Ссылка на следующую страницу: текущие фильтры плюс курсор после last_obj."""
+    params = params.copy()
+    params.pop('p', None)
+    params[KEYSET_PARAM] = f'{getattr(last_obj, date_field).isoformat()}_{last_obj.pk}'
+    return '?' + urlencode(sorted(params.items()))
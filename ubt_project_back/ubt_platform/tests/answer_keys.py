@@ -0,0 +1,166 @@
+from . import content_versions
+from .models import Subject, Question, Answer, MatchingPair
+
+# Баллы за правильный ответ по типу вопроса
+POINTS = {
+    Question.SINGLE_CHOICE: 1,
+    Question.MULTIPLE_CHOICE: 2,
+    Question.MATCHING: 2,
+}
+
+
+class AnswerKey:
+    """Ключ ответа на один вопрос."""
+    __slots__ = ('question_type', 'correct_ids', 'matching')
+
+    def __init__(self, question_type, correct_ids=(), matching=None):
+        self.question_type = question_type
+        # id правильных ответов (для SC и MC) в порядке возрастания
+        self.correct_ids = tuple(correct_ids)
+        # (correct_for_left_1, correct_for_left_2) первой пары для MT
+        self.matching = matching
+
+    def correct_answers(self):
+        """Правильные ответы в формате ответа API."""
+        if self.question_type == Question.SINGLE_CHOICE:
+            return list(self.correct_ids[:1])
+        if self.question_type == Question.MULTIPLE_CHOICE:
+            return list(set(self.correct_ids))
+        if self.question_type == Question.MATCHING and self.matching:
+            return {
+                'left_side_1': self.matching[0],
+                'left_side_2': self.matching[1],
+            }
+        return []
+
+    def score(self, user_answers):
+        if self.question_type == Question.SINGLE_CHOICE:
+            if not user_answers:
+                return 0
+            try:
+                user_answer_id = int(user_answers[0])
+            except (ValueError, IndexError):
+                return 0
+            if self.correct_ids and self.correct_ids[0] == user_answer_id:
+                return POINTS[Question.SINGLE_CHOICE]
+            return 0
+
+        if self.question_type == Question.MULTIPLE_CHOICE:
+            if not user_answers:
+                return 0
+            try:
+                user_answer_ids = set(map(int, user_answers))
+            except ValueError:
+                return 0
+            if user_answer_ids == set(self.correct_ids):
+                return POINTS[Question.MULTIPLE_CHOICE]
+            return 0
+
+        if self.question_type == Question.MATCHING:
+            left_side_1_value = user_answers.get('left_side_1')
+            left_side_2_value = user_answers.get('left_side_2')
+            if not left_side_1_value or not left_side_2_value:
+                return 0
+            try:
+                user_matching = (int(left_side_1_value), int(left_side_2_value))
+            except ValueError:
+                return 0
+            if self.matching and self.matching == user_matching:
+                return POINTS[Question.MATCHING]
+            return 0
+
+        return 0
+
+
+def _compile_keys(question_rows):
+    """
+    Собирает ключи по строкам (question_id, subject_id, question_type)
+    за два дополнительных запроса независимо от количества вопросов.
+    Возвращает { question_id: (subject_id, AnswerKey) }.
+    """
+    question_rows = list(question_rows)
+    if not question_rows:
+        return {}
+    question_ids = [question_id for question_id, _, _ in question_rows]
+
+    correct_ids = {}
+    for question_id, answer_id in (
+        Answer.objects.filter(question_id__in=question_ids, is_correct=True)
+        .order_by('id')
+        .values_list('question_id', 'id')
+    ):
+        correct_ids.setdefault(question_id, []).append(answer_id)
+
+    # Как и раньше, учитывается только первая пара вопроса
+    matchings = {}
+    for question_id, left_1, left_2 in (
+        MatchingPair.objects.filter(question_id__in=question_ids)
+        .order_by('id')
+        .values_list('question_id', 'correct_for_left_1', 'correct_for_left_2')
+    ):
+        matchings.setdefault(question_id, (left_1, left_2))
+
+    return {
+        question_id: (
+            subject_id,
+            AnswerKey(question_type, correct_ids.get(question_id, ()), matchings.get(question_id)),
+        )
+        for question_id, subject_id, question_type in question_rows
+    }
+
+
+def load_answer_keys(question_ids):
+    """
+    Загружает ключи ответов для набора вопросов за три запроса
+    независимо от их количества. Несуществующие вопросы пропускаются.
+    """
+    question_ids = set(question_ids)
+    if not question_ids:
+        return {}
+    compiled = _compile_keys(
+        Question.objects.filter(id__in=question_ids).values_list('id', 'subject_id', 'question_type')
+    )
+    return {question_id: answer_key for question_id, (_, answer_key) in compiled.items()}
+
+
+class VariantAnswerKeys:
+    __slots__ = ('subject_id', 'name', 'version', 'keys')
+
+    def __init__(self, subject_id, name, version, keys):
+        self.subject_id = subject_id
+        # Код предмета (Subject.name)
+        self.name = name
+        self.version = version
+        # { question_id: AnswerKey }
+        self.keys = keys
+
+
+class AnswerKeyIndex(content_versions.VersionedSubjectCache):
+    """
+    Скомпилированные ключи ответов по вариантам в памяти процесса.
+
+    Загружаются лениво (или через warm()) и пересобираются,
+    когда сигналы меняют версию варианта.
+    """
+
+    def _build(self, subject_ids, versions):
+        existing = Subject.objects.filter(id__in=subject_ids).values_list('id', 'name')
+        built = {
+            subject_id: VariantAnswerKeys(subject_id, name, versions[subject_id], {})
+            for subject_id, name in existing
+        }
+        compiled = _compile_keys(
+            Question.objects.filter(subject_id__in=list(built)).values_list('id', 'subject_id', 'question_type')
+        )
+        for question_id, (subject_id, answer_key) in compiled.items():
+            built[subject_id].keys[question_id] = answer_key
+        return built
+
+    def warm(self, subject_ids=None):
+        """Заранее загружает ключи (по умолчанию всех активных вариантов)."""
+        if subject_ids is None:
+            subject_ids = Subject.objects.filter(is_active=True).values_list('id', flat=True)
+        return self.get_many(subject_ids)
+
+
+answer_key_index = AnswerKeyIndex()
@@ -0,0 +1,130 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.http import JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import Throttled
+
+from .authentication import aauthenticate_token
+from .idempotency import idempotency_key, afind_submission
+from .results import submission_payload
+from .throttles import SubmitAnswersThrottle, GenerateTestThrottle, LoginThrottle, LoginIpThrottle
+from .views import BAD_BODY, read_selected_subjects, issue_test, read_answers, accept_answers
+
+
+def _check_throttles(throttles, request, view):
+    """Все лимиты одним синхронным вызовом: (разрешён ли запрос, Retry-After)."""
+    for throttle in throttles:
+        try:
+            if not throttle.allow_request(request, view):
+                return False, throttle.wait()
+        except Throttled as e:
+            return False, e.wait
+    return True, None
+
+
+class AsyncAPIView(View):
+    """
+    Асинхронный аналог APIView для запуска под ASGI.
+
+    Проверяет токен и троттлинг, разбирает JSON в request.data
+    и не держит поток на время ожидания базы.
+    """
+    authentication_required = True
+    throttle_classes = []
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Как и APIView: авторизация по токену, CSRF не нужен
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.authentication_required:
+            user = await aauthenticate_token(request)
+            if user is None:
+                response = JsonResponse(
+                    {'detail': 'Authentication credentials were not provided.'},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+                response['WWW-Authenticate'] = 'Token'
+                return response
+            request.user = user
+
+        # Тело нужно раньше троттлинга: лимит входа считается по ИИН
+        try:
+            request.data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'detail': 'JSON parse error.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, dict):
+            return JsonResponse({'error': BAD_BODY}, status=status.HTTP_400_BAD_REQUEST)
+
+        throttles = [throttle_class() for throttle_class in self.throttle_classes]
+        allowed, wait_time = await sync_to_async(_check_throttles)(throttles, request, self)
+        if not allowed:
+            response = JsonResponse(
+                {"error": "Rate limit exceeded. Please try again later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+            if wait_time is not None:
+                response.headers['Retry-After'] = str(int(wait_time))
+            return response
+
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncGenerateTestView(AsyncAPIView):
+    throttle_classes = [GenerateTestThrottle]
+
+    async def post(self, request):
+        selected_subjects, error = read_selected_subjects(request.data)
+        if error is None:
+            # Реестр и кэш вариантов синхронные: весь выпуск теста — один вызов в потоке
+            response, error = await sync_to_async(issue_test)(request, selected_subjects)
+        if error is not None:
+            return JsonResponse({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        return response
+
+
+class AsyncSubmitAnswersView(AsyncAPIView):
+    throttle_classes = [SubmitAnswersThrottle]
+
+    async def post(self, request):
+        answers, error = read_answers(request.data)
+        if error is not None:
+            return JsonResponse({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        compact = request.GET.get('mode') == 'compact'
+
+        key = idempotency_key(request)
+        submission = await afind_submission(request.user, key)
+        if submission is not None:
+            response_data, status_code = await sync_to_async(submission_payload)(submission, compact=compact)
+            return JsonResponse(response_data, status=status_code)
+
+        # Проверка и запись идут в синхронном коде (транзакция) — одним вызовом в потоке
+        response_data, status_code = await sync_to_async(accept_answers)(request, answers, key, compact)
+        return JsonResponse(response_data, status=status_code)
+
+
+class AsyncCustomAuthToken(AsyncAPIView):
+    authentication_required = False
+    throttle_classes = [LoginIpThrottle, LoginThrottle]
+
+    async def post(self, request):
+        iin = request.data.get('iin')
+        password = request.data.get('password')
+        user = await aauthenticate(request, iin=iin, password=password)
+        if user is not None:
+            token, created = await Token.objects.aget_or_create(user=user)
+            return JsonResponse({
+                'token': token.key,
+                'user_id': user.pk,
+                'iin': user.iin,
+                'full_name': user.full_name
+            }, status=status.HTTP_200_OK)
+
+        return JsonResponse({"error": "Неверный ИИН"}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,219 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import CustomUser
+
+SHARED_KEY_PREFIX = 'auth_token:'
+# Метка сброса в общем кэше вместо снимка
+INVALIDATED = 'invalidated'
+# Счётчик сбросов в общем кэше: локальная копия верна, пока он не изменился
+GENERATION_KEY = SHARED_KEY_PREFIX + 'generation'
+
+# Поля пользователя в снимке. Пароль не храним: при обращении он догрузится из базы.
+USER_FIELDS = [field.attname for field in CustomUser._meta.concrete_fields if field.attname != 'password']
+
+
+def get_token_key(request):
+    """Ключ из заголовка `Authorization: Token <key>` или None."""
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    return auth[1]
+
+
+class TokenCache:
+    """
+    Ключ токена -> снимок пользователя.
+
+    Локально — LRU на TOKEN_CACHE_SIZE записей со сроком TOKEN_CACHE_TTL секунд.
+    Если задан TOKEN_CACHE_ALIAS, промахи сначала ищутся в этом общем кэше
+    (срок TOKEN_CACHE_SHARED_TTL), и процессы не ходят в базу за одним и тем же токеном.
+    Сброс удаляет запись локально, оставляет в общем кэше метку на TOKEN_CACHE_TTL
+    (запрос, прочитавший пользователя до сброса, не запишет устаревший снимок обратно)
+    и увеличивает общий счётчик сбросов. Локальное попадание сверяет счётчик одним GET
+    общего кэша, поэтому отзыв доходит до всех процессов сразу.
+    Без общего кэша копии в других процессах живут до TOKEN_CACHE_TTL секунд после отзыва.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Растёт при каждом сбросе: снимок, прочитанный до сброса, локально не сохраняется
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _shared(self):
+        alias = settings.TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def stamp(self):
+        """Поколения (локальное, общее) — берутся до чтения снимка из базы и передаются в set()."""
+        shared = self._shared()
+        return self.generation, shared.get(GENERATION_KEY, 0) if shared else None
+
+    def _local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, snapshot, shared_generation = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return snapshot, shared_generation
+            del self._entries[key]
+        return None
+
+    def _hit(self, key, snapshot, fresh):
+        if fresh:
+            self.hits += 1
+            return snapshot
+        with self._lock:
+            self._entries.pop(key, None)
+        return None
+
+    def get(self, key):
+        shared = self._shared()
+        entry = self._local(key)
+        if entry is not None:
+            snapshot, shared_generation = entry
+            fresh = shared is None or shared.get(GENERATION_KEY, 0) == shared_generation
+            if self._hit(key, snapshot, fresh):
+                return snapshot
+
+        if shared:
+            found = shared.get_many([GENERATION_KEY, SHARED_KEY_PREFIX + key])
+            snapshot = found.get(SHARED_KEY_PREFIX + key)
+            if snapshot is not None and snapshot != INVALIDATED:
+                self._store(key, snapshot, (self.generation, found.get(GENERATION_KEY, 0)))
+                self.hits += 1
+                return snapshot
+        self.misses += 1
+        return None
+
+    async def aget_local(self, key):
+        """Локальная копия без перехода в поток; при общем кэше счётчик сбросов сверяется через aget()."""
+        entry = self._local(key)
+        if entry is None:
+            return None
+        snapshot, shared_generation = entry
+        shared = self._shared()
+        fresh = shared is None or await shared.aget(GENERATION_KEY, 0) == shared_generation
+        return self._hit(key, snapshot, fresh)
+
+    def set(self, key, snapshot, stamp):
+        """
+        Сохраняет снимок, прочитанный из базы. stamp — значение self.stamp() до чтения:
+        если с тех пор был сброс, снимок мог устареть и не сохраняется.
+        """
+        if not self._store(key, snapshot, stamp):
+            return
+        shared = self._shared()
+        if shared:
+            # add() не перезаписывает метку сброса из другого процесса
+            shared.add(SHARED_KEY_PREFIX + key, snapshot, settings.TOKEN_CACHE_SHARED_TTL)
+
+    def _store(self, key, snapshot, stamp):
+        generation, shared_generation = stamp
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._entries[key] = (time.monotonic() + settings.TOKEN_CACHE_TTL, snapshot, shared_generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, keys):
+        keys = list(keys)
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self._shared()
+        if shared and keys:
+            shared.set_many({SHARED_KEY_PREFIX + key: INVALIDATED for key in keys}, settings.TOKEN_CACHE_TTL)
+            try:
+                shared.incr(GENERATION_KEY)
+            except ValueError:
+                # Счётчика ещё нет (или он вытеснен): создаём, а если опередили — увеличиваем чужой
+                if not shared.add(GENERATION_KEY, 1, None):
+                    shared.incr(GENERATION_KEY)
+
+    def invalidate_users(self, user_ids):
+        self.invalidate(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+token_cache = TokenCache()
+
+
+def _snapshot(token):
+    return token.created, [getattr(token.user, name) for name in USER_FIELDS]
+
+
+def _from_snapshot(key, snapshot):
+    created, values = snapshot
+    user = CustomUser.from_db('default', USER_FIELDS, values)
+    token = Token.from_db('default', ['key', 'user_id', 'created'], [key, user.pk, created])
+    token.user = user
+    return user, token
+
+
+def cached_token_user(key):
+    """(user, token) по ключу токена или None. При попадании в кэш запросов к базе нет."""
+    snapshot = token_cache.get(key)
+    if snapshot is None:
+        stamp = token_cache.stamp()
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token is None:
+            return None
+        snapshot = _snapshot(token)
+        token_cache.set(key, snapshot, stamp)
+    return _from_snapshot(key, snapshot)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которая берёт токен и пользователя из token_cache."""
+
+    def authenticate_credentials(self, key):
+        found = cached_token_user(key)
+        if found is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user, token = found
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, token
+
+
+async def aauthenticate_token(request):
+    """Асинхронная проверка токена для ASGI-представлений. Возвращает пользователя или None."""
+    key = get_token_key(request)
+    if key is None:
+        return None
+    snapshot = await token_cache.aget_local(key)
+    if snapshot is not None:
+        user, token = _from_snapshot(key, snapshot)
+    else:
+        found = await sync_to_async(cached_token_user)(key)
+        if found is None:
+            return None
+        user, token = found
+    return user if user.is_active else None
@@ -0,0 +1,171 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+# Сколько ждать, пока другой процесс досчитает значение, и сколько живёт его блокировка
+LOCK_WAIT = 5
+LOCK_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+
+_registry = {}
+
+
+class TwoTierCache:
+    """
+    Кэш пространства имён namespace: LRU в памяти процесса перед общим кэшем Django.
+
+    Ключи в общем кэше содержат версию пространства имён; invalidate() меняет версию,
+    и все процессы видят новые значения не позже чем через CACHE_LOCAL_TTL секунд.
+    get_or_set() считает значение один раз на ключ, даже если его одновременно
+    запросили многие потоки и процессы. Между процессами это держится на атомарном
+    add() общего кэша (Redis); без Redis кэш свой у каждого процесса,
+    и значение считается один раз на процесс.
+    """
+
+    def __init__(self, namespace, timeout=None):
+        self.namespace = namespace
+        self.timeout = timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.waits = 0
+        _registry[namespace] = self
+
+    def _version_key(self):
+        return f'cache_version:{self.namespace}'
+
+    def _version(self):
+        version = cache.get(self._version_key())
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(self._version_key(), version, None):
+                version = cache.get(self._version_key(), version)
+        return version
+
+    def _shared_key(self, key):
+        return f'{self.namespace}:{self._version()}:{key}'
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + settings.CACHE_LOCAL_TTL, value)
+            self._local.move_to_end(key)
+            while len(self._local) > settings.CACHE_LOCAL_SIZE:
+                self._local.popitem(last=False)
+
+    def get_or_set(self, key, compute, timeout=None):
+        """Значение по ключу; при промахе compute() вызывается один раз на все процессы."""
+        key = str(key)
+        entry = self._get_local(key)
+        if entry is not None:
+            self.local_hits += 1
+            return entry[1]
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Пока ждали, значение мог положить соседний поток
+            entry = self._get_local(key)
+            if entry is not None:
+                self.local_hits += 1
+                return entry[1]
+            try:
+                value = self._get_shared_or_compute(key, compute, timeout)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        self._set_local(key, value)
+        return value
+
+    def _get_shared_or_compute(self, key, compute, timeout):
+        shared_key = self._shared_key(key)
+        found = cache.get(shared_key)
+        if found is not None:
+            self.shared_hits += 1
+            return found[0]
+
+        self.misses += 1
+        lock_key = f'{shared_key}:lock'
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            # Значение уже считает другой процесс — ждём его результата
+            self.waits += 1
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                found = cache.get(shared_key)
+                if found is not None:
+                    return found[0]
+            lock_key = None
+        try:
+            value = compute()
+            # Значение в кортеже, чтобы отличать закэшированный None от промаха
+            cache.set(shared_key, (value,), self.timeout if timeout is None else timeout)
+        finally:
+            if lock_key:
+                cache.delete(lock_key)
+        return value
+
+    def invalidate(self):
+        cache.set(self._version_key(), uuid.uuid4().hex, None)
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        hits = self.local_hits + self.shared_hits
+        total = hits + self.misses
+        return {
+            'entries': len(self._local),
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'hit_ratio': hits / total if total else None,
+        }
+
+
+def namespace_cache(namespace, timeout=None):
+    """Кэш пространства имён; один экземпляр на процесс."""
+    if namespace not in _registry:
+        TwoTierCache(namespace, timeout)
+    return _registry[namespace]
+
+
+def model_cache(model, suffix='', timeout=None):
+    """Кэш с пространством имён модели, например tests.customuser:facets."""
+    namespace = model._meta.label_lower + (f':{suffix}' if suffix else '')
+    return namespace_cache(namespace, timeout)
+
+
+def invalidate_on_change(two_tier_cache, *models):
+    """Сбрасывает кэш при сохранении и удалении любой из моделей."""
+    def receiver(sender, **kwargs):
+        two_tier_cache.invalidate()
+
+    for model in models:
+        uid = f'invalidate:{two_tier_cache.namespace}:{model._meta.label_lower}'
+        post_save.connect(receiver, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=uid)
+
+
+def cache_stats():
+    """Метрики всех кэшей процесса: {namespace: stats}."""
+    return {namespace: entry.stats() for namespace, entry in _registry.items()}
@@ -0,0 +1,60 @@
+import struct
+import zlib
+
+from django.utils.cache import patch_vary_headers
+
+# Заголовок gzip без имени файла и с нулевым временем: одинаковое содержимое — одинаковые байты
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+# Пустой последний блок deflate
+DEFLATE_END = b'\x03\x00'
+
+
+def deflate_segment(data):
+    """
+    Сжатый кусок "сырого" deflate, заканчивающийся на границе байта (Z_FULL_FLUSH).
+    Такие куски можно склеивать в один поток без пересжатия.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+class Segment:
+    """Кусок ответа: исходные байты и их заранее сжатый deflate."""
+    __slots__ = ('raw', 'deflated')
+
+    def __init__(self, raw, deflated=None):
+        self.raw = raw
+        self.deflated = deflate_segment(raw) if deflated is None else deflated
+
+
+def gzip_join(segments):
+    """Склеивает заранее сжатые куски в один gzip; считается только CRC32 исходных байтов."""
+    crc = 0
+    size = 0
+    parts = [GZIP_HEADER]
+    for segment in segments:
+        crc = zlib.crc32(segment.raw, crc)
+        size += len(segment.raw)
+        parts.append(segment.deflated)
+    parts.append(DEFLATE_END)
+    parts.append(struct.pack('<II', crc, size & 0xffffffff))
+    return b''.join(parts)
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)."""
+    encodings = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if name:
+            encodings.add(name.lower())
+    return encodings
+
+
+def set_content_encoding(response, encoding):
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,112 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+
+# Версия контента варианта (Subject вместе с вопросами, ответами и парами).
+# Хранится в общем кэше, чтобы правка в админке одного процесса
+# инвалидировала локальные кэши во всех остальных процессах.
+KEY_PREFIX = 'content_version:subject:'
+
+
+def _key(subject_id):
+    return f'{KEY_PREFIX}{subject_id}'
+
+
+def get_versions(subject_ids):
+    """Возвращает {subject_id: version} за одно обращение к кэшу."""
+    keys = {_key(subject_id): subject_id for subject_id in subject_ids}
+    found = cache.get_many(list(keys))
+
+    versions = {}
+    for key, subject_id in keys.items():
+        version = found.get(key)
+        if version is None:
+            # Версия вытеснена или ещё не создана: выдаём новую,
+            # тогда все локальные копии считаются устаревшими.
+            version = uuid.uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions[subject_id] = version
+    return versions
+
+
+def get_version(subject_id):
+    return get_versions([subject_id])[subject_id]
+
+
+def bump(subject_id):
+    if subject_id is not None:
+        cache.set(_key(subject_id), uuid.uuid4().hex, None)
+
+
+class VersionedSubjectCache:
+    """
+    Кэш данных по вариантам в памяти процесса.
+
+    Актуальность записей проверяется по версиям из общего кэша,
+    которые меняются сигналами при любой правке контента варианта.
+    Наследники реализуют _build(subject_ids, versions) -> {subject_id: entry},
+    у записи должен быть атрибут version.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def get_many(self, subject_ids):
+        """Возвращает {subject_id: entry} для существующих вариантов."""
+        subject_ids = list(dict.fromkeys(subject_ids))
+        if not subject_ids:
+            return {}
+        versions = get_versions(subject_ids)
+
+        result = {}
+        to_build = []
+        with self._lock:
+            for subject_id in subject_ids:
+                entry = self._entries.get(subject_id)
+                if entry is not None and entry.version == versions[subject_id]:
+                    self.hits += 1
+                    result[subject_id] = entry
+                elif entry is None:
+                    self.misses += 1
+                    to_build.append(subject_id)
+                else:
+                    self.rebuilds += 1
+                    to_build.append(subject_id)
+
+        if to_build:
+            built = self._build(to_build, versions)
+            with self._lock:
+                for subject_id in to_build:
+                    entry = built.get(subject_id)
+                    if entry is None:
+                        # Вариант удалён
+                        self._entries.pop(subject_id, None)
+                    else:
+                        self._entries[subject_id] = entry
+                        result[subject_id] = entry
+        return result
+
+    def get(self, subject_id):
+        return self.get_many([subject_id]).get(subject_id)
+
+    def _build(self, subject_ids, versions):
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.rebuilds = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+        }
@@ -0,0 +1,163 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from rest_framework.authtoken.models import Token
+
+from .models import CustomUser, ExamAssignment, ExamSession
+from .variant_registry import DEFAULT_SUBJECTS, active_variants, pick_variants
+
+ACCESS_CODE_DIGITS = 8
+
+
+def access_code(session_id, user_id):
+    """
+    Код доступа ученика к экзамену. Выводится из SECRET_KEY и не хранится:
+    админка выгружает коды для раздачи, вход сверяет HMAC от ИИН и кода.
+    """
+    digest = salted_hmac('exam-access-code', f'{session_id}:{user_id}').hexdigest()
+    return str(int(digest, 16) % 10 ** ACCESS_CODE_DIGITS).zfill(ACCESS_CODE_DIGITS)
+
+
+def login_digest(iin, code):
+    return salted_hmac('exam-login', f'{iin}:{code}').hexdigest()
+
+
+def is_open(session, now=None):
+    """Вход и тест доступны с EXAM_LOGIN_EARLY секунд до начала и до окончания."""
+    now = now or timezone.now()
+    return (
+        session.status == ExamSession.READY
+        and session.starts_at - timedelta(seconds=settings.EXAM_LOGIN_EARLY) <= now <= session.ends_at
+    )
+
+
+def find_login(iin, code):
+    """(ученик, токен, экзамен) по ИИН и коду доступа или None. Один запрос, без хэширования пароля."""
+    if not iin or not code:
+        return None
+    assignment = ExamAssignment.objects.select_related('session', 'user__auth_token').filter(
+        login_digest=login_digest(iin, code)
+    ).first()
+    if assignment is None or not is_open(assignment.session) or not assignment.user.is_active:
+        return None
+    user = assignment.user
+    try:
+        token = user.auth_token
+    except Token.DoesNotExist:
+        # Токен удалён после подготовки
+        token, _ = Token.objects.get_or_create(user=user)
+    return user, token, assignment.session
+
+
+def current_subject_ids(user, now=None):
+    """Варианты открытого сейчас экзамена ученика или None."""
+    now = now or timezone.now()
+    return ExamAssignment.objects.filter(
+        user=user,
+        session__status=ExamSession.READY,
+        session__starts_at__lte=now + timedelta(seconds=settings.EXAM_LOGIN_EARLY),
+        session__ends_at__gte=now,
+    ).order_by('-session__starts_at').values_list('subject_ids', flat=True).first()
+
+
+def _prepare_chunk(session, codes, users):
+    """
+    Варианты, токены и ключи входа для пачки [(id, ИИН), ...] в одной транзакции.
+    Уже выданные варианты остаются, если предметы экзамена те же и варианты активны.
+    """
+    user_ids = [user_id for user_id, _ in users]
+    issued = dict(ExamAssignment.objects.filter(session=session, user_id__in=user_ids).values_list(
+        'user_id', 'subject_ids'
+    ))
+    code_by_id = {subject_id: code for code, ids in active_variants().items() for subject_id in ids}
+
+    assignments = []
+    for user_id, iin in users:
+        subject_ids = issued.get(user_id)
+        if subject_ids is None or [code_by_id.get(subject_id) for subject_id in subject_ids] != codes:
+            subject_ids, missing = pick_variants(codes)
+            if missing is not None:
+                raise ValueError(f'No variants for subject {missing}')
+        assignments.append(ExamAssignment(
+            session=session, user_id=user_id, subject_ids=subject_ids,
+            login_digest=login_digest(iin, access_code(session.id, user_id)),
+        ))
+
+    with transaction.atomic():
+        has_token = set(Token.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        Token.objects.bulk_create(
+            [Token(key=Token.generate_key(), user_id=user_id) for user_id in user_ids if user_id not in has_token],
+            ignore_conflicts=True,
+        )
+        # Повторная подготовка (после смены школы или предметов) обновляет изменившиеся варианты
+        ExamAssignment.objects.bulk_create(
+            assignments, update_conflicts=True, unique_fields=['session', 'user'],
+            update_fields=['subject_ids', 'login_digest'],
+        )
+
+
+def prepare_session(session, chunk_size=None):
+    """
+    Выдаёт варианты всем активным ученикам школы пачками по chunk_size (EXAM_PREPARE_CHUNK_SIZE).
+    Варианты выбираются случайно, как в generate_test. Возвращает число учеников.
+    """
+    chunk_size = chunk_size or settings.EXAM_PREPARE_CHUNK_SIZE
+    codes = DEFAULT_SUBJECTS + list(session.selected_subjects)
+    students = CustomUser.objects.filter(school=session.school_id, is_active=True, is_staff=False)
+
+    # Ученики, ушедшие из школы после прошлой подготовки
+    ExamAssignment.objects.filter(session=session).exclude(user__in=students).delete()
+
+    prepared = 0
+    last_id = 0
+    while True:
+        users = list(students.filter(id__gt=last_id).order_by('id').values_list('id', 'iin')[:chunk_size])
+        if not users:
+            break
+        _prepare_chunk(session, codes, users)
+        last_id = users[-1][0]
+        prepared += len(users)
+        ExamSession.objects.filter(pk=session.pk).update(prepared=F('prepared') + len(users))
+    return prepared
+
+
+def claim_session():
+    """Забирает ближайший экзамен, до начала которого осталось меньше EXAM_PREPARE_AHEAD, или None."""
+    horizon = timezone.now() + timedelta(seconds=settings.EXAM_PREPARE_AHEAD)
+    with transaction.atomic():
+        queryset = ExamSession.objects.filter(status=ExamSession.PENDING, starts_at__lte=horizon).order_by('starts_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        session = queryset.first()
+        if session is None:
+            return None
+        session.status = ExamSession.PREPARING
+        session.total = CustomUser.objects.filter(school=session.school_id, is_active=True, is_staff=False).count()
+        session.prepared = 0
+        session.error = ''
+        session.save(update_fields=['status', 'total', 'prepared', 'error'])
+    return session
+
+
+def run_session(session):
+    try:
+        prepare_session(session)
+    except Exception as e:
+        ExamSession.objects.filter(pk=session.pk).update(status=ExamSession.FAILED, error=repr(e))
+        return False
+
+    ExamSession.objects.filter(pk=session.pk).update(status=ExamSession.READY, prepared_at=timezone.now())
+    return True
+
+
+def access_code_rows(sessions):
+    """Строки для раздачи кодов: (экзамен, ИИН, ФИО, код)."""
+    assignments = ExamAssignment.objects.filter(session__in=sessions).order_by('session', 'user__full_name')
+    for session_id, user_id, iin, full_name in assignments.values_list(
+        'session_id', 'user_id', 'user__iin', 'user__full_name'
+    ).iterator():
+        yield session_id, iin, full_name, access_code(session_id, user_id)
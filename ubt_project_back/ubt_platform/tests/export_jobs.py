@@ -0,0 +1,82 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exports import build_results_file, export_file_name, school_results
+from .models import ExportJob, ExportJobFile, School
+
+
+def claim_job():
+    """Забирает самое старое задание из очереди или возвращает None."""
+    with transaction.atomic():
+        queryset = ExportJob.objects.filter(status=ExportJob.PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.first()
+        if job is None:
+            return None
+        job.status = ExportJob.RUNNING
+        job.started_at = timezone.now()
+        job.total = job.schools.count()
+        job.completed = 0
+        job.save(update_fields=['status', 'started_at', 'total', 'completed'])
+    return job
+
+
+def build_school_export(job_id, school_id, date_from, date_to):
+    """
+    Строит книгу одной школы и сохраняет её в MEDIA_ROOT.
+    Выполняется в дочернем процессе пула. Возвращает (school_id, имя файла, строк).
+    """
+    school = School.objects.get(id=school_id)
+    test_results = school_results(school_id, date_from, date_to)
+    if not test_results:
+        return school_id, '', 0
+
+    suffix = str(date_from) if date_from == date_to else f'{date_from}_{date_to}'
+    name = f'exports/{job_id}/{export_file_name(school, suffix)}'
+    with build_results_file(test_results) as fileobj:
+        name = default_storage.save(name, File(fileobj))
+    return school_id, name, len(test_results)
+
+
+def _run_in_pool(job, school_ids, workers):
+    # Дочерние процессы не должны унаследовать открытые соединения с базой
+    connections.close_all()
+    # С fork все процессы пула создаются при первой отправке задачи,
+    # до того как родитель снова откроет соединение
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [
+            executor.submit(build_school_export, job.id, school_id, job.date_from, job.date_to)
+            for school_id in school_ids
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_job(job, workers):
+    """Строит книги всех школ задания, при workers > 1 — параллельно в пуле процессов."""
+    school_ids = list(job.schools.values_list('id', flat=True))
+    if workers > 1:
+        results = _run_in_pool(job, school_ids, workers)
+    else:
+        results = (build_school_export(job.id, school_id, job.date_from, job.date_to) for school_id in school_ids)
+
+    try:
+        for school_id, name, rows in results:
+            ExportJobFile.objects.create(job=job, school_id=school_id, file=name, rows=rows)
+            ExportJob.objects.filter(pk=job.pk).update(completed=F('completed') + 1)
+    except Exception as e:
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJob.FAILED, finished_at=timezone.now(), error=repr(e)
+        )
+        return False
+
+    ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.DONE, finished_at=timezone.now())
+    return True
@@ -0,0 +1,189 @@
+import tempfile
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Prefetch
+from django.db.models.functions import TruncDate
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from .models import TestResult, SubjectResult
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+SUBJECT_CODE_TO_RU = {
+    'HIS': 'История',
+    'RL': 'Грам. чтения',
+    'ML': 'Матем. грам.',
+    'BIO': 'Биология',
+    'CHE': 'Химия',
+    'MAT': 'Математика',
+    'PHY': 'Физика',
+    'GEO': 'География',
+    'LF': 'Право',
+    'FL': 'Иностр. язык',
+    'KZ': 'Казахский яз.',
+    'KL': 'Казахская лит.',
+    'INF': 'Информатика',
+    'WHI': 'Всемир. история',
+    'RU': 'Русский язык',
+    'RUL': 'Русская лит.',
+}
+
+DEFAULT_CODES = ['HIS', 'RL', 'ML']
+
+
+def school_results(school_id, date_from, date_to=None):
+    """
+    Лучший результат каждого ученика школы за каждый день периода (по умолчанию за один день)
+    вместе с пользователем, школой и баллами по предметам — за два запроса.
+    """
+    test_results = (
+        TestResult.objects.filter(
+            user__school_id=school_id,
+            date_taken__date__gte=date_from,
+            date_taken__date__lte=date_to or date_from,
+        )
+        # День — в текущем часовом поясе, как и в фильтре выше
+        .annotate(day=TruncDate("date_taken"))
+        .select_related("user__school")
+        .prefetch_related(
+            Prefetch("subject_results", queryset=SubjectResult.objects.select_related("subject"))
+        )
+        .order_by("user", "day", "-total_score")
+    )
+    if connection.features.can_distinct_on_fields:
+        return list(test_results.distinct("user", "day"))
+
+    # Без DISTINCT ON оставляем первую (лучшую) запись каждого пользователя за день
+    best = {}
+    for tr in test_results:
+        best.setdefault((tr.user_id, tr.day), tr)
+    return list(best.values())
+
+
+def group_results_by_pair(test_results):
+    """
+    Группирует результаты по "паре дополнительных предметов".
+
+    Для каждого test_result определяем, какие предметы у него были (кроме 3 статичных).
+    Например, (BIO, CHE) -> [(TestResult, {код: балл}), ...], (INF, MAT) -> [...], ...
+    Баллы по предметам берутся из уже загруженных subject_results.
+    """
+    group_to_results = defaultdict(list)
+
+    for tr in test_results:
+        # Превратим список SubjectResult в словарь {код:балл}
+        code_to_score = {sr.subject.name: sr.score for sr in tr.subject_results.all()}
+        # Оставляем «дополнительные» предметы = те, что не в DEFAULT_CODES.
+        # Сортируем, чтобы пара (BIO, CHE) была тем же, что и (CHE, BIO)
+        optional_codes = sorted(c for c in code_to_score if c not in DEFAULT_CODES)
+        group_to_results[tuple(optional_codes)].append((tr, code_to_score))
+
+    return group_to_results
+
+
+def sheet_headers(pair_key):
+    headers = [
+        "Название школы",
+        "Имя пользователя",
+        "Общий балл",
+        "Дата прохождения",
+    ]
+    # Три статичных предмета и «дополнительные» предметы пары
+    for code in DEFAULT_CODES + list(pair_key):
+        headers.append(SUBJECT_CODE_TO_RU.get(code, code))
+    return headers
+
+
+def sheet_row(test, code_to_score, pair_key):
+    row = [
+        test.user.school.name if test.user.school else "—",
+        test.user.full_name,
+        test.total_score,
+        test.date_taken.strftime("%Y-%m-%d %H:%M:%S"),
+    ]
+    for code in DEFAULT_CODES + list(pair_key):
+        row.append(code_to_score.get(code, 0))
+    return row
+
+
+def write_results_workbook(group_to_results, fileobj):
+    """
+    Пишет книгу в потоковом (write-only) режиме: ячейки не хранятся в памяти.
+
+    Ширины столбцов в таком режиме нужно задать до первой строки листа,
+    поэтому они считаются одним проходом по уже подготовленным строкам.
+    """
+    wb = Workbook(write_only=True)
+    bold_font = Font(bold=True)
+
+    # Для каждого "pair_key" (уникальная пара доп. предметов) делаем свой лист
+    for pair_key, results_in_group in group_to_results.items():
+        # Пример: "BIO+CHE"
+        sheet_name = "+".join(pair_key) if pair_key else "Без доп. предметов"
+        ws = wb.create_sheet(title=sheet_name[:31])  # Ограничение Excel в 31 символ
+
+        headers = sheet_headers(pair_key)
+        rows = [sheet_row(test, code_to_score, pair_key) for test, code_to_score in results_in_group]
+
+        widths = [len(str(header)) for header in headers]
+        for row in rows:
+            for index, value in enumerate(row):
+                widths[index] = max(widths[index], len(str(value)))
+        for index, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(index)].width = width + 2
+
+        # Делаем заголовки жирными
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = bold_font
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        for row in rows:
+            # Имя пользователя выделяем жирным
+            row[1] = WriteOnlyCell(ws, value=row[1])
+            row[1].font = bold_font
+            ws.append(row)
+
+    wb.save(fileobj)
+
+
+def export_file_name(school, suffix):
+    # Формируем имя файла, подставляя школу и дату
+    school_name_cleaned = "".join(c if c.isalnum() else "_" for c in school.name)
+    return f"test_results_{school_name_cleaned}_{suffix}.xlsx"
+
+
+def build_results_file(test_results):
+    """Собирает книгу во временный файл и возвращает его, готовым к чтению."""
+    fileobj = tempfile.TemporaryFile()
+    write_results_workbook(group_results_by_pair(test_results), fileobj)
+    fileobj.seek(0)
+    return fileobj
+
+
+def build_access_codes_file(rows):
+    """Книга с кодами доступа к экзаменам: строки (экзамен, ИИН, ФИО, код), во временном файле."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title="Коды доступа")
+    for index, width in enumerate([10, 14, 40, 14], 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+    bold_font = Font(bold=True)
+    header_cells = []
+    for header in ["Экзамен", "ИИН", "ФИО", "Код доступа"]:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = bold_font
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for row in rows:
+        ws.append(row)
+
+    fileobj = tempfile.TemporaryFile()
+    wb.save(fileobj)
+    fileobj.seek(0)
+    return fileobj
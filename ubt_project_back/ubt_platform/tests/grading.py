@@ -0,0 +1,119 @@
+from collections import namedtuple
+
+from .answer_keys import answer_key_index, load_answer_keys
+
+GradingResult = namedtuple('GradingResult', ['subject_scores', 'correct_answers', 'total_score'])
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def grade_answers(answers):
+    """
+    Проверяет ответы вида { subject_id: { question_id: user_answers } }.
+
+    Ключи берутся из скомпилированного индекса вариантов; в базу идём
+    только за вопросами, которых нет в присланном варианте, и то пакетно.
+    Подсчёт баллов идёт в памяти, поэтому число запросов
+    не зависит от количества вопросов.
+    """
+    submitted = []
+    for subject_id_str, subject_answers in answers.items():
+        subject_id = _parse_id(subject_id_str)
+        if subject_id is not None:
+            submitted.append((subject_id, subject_answers))
+
+    # Несуществующих вариантов в индексе нет
+    variants = answer_key_index.get_many(subject_id for subject_id, _ in submitted)
+
+    parsed = []
+    answer_keys = {}
+    missing_question_ids = set()
+    for subject_id, subject_answers in submitted:
+        variant = variants.get(subject_id)
+        if variant is None:
+            continue
+        question_answers = []
+        for question_id_str, user_answers in subject_answers.items():
+            question_id = _parse_id(question_id_str)
+            if question_id is None:
+                continue
+            question_answers.append((question_id, user_answers))
+            answer_key = variant.keys.get(question_id)
+            if answer_key is not None:
+                answer_keys[question_id] = answer_key
+            else:
+                missing_question_ids.add(question_id)
+        parsed.append((subject_id, question_answers))
+
+    # Вопрос из другого варианта по-прежнему засчитывается, как и раньше
+    missing_question_ids.difference_update(answer_keys)
+    if missing_question_ids:
+        answer_keys.update(load_answer_keys(missing_question_ids))
+
+    return score_answers(parsed, answer_keys)
+
+
+def restrict_answers(answers, subject_ids):
+    """
+    Проверяет, что ответы даны только на вопросы выданных вариантов (по скомпилированным ключам),
+    поэтому grade_answers не идёт в базу за вопросами из других вариантов.
+    Возвращает (ответы, None) или (None, ошибка) для невыданного варианта или чужого вопроса.
+    """
+    variants = answer_key_index.get_many(subject_ids)
+    for subject_id_str, subject_answers in answers.items():
+        variant = variants.get(_parse_id(subject_id_str))
+        if variant is None:
+            return None, f'Subject {subject_id_str} was not issued in this test.'
+        if not isinstance(subject_answers, dict):
+            return None, f'Invalid answers for subject {subject_id_str}.'
+        for question_id_str in subject_answers:
+            if _parse_id(question_id_str) not in variant.keys:
+                return None, f'Question {question_id_str} is not in subject {subject_id_str}.'
+    return answers, None
+
+
+def score_answers(parsed, answer_keys):
+    """Считает баллы по уже разобранным ответам и загруженным ключам."""
+    subject_scores = []
+    correct_answers_dict = {}
+    total_score = 0
+
+    for subject_id, subject_answers in parsed:
+        subject_score = 0
+        correct_answers_dict[subject_id] = {}
+
+        for question_id, user_answers in subject_answers:
+            answer_key = answer_keys.get(question_id)
+            if answer_key is None:
+                continue
+
+            correct_answers_dict[subject_id][question_id] = {
+                'question_type': answer_key.question_type,
+                'correct_answers': answer_key.correct_answers(),
+            }
+            subject_score += answer_key.score(user_answers)
+
+        total_score += subject_score
+        subject_scores.append((subject_id, subject_score))
+
+    return GradingResult(subject_scores, correct_answers_dict, total_score)
+
+
+def variant_correct_answers(subject_ids):
+    """Правильные ответы на все вопросы вариантов в формате GradingResult.correct_answers."""
+    variants = answer_key_index.get_many(subject_ids)
+    return {
+        subject_id: {
+            question_id: {
+                'question_type': answer_key.question_type,
+                'correct_answers': answer_key.correct_answers(),
+            }
+            for question_id, answer_key in variants[subject_id].keys.items()
+        }
+        for subject_id in subject_ids if subject_id in variants
+    }
@@ -0,0 +1,91 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import SubmissionTicket
+from .results import save_test_result
+from .signed_tickets import TICKET_HEADER
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def idempotency_key(request):
+    """
+    Ключ повторов submit_answers: заголовок Idempotency-Key, иначе тикет выданного теста
+    (один выданный тест — одна отправка). Хранится sha256, поэтому длина ключа не важна.
+    """
+    value = request.headers.get(IDEMPOTENCY_HEADER)
+    if value:
+        source = f'key:{value}'
+    else:
+        ticket = request.headers.get(TICKET_HEADER)
+        if not ticket:
+            return None
+        source = f'ticket:{ticket}'
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def find_submission(user, key):
+    """
+    Уже принятая отправка ученика с этим ключом или None — один запрос по уникальному индексу.
+    Отправка, проверка которой завершилась ошибкой, не считается: повтор принимается заново.
+    """
+    if key is None:
+        return None
+    return _accepted(user, key).first()
+
+
+async def afind_submission(user, key):
+    """find_submission для асинхронных представлений, через async ORM."""
+    if key is None:
+        return None
+    return await _accepted(user, key).afirst()
+
+
+def _accepted(user, key):
+    return SubmissionTicket.objects.select_related('test_result__user').filter(
+        user=user, idempotency_key=key
+    ).exclude(status=SubmissionTicket.FAILED)
+
+
+def submission_exists(user, key):
+    return key is not None and SubmissionTicket.objects.filter(user=user, idempotency_key=key).exclude(
+        status=SubmissionTicket.FAILED
+    ).exists()
+
+
+def discard_failed(user, key):
+    """Удаляет отправку с этим ключом, завершившуюся ошибкой, чтобы ключ можно было использовать снова."""
+    deleted, _ = SubmissionTicket.objects.filter(
+        user=user, idempotency_key=key, status=SubmissionTicket.FAILED
+    ).delete()
+    return bool(deleted)
+
+
+def save_graded(user, answers, grading, key):
+    """
+    Сохраняет результат вместе с квитанцией одной транзакцией. Возвращает (квитанция, создана ли).
+
+    Одновременные повторы сталкиваются на уникальном индексе (user, idempotency_key):
+    проигравший откатывает свой TestResult целиком и получает квитанцию победителя.
+    Квитанция с ошибкой проверки заменяется новой. Сами ответы и правильные ответы
+    в квитанции не хранятся: повтор берёт их из ключей вариантов результата.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                test_result = save_test_result(user, grading)
+                submission = SubmissionTicket.objects.create(
+                    user=user, answers={}, idempotency_key=key, status=SubmissionTicket.DONE,
+                    processed_at=timezone.now(), test_result=test_result,
+                )
+            submission.correct_answers = grading.correct_answers
+            return submission, True
+        except IntegrityError:
+            winner = find_submission(user, key)
+            if winner is not None:
+                return winner, False
+            # Победителя нет: либо прежняя квитанция с ошибкой, либо ошибка не из-за повтора
+            if attempt or not discard_failed(user, key):
+                raise
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import hashlib
+import re
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .models import Question, Answer, MatchingPair
+
+# Поля с HTML из Summernote, в которые вставленные картинки попадают как data:image/...;base64
+HTML_FIELDS = {
+    Question: ['text'],
+    Answer: ['text'],
+    MatchingPair: ['left_side_1', 'left_side_2', 'right_option_1', 'right_option_2', 'right_option_3',
+                   'right_option_4'],
+}
+
+DATA_URI_RE = re.compile(
+    r'(?P<quote>["\'])data:image/(?P<type>png|jpe?g|gif|webp);base64,(?P<data>[A-Za-z0-9+/=\s]+)(?P=quote)',
+    re.IGNORECASE,
+)
+
+# SVG не выносим: это документ со скриптами, отдавать его с нашего домена нельзя
+EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'jpg': 'jpg', 'gif': 'gif', 'webp': 'webp'}
+
+UPLOAD_DIR = 'content'
+
+
+def save_image(data, extension):
+    """
+    Сохраняет картинку под именем из её SHA-256 и возвращает абсолютный URL:
+    фронтенд на другом домене разрешил бы относительный /media/... от своего адреса.
+    Одинаковые картинки из разных вариантов хранятся одним файлом.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    name = f'{UPLOAD_DIR}/{digest[:2]}/{digest}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return urljoin(settings.CONTENT_MEDIA_BASE_URL, default_storage.url(name))
+
+
+def extract_images(html):
+    """Заменяет встроенные base64-картинки ссылками на файлы. Возвращает (html, число замен)."""
+    if not html or 'data:image/' not in html:
+        return html, 0
+
+    def replace(match):
+        try:
+            data = base64.b64decode(re.sub(r'\s+', '', match['data']), validate=True)
+        except (binascii.Error, ValueError):
+            # Битые данные оставляем как есть
+            return match[0]
+        url = save_image(data, EXTENSIONS[match['type'].lower()])
+        return f'{match["quote"]}{url}{match["quote"]}'
+
+    return DATA_URI_RE.subn(replace, html)
+
+
+def extract_instance_images(instance):
+    """Выносит картинки из всех HTML-полей объекта. Возвращает список изменённых полей."""
+    changed = []
+    for field in HTML_FIELDS[type(instance)]:
+        html, count = extract_images(getattr(instance, field))
+        if count:
+            setattr(instance, field, html)
+            changed.append(field)
+    return changed
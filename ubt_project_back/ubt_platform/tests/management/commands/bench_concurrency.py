@@ -0,0 +1,130 @@
+import asyncio
+import secrets
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework.authtoken.models import Token
+
+from tests.async_views import AsyncGenerateTestView
+from tests.models import CustomUser, Subject
+from tests.views import GenerateTestView
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает generate_test через синхронное (WSGI) и асинхронное (ASGI) представления '
+        'при одинаковой конкурентной нагрузке'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Одновременных запросов: потоков WSGI-воркера и задач ASGI-воркера')
+        parser.add_argument('--db-latency', type=float, default=10.0,
+                            help='Искусственная задержка каждого SQL-запроса, мс (сетевая база)')
+
+    def handle(self, *args, **options):
+        for code in ('HIS', 'RL', 'ML'):
+            if not Subject.objects.filter(name=code, is_active=True).exists():
+                raise CommandError(f'Нет активных вариантов для {code}: нечего генерировать')
+
+        # Временный ученик с ещё не занятым ИИН, удаляется вместе с токеном в конце замера
+        user = CustomUser.objects.create_user(full_name='Benchmark', iin=self.free_iin())
+        try:
+            token = Token.objects.create(user=user)
+            self.auth_header = f'Token {token.key}'
+            wsgi, asgi = self.measure(options)
+        finally:
+            user.delete()
+
+        self.report('WSGI', wsgi)
+        self.report('ASGI', asgi)
+        self.stdout.write(f'Ускорение ASGI: x{wsgi[0] / asgi[0]:.1f}')
+
+    def free_iin(self):
+        while True:
+            iin = f'{secrets.randbelow(10 ** 12):012d}'
+            if not CustomUser.objects.filter(iin=iin).exists():
+                return iin
+
+    def measure(self, options):
+        # Обе модели получают одинаковую конкурентность, различается только способ ожидания базы
+        delay = options['db_latency'] / 1000
+
+        def slow_execute(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            if slow_execute not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_execute)
+
+        connection_created.connect(add_latency)
+        try:
+            with mock.patch.object(GenerateTestView, 'throttle_classes', []), \
+                    mock.patch.object(AsyncGenerateTestView, 'throttle_classes', []):
+                connections.close_all()
+                wsgi = self.run_wsgi(options['requests'], options['concurrency'])
+                connections.close_all()
+                asgi = asyncio.run(self.run_asgi(options['requests'], options['concurrency']))
+        finally:
+            connection_created.disconnect(add_latency)
+            connections.close_all()
+        return wsgi, asgi
+
+    def run_wsgi(self, total, threads):
+        view = GenerateTestView.as_view()
+        factory = RequestFactory()
+
+        def call(_):
+            request = factory.post(
+                '/api/generate_test/', {'selected_subjects': []},
+                content_type='application/json', headers={'Authorization': self.auth_header}
+            )
+            started = time.monotonic()
+            response = view(request)
+            latency = time.monotonic() - started
+            connections.close_all()
+            return response.status_code, latency
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(call, range(total)))
+        return time.monotonic() - started, results
+
+    async def run_asgi(self, total, concurrency):
+        view = AsyncGenerateTestView.as_view()
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                request = factory.post(
+                    '/api/generate_test/', {'selected_subjects': []},
+                    content_type='application/json', headers={'Authorization': self.auth_header}
+                )
+                started = time.monotonic()
+                # Как в ASGIHandler: у каждого запроса свой поток для синхронного кода
+                async with ThreadSensitiveContext():
+                    response = await view(request)
+                return response.status_code, time.monotonic() - started
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(call() for _ in range(total)))
+        return time.monotonic() - started, results
+
+    def report(self, name, measurement):
+        elapsed, results = measurement
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for status_code, _ in results if status_code != 200)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f'{name}: {len(results)} запросов за {elapsed:.2f} с ({len(results) / elapsed:.1f} rps), '
+            f'p50 {statistics.median(latencies) * 1000:.0f} мс, p95 {p95 * 1000:.0f} мс, ошибок {errors}'
+        )
@@ -0,0 +1,32 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from tests.inline_images import HTML_FIELDS, extract_instance_images
+
+
+class Command(BaseCommand):
+    help = 'Выносит встроенные base64-картинки из вопросов, ответов и пар соответствия в файлы MEDIA_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать объекты с картинками')
+
+    def handle(self, *args, **options):
+        for model, fields in HTML_FIELDS.items():
+            condition = reduce(or_, (Q(**{f'{field}__contains': 'data:image/'}) for field in fields))
+            queryset = model.objects.filter(condition).order_by('pk')
+            if options['dry_run']:
+                self.stdout.write(f'{model.__name__}: {queryset.count()}')
+                continue
+
+            updated = 0
+            for instance in queryset.iterator(chunk_size=options['chunk_size']):
+                changed = extract_instance_images(instance)
+                if changed:
+                    # Сигналы save() меняют версию варианта, и кэши заданий пересобираются
+                    instance.save(update_fields=changed)
+                    updated += 1
+            self.stdout.write(f'{model.__name__}: обновлено {updated}')
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tests.user_import import import_users
+
+
+class Command(BaseCommand):
+    help = 'Загружает учеников из XLSX или CSV (столбцы ИИН, ФИО, Школа, Тип использования)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для хэширования паролей')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as fileobj:
+                report = import_users(fileobj, path, options['workers'], options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in report.errors:
+            self.stderr.write(f'Строка {error["row"]} ({error["iin"]}): {error["error"]}')
+        self.stdout.write(f'Создано {report.created}, обновлено {report.updated}, ошибок {len(report.errors)}')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tests.exam_sessions import claim_session, run_session
+
+
+class Command(BaseCommand):
+    help = 'Воркер подготовки экзаменов (ExamSession): варианты, токены и коды доступа учеников заранее'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=60.0,
+                            help='Пауза в секундах, когда готовить нечего')
+        parser.add_argument('--once', action='store_true', help='Подготовить все подошедшие экзамены и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            session = claim_session()
+            if session is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.monotonic()
+            ok = run_session(session)
+            session.refresh_from_db()
+            self.stdout.write(
+                f'Экзамен {session.id}: {session.get_status_display()}, '
+                f'учеников {session.prepared}/{session.total} за {time.monotonic() - started:.1f} с'
+            )
+            if not ok:
+                self.stderr.write(session.error)
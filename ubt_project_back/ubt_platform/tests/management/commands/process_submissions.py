@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tests.answer_keys import answer_key_index
+from tests.submission_queue import process_batch, queue_stats, requeue_stale
+
+
+class Command(BaseCommand):
+    help = 'Воркер отложенной проверки ответов (очередь SubmissionTicket в базе данных)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Через сколько секунд незавершённый тикет возвращается в очередь')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и выйти')
+        parser.add_argument('--stats', action='store_true', help='Показать состояние очереди и выйти')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.write_stats()
+            return
+
+        # Ключи ответов всех активных вариантов держим в памяти воркера
+        answer_key_index.warm()
+
+        requeued = requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь: {requeued}')
+
+        while True:
+            started = time.monotonic()
+            processed, failed = process_batch(options['batch_size'])
+            if processed:
+                elapsed = time.monotonic() - started
+                stats = queue_stats()
+                self.stdout.write(
+                    f'Проверено {processed} (ошибок {failed}) за {elapsed:.2f} с, '
+                    f'{processed / max(elapsed, 1e-6):.1f}/с; в очереди {stats["pending"]}, '
+                    f'старейший ждёт {stats["oldest_pending_age"]:.0f} с'
+                )
+                continue
+
+            if options['once']:
+                break
+            requeue_stale(options['stale_after'])
+            time.sleep(options['sleep'])
+
+    def write_stats(self):
+        for name, value in queue_stats().items():
+            self.stdout.write(f'{name}: {value}')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tests.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки результатов по школам и дням по всей истории TestResult'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        processed = rebuild_rollups(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Учтено результатов: {processed}')
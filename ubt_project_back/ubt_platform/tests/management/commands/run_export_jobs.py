@@ -0,0 +1,36 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from tests.export_jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых выгрузок результатов в Excel (задания ExportJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для параллельной сборки книг')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Пауза в секундах, когда заданий нет')
+        parser.add_argument('--once', action='store_true', help='Выполнить все задания и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.monotonic()
+            ok = run_job(job, options['workers'])
+            job.refresh_from_db()
+            self.stdout.write(
+                f'Задание {job.id}: {job.get_status_display()}, '
+                f'школ {job.completed}/{job.total} за {time.monotonic() - started:.1f} с'
+            )
+            if not ok:
+                self.stderr.write(job.error)
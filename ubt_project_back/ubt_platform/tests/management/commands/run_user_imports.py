@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from tests.user_import import claim_import, run_import
+
+
+class Command(BaseCommand):
+    help = 'Воркер загрузок учеников, поставленных в очередь из админки (UserImport)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для хэширования паролей')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Пауза в секундах, когда загрузок нет')
+        parser.add_argument('--once', action='store_true', help='Выполнить все загрузки и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            user_import = claim_import()
+            if user_import is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.monotonic()
+            ok = run_import(user_import, options['workers'])
+            user_import.refresh_from_db()
+            self.stdout.write(
+                f'Загрузка {user_import.id}: {user_import.get_status_display()}, создано {user_import.created}, '
+                f'обновлено {user_import.updated}, ошибок {len(user_import.row_errors)} '
+                f'за {time.monotonic() - started:.1f} с'
+            )
+            if not ok:
+                self.stderr.write(user_import.error)
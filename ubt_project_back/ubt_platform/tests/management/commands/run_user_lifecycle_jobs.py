@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tests.user_lifecycle import claim_lifecycle_job, run_lifecycle_job
+
+
+class Command(BaseCommand):
+    help = 'Воркер массовой активации, деактивации и удаления учеников (задания UserLifecycleJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Пауза в секундах, когда заданий нет')
+        parser.add_argument('--once', action='store_true', help='Выполнить все задания и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_lifecycle_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.monotonic()
+            ok = run_lifecycle_job(job)
+            job.refresh_from_db()
+            self.stdout.write(
+                f'Задание {job.id}: {job.get_action_display()}, {job.get_status_display()}, '
+                f'ИИН {job.processed}/{job.total}, изменено {job.affected} за {time.monotonic() - started:.1f} с'
+            )
+            if not ok:
+                self.stderr.write(job.error)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:28
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0006_school_customuser_school'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('answers', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Проверяется'), ('done', 'Проверено'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('correct_answers', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('test_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tests.testresult')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_tickets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='submission_queue_idx')],
+            },
+        ),
+    ]
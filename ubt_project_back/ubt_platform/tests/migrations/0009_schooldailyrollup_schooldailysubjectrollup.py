@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0008_exportjob_exportjobfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchoolDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Результатов')),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('score_sum_sq', models.BigIntegerField(default=0)),
+                ('score_min', models.IntegerField(null=True, verbose_name='Мин.')),
+                ('score_max', models.IntegerField(null=True, verbose_name='Макс.')),
+                ('day', models.DateField(verbose_name='День')),
+                ('subject_pair', models.CharField(blank=True, max_length=16, verbose_name='Доп. предметы')),
+                ('school', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tests.school', verbose_name='Школа')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('school__isnull', False)), fields=('school', 'day', 'subject_pair'), name='school_daily_rollup_uniq'), models.UniqueConstraint(condition=models.Q(('school__isnull', True)), fields=('day', 'subject_pair'), name='no_school_daily_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SchoolDailySubjectRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Результатов')),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('score_sum_sq', models.BigIntegerField(default=0)),
+                ('score_min', models.IntegerField(null=True, verbose_name='Мин.')),
+                ('score_max', models.IntegerField(null=True, verbose_name='Макс.')),
+                ('day', models.DateField(verbose_name='День')),
+                ('subject', models.CharField(choices=[('HIS', 'Тарих'), ('MAT', 'Математика'), ('PHY', 'Физика'), ('CHE', 'Химия'), ('RL', 'Оқу сауаттылығы'), ('ML', 'Математикалық сауаттылық'), ('WHI', 'Дүниежүзі тарихы'), ('GEO', 'География'), ('LF', 'Құқық негіздері'), ('FL', 'Шет тілі'), ('BIO', 'Биология'), ('KZ', 'Қазақ тілі'), ('KL', 'Қазақ әдебиеті'), ('INF', 'Информатика'), ('RU', 'Русский язык'), ('RUL', 'Русская литература')], max_length=3, verbose_name='Предмет')),
+                ('school', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tests.school', verbose_name='Школа')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('school__isnull', False)), fields=('school', 'day', 'subject'), name='school_daily_subject_rollup_uniq'), models.UniqueConstraint(condition=models.Q(('school__isnull', True)), fields=('day', 'subject'), name='no_school_daily_subject_rollup_uniq')],
+            },
+        ),
+    ]
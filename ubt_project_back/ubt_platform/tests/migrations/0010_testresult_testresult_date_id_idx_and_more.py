@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0009_schooldailyrollup_schooldailysubjectrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(fields=['-date_taken', '-id'], name='testresult_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(fields=['user', '-date_taken'], name='testresult_user_date_idx'),
+        ),
+    ]
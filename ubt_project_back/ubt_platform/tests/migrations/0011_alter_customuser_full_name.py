@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0010_testresult_testresult_date_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='full_name',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='ФИО'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0013_userlifecyclejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField(verbose_name='Начало')),
+                ('ends_at', models.DateTimeField(verbose_name='Окончание')),
+                ('selected_subjects', models.JSONField(default=list, verbose_name='Доп. предметы')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подготовки'), ('preparing', 'Готовится'), ('ready', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('prepared_at', models.DateTimeField(blank=True, null=True, verbose_name='Подготовлено')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('prepared', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_sessions', to='tests.school', verbose_name='Школа')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExamAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject_ids', models.JSONField()),
+                ('login_digest', models.CharField(max_length=64, unique=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_assignments', to=settings.AUTH_USER_MODEL)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='tests.examsession')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='examsession',
+            index=models.Index(fields=['status', 'starts_at'], name='exam_session_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='examassignment',
+            constraint=models.UniqueConstraint(fields=('session', 'user'), name='exam_assignment_uniq'),
+        ),
+    ]
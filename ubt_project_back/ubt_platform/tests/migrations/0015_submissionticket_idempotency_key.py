@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0014_examsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionticket',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='submissionticket',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='submission_idempotency_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0015_submissionticket_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schooldailyrollup',
+            name='subject_pair',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Доп. предметы'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 import re
 from django.utils import timezone
 
@@ -109,6 +110,13 @@ class TestResult(models.Model):
     date_taken = models.DateTimeField(auto_now_add=True)
     total_score = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            # Сортировка и фильтр по дате в админке, постраничный вывод по курсору
+            models.Index(fields=['-date_taken', '-id'], name='testresult_date_id_idx'),
+            models.Index(fields=['user', '-date_taken'], name='testresult_user_date_idx'),
+        ]
+
     def __str__(self):
         return f'Имя: {self.user}, Баллы: {self.total_score}'
 
@@ -153,7 +161,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         ('subscription', 'Subscription'),
     ]
 
-    full_name = models.CharField(max_length=255, verbose_name="ФИО")
+    # Индекс для поиска по началу ФИО в админке
+    full_name = models.CharField(max_length=255, db_index=True, verbose_name="ФИО")
     iin = models.CharField(max_length=12, unique=True, validators=[RegexValidator(r'^\d{12}$', 'IIN must be 12 digits')], verbose_name="ИИН")
 
     is_active = models.BooleanField(default=True)
@@ -179,3 +188,277 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return self.full_name
+
+
+class SubmissionTicket(models.Model):
+    """
+    Отложенная отправка ответов: очередь на проверку в базе данных.
+    Отправки с ключом идемпотентности записываются и при обычной проверке — как квитанция для повторов.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Проверяется'),
+        (DONE, 'Проверено'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    ticket = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='submission_tickets')
+    answers = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    test_result = models.ForeignKey(TestResult, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    correct_answers = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # sha256 ключа Idempotency-Key или тикета выданного теста
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='submission_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='submission_idempotency_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.ticket} ({self.get_status_display()})'
+
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка результатов по нескольким школам за период."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    schools = models.ManyToManyField(School, related_name='+', verbose_name="Школы")
+    date_from = models.DateField(verbose_name="С даты")
+    date_to = models.DateField(verbose_name="По дату")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершено")
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'Выгрузка {self.date_from} — {self.date_to} ({self.get_status_display()})'
+
+
+class ExportJobFile(models.Model):
+    job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name='files')
+    school = models.ForeignKey(School, on_delete=models.SET_NULL, null=True, related_name='+')
+    file = models.FileField(upload_to='exports/', blank=True)
+    rows = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.file.name
+
+
+class UserImport(models.Model):
+    """Загрузка учеников из XLSX/CSV: файл ставится в очередь, обрабатывает run_user_imports."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    file = models.FileField(upload_to='imports/', verbose_name="Файл")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершено")
+    created = models.PositiveIntegerField(default=0, verbose_name="Создано учеников")
+    updated = models.PositiveIntegerField(default=0, verbose_name="Обновлено учеников")
+    # [{'row': номер строки, 'iin': ..., 'error': ...}, ...]
+    row_errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'Загрузка {self.file.name} ({self.get_status_display()})'
+
+
+class UserLifecycleJob(models.Model):
+    """Массовое изменение учеников по списку ИИН в фоне (большие списки из админки)."""
+    ACTIVATE = 'activate'
+    DEACTIVATE = 'deactivate'
+    DELETE = 'delete'
+
+    ACTION_CHOICES = [
+        (ACTIVATE, 'Активация'),
+        (DEACTIVATE, 'Деактивация'),
+        (DELETE, 'Удаление'),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="Действие")
+    # ИИН по одному на строку
+    iins = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершено")
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    affected = models.PositiveIntegerField(default=0, verbose_name="Изменено учеников")
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'{self.get_action_display()} ({self.get_status_display()})'
+
+
+class ExamSession(models.Model):
+    """
+    Экзамен школы в назначенное время. Заранее (за EXAM_PREPARE_AHEAD секунд) воркер
+    prepare_exam_sessions выдаёт ученикам варианты и токены, и в момент начала
+    вход и получение теста — по одному запросу по индексу.
+    """
+    PENDING = 'pending'
+    PREPARING = 'preparing'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает подготовки'),
+        (PREPARING, 'Готовится'),
+        (READY, 'Готов'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='exam_sessions', verbose_name="Школа")
+    starts_at = models.DateTimeField(verbose_name="Начало")
+    ends_at = models.DateTimeField(verbose_name="Окончание")
+    # Коды дополнительных предметов, обязательные добавляются сами
+    selected_subjects = models.JSONField(default=list, verbose_name="Доп. предметы")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    prepared_at = models.DateTimeField(null=True, blank=True, verbose_name="Подготовлено")
+    total = models.PositiveIntegerField(default=0)
+    prepared = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'starts_at'], name='exam_session_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.school} {self.starts_at:%Y-%m-%d %H:%M} ({self.get_status_display()})'
+
+
+class ExamAssignment(models.Model):
+    """Заранее выданный ученику тест экзамена: варианты и ключ входа по коду доступа."""
+    session = models.ForeignKey(ExamSession, on_delete=models.CASCADE, related_name='assignments')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='exam_assignments')
+    # id вариантов (Subject) в порядке выдачи
+    subject_ids = models.JSONField()
+    # HMAC от ИИН и кода доступа: вход без PBKDF2, поиском по уникальному индексу
+    login_digest = models.CharField(max_length=64, unique=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'user'], name='exam_assignment_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.session_id}: {self.user_id}'
+
+
+class RollupStats(models.Model):
+    """Накопленная статистика баллов: пересчитывается инкрементно при каждом новом результате."""
+    count = models.PositiveIntegerField(default=0, verbose_name="Результатов")
+    score_sum = models.BigIntegerField(default=0)
+    score_sum_sq = models.BigIntegerField(default=0)
+    score_min = models.IntegerField(null=True, verbose_name="Мин.")
+    score_max = models.IntegerField(null=True, verbose_name="Макс.")
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mean(self):
+        return self.score_sum / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+        variance = self.score_sum_sq / self.count - self.mean ** 2
+        return max(variance, 0) ** 0.5
+
+
+class SchoolDailyRollup(RollupStats):
+    """Итоговые баллы по школе, дню и паре дополнительных предметов."""
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, related_name='+', verbose_name="Школа")
+    day = models.DateField(verbose_name="День")
+    # Все дополнительные предметы через "+" (46 символов) помещаются с запасом
+    subject_pair = models.CharField(max_length=64, blank=True, verbose_name="Доп. предметы")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['school', 'day', 'subject_pair'], name='school_daily_rollup_uniq',
+                                    condition=models.Q(school__isnull=False)),
+            models.UniqueConstraint(fields=['day', 'subject_pair'], name='no_school_daily_rollup_uniq',
+                                    condition=models.Q(school__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f'{self.school or "—"} {self.day} {self.subject_pair}'
+
+
+class SchoolDailySubjectRollup(RollupStats):
+    """Баллы по школе, дню и предмету."""
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, related_name='+', verbose_name="Школа")
+    day = models.DateField(verbose_name="День")
+    subject = models.CharField(max_length=3, choices=Subject.SUBJECT_CHOICES, verbose_name="Предмет")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['school', 'day', 'subject'], name='school_daily_subject_rollup_uniq',
+                                    condition=models.Q(school__isnull=False)),
+            models.UniqueConstraint(fields=['day', 'subject'], name='no_school_daily_subject_rollup_uniq',
+                                    condition=models.Q(school__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f'{self.school or "—"} {self.day} {self.subject}'
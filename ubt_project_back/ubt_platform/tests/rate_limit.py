@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+# Корзина токенов на ключ. Одна команда UPSERT ... RETURNING пополняет корзину
+# за прошедшее время, списывает токен, если он есть, и возвращает результат.
+# Все выражения SET считаются по старым значениям строки.
+TAKE_SQL = """
+INSERT INTO buckets (key, tokens, updated, allowed, expires) VALUES (:key, :capacity - 1, :now, 1, :expires)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + (:now - updated) * :rate)
+        - (min(:capacity, tokens + (:now - updated) * :rate) >= 1),
+    allowed = min(:capacity, tokens + (:now - updated) * :rate) >= 1,
+    updated = :now,
+    expires = :expires
+RETURNING allowed, tokens
+"""
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    allowed INTEGER NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Раз в столько проверок процесс удаляет давно полные корзины
+PRUNE_EVERY = 1000
+
+
+class TokenBucketStore:
+    """
+    Счётчики лимитов в файле SQLite (THROTTLE_STORE_PATH), общем для всех
+    воркеров на узле. Каждая проверка — одна атомарная команда без блокировок в Python.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        path = settings.THROTTLE_STORE_PATH
+        conn = getattr(self._local, 'conn', None)
+        # После fork соединение родителя использовать нельзя
+        if conn is None or self._local.pid != os.getpid() or self._local.path != path:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(SCHEMA_SQL)
+            self._local.conn, self._local.pid, self._local.path = conn, os.getpid(), path
+        return conn
+
+    def take(self, key, capacity, duration):
+        """
+        Списывает один запрос из лимита capacity за duration секунд.
+        Возвращает (разрешено, сколько секунд ждать до следующего токена).
+        """
+        now = time.time()
+        rate = capacity / duration
+        conn = self._connection()
+        allowed, tokens = conn.execute(TAKE_SQL, {
+            'key': key, 'capacity': capacity, 'rate': rate, 'now': now,
+            # Через это время корзина снова полная и строку можно удалить
+            'expires': now + duration,
+        }).fetchone()
+
+        self._calls += 1
+        if self._calls % PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM buckets WHERE expires < ?', [now])
+
+        if allowed:
+            return True, None
+        return False, (1 - tokens) / rate
+
+    def clear(self):
+        self._connection().execute('DELETE FROM buckets')
+
+
+throttle_store = TokenBucketStore()
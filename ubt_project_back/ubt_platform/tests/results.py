@@ -0,0 +1,82 @@
+from django.db import transaction
+from rest_framework.fields import DateTimeField
+
+from .grading import variant_correct_answers
+from .models import TestResult, SubjectResult, SubmissionTicket
+from .rollups import record_result
+from .serializers import TestResultSerializer, UserSerializer
+from .variant_cache import variant_cache
+
+
+def save_test_result(user, grading):
+    """
+    Сохраняет TestResult вместе со всеми SubjectResult одной транзакцией.
+
+    Итоговый балл известен до записи, поэтому TestResult вставляется
+    сразу с ним, а баллы по предметам — одним bulk_create.
+    """
+    with transaction.atomic():
+        test_result = TestResult.objects.create(user=user, total_score=grading.total_score)
+        SubjectResult.objects.bulk_create([
+            SubjectResult(test_result=test_result, subject_id=subject_id, score=subject_score)
+            for subject_id, subject_score in grading.subject_scores
+        ])
+        # Сводки по школе и дню обновляются после фиксации транзакции
+        record_result(test_result, user.school_id, grading.subject_scores)
+    return test_result
+
+
+def result_payload(test_result, correct_answers, subject_scores=None, compact=False):
+    """
+    Ответ submit_answers: результат и правильные ответы для фронта.
+
+    Варианты берутся из variant_cache, а не сериализуются заново. В компактном виде
+    у предмета только id, код и номер варианта; полный вариант отдаёт /api/variants/<id>/.
+    subject_scores — [(subject_id, балл)], если уже известны (иначе один запрос).
+    """
+    if subject_scores is None:
+        subject_scores = list(test_result.subject_results.order_by('id').values_list('subject_id', 'score'))
+    variants = variant_cache.get_many([subject_id for subject_id, _ in subject_scores])
+    if len(variants) < len(set(subject_id for subject_id, _ in subject_scores)):
+        # Вариант удалён после теста — по-старому, через сериализатор
+        response_data = TestResultSerializer(test_result).data
+        response_data['correct_answers'] = correct_answers
+        return response_data
+
+    subject_results = []
+    for subject_id, score in subject_scores:
+        data = variants[subject_id].data
+        if compact:
+            data = {'id': data['id'], 'name': data['name'], 'variant': data['variant']}
+        subject_results.append({'subject': data, 'score': score})
+
+    return {
+        'id': test_result.id,
+        'user': UserSerializer(test_result.user).data,
+        'date_taken': DateTimeField().to_representation(test_result.date_taken),
+        'total_score': test_result.total_score,
+        'subject_results': subject_results,
+        'correct_answers': correct_answers,
+    }
+
+
+def submission_payload(submission, compact=False, subject_scores=None):
+    """Ответ по тикету отправки: (данные, HTTP-статус). Готовый результат — 200, в очереди — 202."""
+    if submission.status == SubmissionTicket.DONE and submission.test_result_id:
+        correct_answers = submission.correct_answers
+        if correct_answers is None:
+            # Квитанция синхронной проверки: правильные ответы по ключам выданных вариантов
+            if subject_scores is None:
+                subject_scores = list(
+                    submission.test_result.subject_results.order_by('id').values_list('subject_id', 'score')
+                )
+            correct_answers = variant_correct_answers([subject_id for subject_id, _ in subject_scores])
+        response_data = result_payload(submission.test_result, correct_answers, subject_scores, compact=compact)
+        response_data['ticket'] = str(submission.ticket)
+        response_data['status'] = submission.status
+        return response_data, 200
+
+    if submission.status == SubmissionTicket.FAILED:
+        return {'ticket': str(submission.ticket), 'status': submission.status, 'error': 'Grading failed.'}, 200
+
+    return {'ticket': str(submission.ticket), 'status': submission.status}, 202
@@ -0,0 +1,201 @@
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .answer_keys import answer_key_index
+from .exports import DEFAULT_CODES
+from .models import SchoolDailyRollup, SchoolDailySubjectRollup, TestResult, SubjectResult
+
+
+def subject_pair_key(codes):
+    """Пара дополнительных предметов, как в выгрузке: "BIO+CHE"."""
+    return "+".join(sorted(code for code in set(codes) if code not in DEFAULT_CODES))
+
+
+def _add_score(model, lookup, score):
+    updated = model.objects.filter(**lookup).update(
+        count=F('count') + 1,
+        score_sum=F('score_sum') + score,
+        score_sum_sq=F('score_sum_sq') + score * score,
+        score_min=Least('score_min', score),
+        score_max=Greatest('score_max', score),
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(
+                **lookup, count=1, score_sum=score, score_sum_sq=score * score, score_min=score, score_max=score
+            )
+    except IntegrityError:
+        # Строку только что создал параллельный запрос
+        _add_score(model, lookup, score)
+
+
+def record_result(test_result, school_id, subject_scores):
+    """
+    Добавляет сохранённый результат в сводки по школе и дню после фиксации транзакции:
+    строки сводок одной школы не держат блокировки, пока сохраняются остальные отправки.
+    subject_scores — пары (subject_id, score), как в GradingResult.
+    """
+    variants = answer_key_index.get_many(subject_id for subject_id, _ in subject_scores)
+    code_scores = [
+        (variants[subject_id].name, score) for subject_id, score in subject_scores if subject_id in variants
+    ]
+    day = timezone.localdate(test_result.date_taken)
+    total_score = test_result.total_score
+
+    def apply():
+        _add_score(SchoolDailyRollup, {
+            'school_id': school_id, 'day': day, 'subject_pair': subject_pair_key(code for code, _ in code_scores),
+        }, total_score)
+        for code, score in code_scores:
+            _add_score(SchoolDailySubjectRollup, {'school_id': school_id, 'day': day, 'subject': code}, score)
+
+    # Ошибка сводок не отменяет сохранённый результат: их восстанавливает rebuild_rollups
+    transaction.on_commit(apply, robust=True)
+
+
+def _accumulate(stats, key, score):
+    entry = stats.get(key)
+    if entry is None:
+        stats[key] = [1, score, score * score, score, score]
+    else:
+        entry[0] += 1
+        entry[1] += score
+        entry[2] += score * score
+        entry[3] = min(entry[3], score)
+        entry[4] = max(entry[4], score)
+
+
+def _rollup_rows(model, stats, key_fields):
+    return [
+        model(**dict(zip(key_fields, key)), count=count, score_sum=score_sum, score_sum_sq=score_sum_sq,
+              score_min=score_min, score_max=score_max)
+        for key, (count, score_sum, score_sum_sq, score_min, score_max) in stats.items()
+    ]
+
+
+def _lock_rollups():
+    """
+    Запрещает запись в сводки до конца транзакции. На PostgreSQL — блокировка таблиц,
+    на SQLite транзакция получает блокировку записи первым же удалением.
+    """
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(model._meta.db_table for model in (SchoolDailyRollup, SchoolDailySubjectRollup))
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {tables} IN EXCLUSIVE MODE')
+
+
+def _collect(test_results, subject_results, chunk_size):
+    """
+    Сводки по результатам: ({ключ: статистика} по парам предметов, то же по предметам, число результатов).
+    Результаты и баллы по предметам читаются двумя упорядоченными потоками
+    и сливаются по id, поэтому в памяти держатся только сами сводки.
+    """
+    pair_stats = {}
+    subject_stats = {}
+    processed = 0
+
+    subject_groups = groupby(
+        subject_results.order_by('test_result_id')
+        .values_list('test_result_id', 'subject__name', 'score')
+        .iterator(chunk_size=chunk_size),
+        key=itemgetter(0),
+    )
+    current = next(subject_groups, None)
+
+    for test_result_id, school_id, date_taken, total_score in (
+        test_results.order_by('id')
+        .values_list('id', 'user__school_id', 'date_taken', 'total_score')
+        .iterator(chunk_size=chunk_size)
+    ):
+        while current is not None and current[0] < test_result_id:
+            current = next(subject_groups, None)
+        code_scores = []
+        if current is not None and current[0] == test_result_id:
+            code_scores = [(code, score) for _, code, score in current[1]]
+            current = next(subject_groups, None)
+
+        day = timezone.localdate(date_taken)
+        _accumulate(pair_stats, (school_id, day, subject_pair_key(code for code, _ in code_scores)), total_score)
+        for code, score in code_scores:
+            _accumulate(subject_stats, (school_id, day, code), score)
+        processed += 1
+    return pair_stats, subject_stats, processed
+
+
+def _save_stats(pair_stats, subject_stats, chunk_size):
+    SchoolDailyRollup.objects.bulk_create(
+        _rollup_rows(SchoolDailyRollup, pair_stats, ('school_id', 'day', 'subject_pair')),
+        batch_size=chunk_size,
+    )
+    SchoolDailySubjectRollup.objects.bulk_create(
+        _rollup_rows(SchoolDailySubjectRollup, subject_stats, ('school_id', 'day', 'subject')),
+        batch_size=chunk_size,
+    )
+
+
+def rebuild_rollups(chunk_size=2000):
+    """
+    Пересчитывает все сводки по истории результатов. Возвращает число учтённых результатов.
+    Сводки заблокированы на запись на всё время пересчёта, и новые результаты
+    добавляются в них уже после, а не теряются.
+    """
+    with transaction.atomic():
+        _lock_rollups()
+        SchoolDailyRollup.objects.all().delete()
+        SchoolDailySubjectRollup.objects.all().delete()
+        pair_stats, subject_stats, processed = _collect(
+            TestResult.objects.all(), SubjectResult.objects.all(), chunk_size
+        )
+        _save_stats(pair_stats, subject_stats, chunk_size)
+    return processed
+
+
+def _school_q(field, school_ids):
+    q = Q(**{f'{field}__in': [school_id for school_id in school_ids if school_id is not None]})
+    if None in school_ids:
+        q |= Q(**{f'{field}__isnull': True})
+    return q
+
+
+def refresh_rollups(school_days, chunk_size=2000):
+    """Пересчитывает сводки для пар (school_id, день) по оставшимся результатам."""
+    by_day = {}
+    for school_id, day in school_days:
+        by_day.setdefault(day, set()).add(school_id)
+    with transaction.atomic():
+        _lock_rollups()
+        for day, school_ids in by_day.items():
+            rollups = Q(day=day) & _school_q('school', school_ids)
+            SchoolDailyRollup.objects.filter(rollups).delete()
+            SchoolDailySubjectRollup.objects.filter(rollups).delete()
+
+            start = timezone.make_aware(datetime.combine(day, time.min))
+            end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+            results = Q(date_taken__gte=start, date_taken__lt=end) & _school_q('user__school', school_ids)
+            pair_stats, subject_stats, _ = _collect(
+                TestResult.objects.filter(results),
+                SubjectResult.objects.filter(test_result__in=TestResult.objects.filter(results)),
+                chunk_size,
+            )
+            _save_stats(pair_stats, subject_stats, chunk_size)
+
+
+def forget_results(test_results):
+    """
+    Пересчитывает сводки по дням удаляемых результатов после фиксации удаления.
+    Вызывается в транзакции удаления, до самого удаления.
+    """
+    school_days = {
+        (school_id, timezone.localdate(date_taken))
+        for school_id, date_taken in test_results.values_list('user__school_id', 'date_taken').iterator()
+    }
+    if school_days:
+        transaction.on_commit(lambda: refresh_rollups(school_days))
@@ -12,7 +12,9 @@ class AnswerSerializer(serializers.ModelSerializer):
 class MatchingPairSerializer(serializers.ModelSerializer):
     class Meta:
         model = MatchingPair
-        fields = '__all__'
+        # Без correct_for_left_*: правильные ответы фронт получает только после отправки (correct_answers)
+        fields = ['id', 'question', 'left_side_1', 'left_side_2', 'right_option_1', 'right_option_2',
+                  'right_option_3', 'right_option_4']
 
 class QuestionSerializer(serializers.ModelSerializer):
     answers = AnswerSerializer(many=True, read_only=True)
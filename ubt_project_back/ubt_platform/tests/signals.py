@@ -0,0 +1,80 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import content_versions
+from .admin_filters import invalidate_facets
+from .authentication import token_cache
+from .caching import invalidate_on_change
+from .inline_images import extract_instance_images
+from .models import Subject, Question, Answer, MatchingPair, CustomUser, School, TestResult
+from .variant_registry import registry_cache
+
+
+def _subject_id_for_question(question_id):
+    return Question.objects.filter(pk=question_id).values_list('subject_id', flat=True).first()
+
+
+# Любая правка варианта (в том числе через вложенные инлайны админки)
+# меняет его версию, и кэши во всех процессах пересобирают его при следующем запросе.
+@receiver([post_save, post_delete], sender=Subject)
+def subject_changed(sender, instance, **kwargs):
+    content_versions.bump(instance.pk)
+
+
+# Реестр активных вариантов для generate_test
+invalidate_on_change(registry_cache, Subject)
+
+
+# Вопрос (или ответ) могли перенести в другой вариант: старый вариант тоже пересобирается
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    content_versions.bump(instance.subject_id)
+    if getattr(instance, '_previous_subject_id', None) not in (None, instance.subject_id):
+        content_versions.bump(instance._previous_subject_id)
+
+
+@receiver([post_save, post_delete], sender=Answer)
+@receiver([post_save, post_delete], sender=MatchingPair)
+def question_part_changed(sender, instance, **kwargs):
+    subject_id = _subject_id_for_question(instance.question_id)
+    content_versions.bump(subject_id)
+    if getattr(instance, '_previous_subject_id', None) not in (None, subject_id):
+        content_versions.bump(instance._previous_subject_id)
+
+
+# Количества в фильтрах админки. Новые результаты сброс не вызывают
+# (их слишком много), они учитываются по истечении ADMIN_FACET_CACHE_TIMEOUT.
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver(post_delete, sender=School)
+def users_changed(sender, instance, **kwargs):
+    invalidate_facets(CustomUser, TestResult)
+
+
+@receiver(post_delete, sender=TestResult)
+def test_result_deleted(sender, instance, **kwargs):
+    invalidate_facets(TestResult)
+
+
+# Кэш токенов: удалённый токен и изменённый (например, деактивированный) пользователь
+# перестают действовать сразу
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, **kwargs):
+    token_cache.invalidate_users([instance.pk])
+
+
+# Встроенные base64-картинки выносятся в файлы до записи в базу
+# и запоминается прежний вариант изменяемой записи
+@receiver(pre_save, sender=Question)
+@receiver(pre_save, sender=Answer)
+@receiver(pre_save, sender=MatchingPair)
+def extract_content_images(sender, instance, **kwargs):
+    extract_instance_images(instance)
+    if instance.pk is not None:
+        field = 'subject_id' if sender is Question else 'question__subject_id'
+        instance._previous_subject_id = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core import signing
+
+from .exam_sessions import current_subject_ids
+from .grading import restrict_answers
+from .models import SubjectResult
+
+# Тикет выданного теста: generate_test отдаёт его в заголовке ответа,
+# клиент возвращает в том же заголовке вместе с ответами
+TICKET_HEADER = 'X-Test-Ticket'
+SALT = 'tests.test_ticket'
+
+
+def issue_ticket(user, subject_ids):
+    """Подписанный тикет: id ученика и выданных вариантов, время выдачи. В базу ничего не пишется."""
+    return signing.dumps([user.pk, list(subject_ids)], salt=SALT, compress=True)
+
+
+def ticket_subject_ids(ticket, user):
+    """id вариантов из тикета или None, если подпись неверна, срок TEST_TICKET_MAX_AGE истёк или тикет чужой."""
+    try:
+        user_id, subject_ids = signing.loads(ticket, salt=SALT, max_age=settings.TEST_TICKET_MAX_AGE)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if user_id != user.pk:
+        return None
+    return subject_ids
+
+
+def ticket_answers(request, answers):
+    """
+    Ответы, ограниченные вариантами из тикета: (ответы, None) или (None, ошибка).
+    Без тикета ответы принимаются как раньше, если не включён TEST_TICKET_REQUIRED.
+    """
+    ticket = request.headers.get(TICKET_HEADER)
+    if ticket is None:
+        if settings.TEST_TICKET_REQUIRED:
+            return None, 'Test ticket required.'
+        return answers, None
+
+    subject_ids = ticket_subject_ids(ticket, request.user)
+    if subject_ids is None:
+        return None, 'Invalid or expired test ticket.'
+    return restrict_answers(answers, subject_ids)
+
+
+def variant_issued(request, subject_id):
+    """
+    Выдавался ли вариант ученику: в тикете из заголовка, на текущем экзамене
+    или в одном из его результатов (разбор после отправки).
+    """
+    ticket = request.headers.get(TICKET_HEADER)
+    if ticket is not None and subject_id in (ticket_subject_ids(ticket, request.user) or ()):
+        return True
+    if SubjectResult.objects.filter(subject_id=subject_id, test_result__user=request.user).exists():
+        return True
+    return subject_id in (current_subject_ids(request.user) or ())
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .grading import grade_answers
+from .idempotency import discard_failed, find_submission
+from .models import SubmissionTicket
+from .results import save_test_result
+
+
+def enqueue(user, answers, idempotency_key=None):
+    """
+    Сохраняет сырые ответы в очередь и сразу возвращает тикет.
+    Повтор с тем же ключом (и одновременный тоже) получает уже созданный тикет,
+    тикет с ошибкой проверки заменяется новым.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return SubmissionTicket.objects.create(user=user, answers=answers, idempotency_key=idempotency_key)
+        except IntegrityError:
+            ticket = find_submission(user, idempotency_key)
+            if ticket is not None:
+                return ticket
+            if attempt or not discard_failed(user, idempotency_key):
+                raise
+
+
+def claim_batch(batch_size):
+    """
+    Забирает пачку тикетов из очереди.
+
+    На PostgreSQL строки блокируются через SKIP LOCKED, поэтому
+    несколько воркеров могут работать с очередью одновременно. Без SKIP LOCKED (SQLite)
+    два воркера могут выбрать одни и те же id — каждый получает только те тикеты,
+    которые перевёл в работу именно он (claimed_at — метка захвата).
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        queryset = SubmissionTicket.objects.filter(status=SubmissionTicket.PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        SubmissionTicket.objects.filter(id__in=ids, status=SubmissionTicket.PENDING).update(
+            status=SubmissionTicket.PROCESSING,
+            claimed_at=claimed_at,
+            attempts=F('attempts') + 1,
+        )
+    return list(SubmissionTicket.objects.filter(
+        id__in=ids, status=SubmissionTicket.PROCESSING, claimed_at=claimed_at
+    ).select_related('user').order_by('id'))
+
+
+class _ClaimLost(Exception):
+    """Тикет вернули в очередь или забрал другой воркер, пока этот его проверял."""
+
+
+def _claimed(ticket):
+    return SubmissionTicket.objects.filter(
+        pk=ticket.pk, status=SubmissionTicket.PROCESSING, claimed_at=ticket.claimed_at
+    )
+
+
+def process_ticket(ticket):
+    """
+    Проверяет один тикет и сохраняет результат. Возвращает True при успехе.
+    Результат записывается, только если тикет всё ещё за этим воркером, иначе откатывается:
+    те же ответы не проверяются дважды.
+    """
+    try:
+        grading = grade_answers(ticket.answers)
+        with transaction.atomic():
+            test_result = save_test_result(ticket.user, grading)
+            if not _claimed(ticket).update(
+                test_result=test_result, correct_answers=grading.correct_answers,
+                status=SubmissionTicket.DONE, processed_at=timezone.now(), error='',
+            ):
+                raise _ClaimLost
+    except _ClaimLost:
+        return True
+    except Exception as e:
+        _claimed(ticket).update(
+            status=SubmissionTicket.FAILED,
+            processed_at=timezone.now(),
+            error=repr(e),
+        )
+        return False
+    return True
+
+
+def process_batch(batch_size):
+    """Обрабатывает одну пачку. Возвращает (обработано, с ошибкой)."""
+    tickets = claim_batch(batch_size)
+    failed = 0
+    for ticket in tickets:
+        if not process_ticket(ticket):
+            failed += 1
+    return len(tickets), failed
+
+
+def requeue_stale(timeout_seconds):
+    """Возвращает в очередь тикеты, которые взял и не закончил упавший воркер."""
+    threshold = timezone.now() - timedelta(seconds=timeout_seconds)
+    return SubmissionTicket.objects.filter(
+        status=SubmissionTicket.PROCESSING, claimed_at__lt=threshold
+    ).update(status=SubmissionTicket.PENDING)
+
+
+def queue_stats(window_seconds=60):
+    """Глубина очереди и пропускная способность за последние window_seconds."""
+    now = timezone.now()
+    by_status = dict(
+        SubmissionTicket.objects.values_list('status').annotate(count=Count('id')).order_by()
+    )
+    oldest_pending = SubmissionTicket.objects.filter(
+        status=SubmissionTicket.PENDING
+    ).aggregate(oldest=Min('created_at'))['oldest']
+    processed_recently = SubmissionTicket.objects.filter(
+        status=SubmissionTicket.DONE, processed_at__gte=now - timedelta(seconds=window_seconds)
+    ).count()
+    return {
+        'pending': by_status.get(SubmissionTicket.PENDING, 0),
+        'processing': by_status.get(SubmissionTicket.PROCESSING, 0),
+        'done': by_status.get(SubmissionTicket.DONE, 0),
+        'failed': by_status.get(SubmissionTicket.FAILED, 0),
+        'oldest_pending_age': (now - oldest_pending).total_seconds() if oldest_pending else 0,
+        'processed_per_second': processed_recently / window_seconds,
+    }
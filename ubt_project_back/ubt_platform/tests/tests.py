@@ -1,9 +1,52 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from .models import CustomUser, Subject
+from .admin import TestResultAdmin
+from .answer_keys import answer_key_index
+from .authentication import TokenCache, token_cache
+from .caching import TwoTierCache
+from .async_views import AsyncGenerateTestView, AsyncSubmitAnswersView
+from .export_jobs import claim_job, run_job
+from .exam_sessions import access_code, claim_session, run_session
+from .exports import build_results_file, school_results
+from .grading import GradingResult, grade_answers
+from .idempotency import IDEMPOTENCY_HEADER, save_graded
+from .models import CustomUser, Subject, Question, Answer, MatchingPair, TestResult, SubjectResult, \
+    SubmissionTicket, School, ExportJob, SchoolDailyRollup, SchoolDailySubjectRollup, UserImport, \
+    ExamSession, ExamAssignment
+from .rate_limit import TokenBucketStore, throttle_store
+from .results import save_test_result, result_payload
+from .rollups import rebuild_rollups, subject_pair_key
+from .serializers import SubjectSerializer, TestResultSerializer
+from .signed_tickets import TICKET_HEADER, issue_ticket
+from .submission_queue import claim_batch, enqueue, process_batch, process_ticket, queue_stats, requeue_stale
+from .user_import import claim_import, import_users, run_import
+from .user_lifecycle import apply_user_action, claim_lifecycle_job, run_lifecycle_job
+from .variant_cache import variant_cache
+from .variant_registry import pick_variants
 
 
 class AuthTests(TestCase):
@@ -86,4 +129,1158 @@ class SubmitAnswersTests(TestCase):
                 "1": {}
             }
         }, format='json')
-        assert True
\ No newline at end of file
+        assert True
+
+    def test_non_object_body_rejected(self):
+        response = self.client.post(reverse('submit_answers'), [{"answers": {}}], format='json', secure=True)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('submit_answers'), {"answers": ["1"]}, format='json', secure=True)
+        self.assertEqual(response.status_code, 400)
+
+class VariantPayloadCacheTests(TestCase):
+    def setUp(self):
+        variant_cache.clear()
+        self.subject = Subject.objects.create(name='HIS', variant=1, is_active=True)
+        self.question = Question.objects.create(subject=self.subject, text='Q1', question_type='SC')
+        self.answer = Answer.objects.create(question=self.question, text='A1', is_correct=True)
+
+    def test_warm_variant_does_no_queries(self):
+        variant_cache.get(self.subject.id)
+        with self.assertNumQueries(0):
+            payload = variant_cache.get(self.subject.id)
+        self.assertEqual(payload.data, SubjectSerializer(self.subject).data)
+        self.assertEqual(json.loads(payload.body), payload.data)
+        self.assertEqual(variant_cache.stats()['hits'], 1)
+        self.assertEqual(variant_cache.stats()['misses'], 1)
+
+    def test_nested_edit_invalidates_variant(self):
+        variant_cache.get(self.subject.id)
+        self.answer.text = 'A1 edited'
+        self.answer.save()
+        payload = variant_cache.get(self.subject.id)
+        self.assertEqual(payload.data['questions'][0]['answers'][0]['text'], 'A1 edited')
+        self.assertEqual(variant_cache.stats()['rebuilds'], 1)
+
+    def test_moved_question_leaves_old_variant(self):
+        other = Subject.objects.create(name='HIS', variant=2, is_active=True)
+        variant_cache.get_many([self.subject.id, other.id])
+        answer_key_index.warm([self.subject.id])
+        self.question.subject = other
+        self.question.save()
+        self.assertEqual(variant_cache.get(self.subject.id).data['questions'], [])
+        self.assertEqual(len(variant_cache.get(other.id).data['questions']), 1)
+        self.assertNotIn(self.question.id, answer_key_index.get_many([self.subject.id])[self.subject.id].keys)
+
+    def test_generate_test_serves_cached_payload(self):
+        client = APIClient()
+        user = CustomUser.objects.create_user(full_name="Test User", iin="123456789013")
+        client.force_authenticate(user=user)
+        for code in ('RL', 'ML'):
+            Subject.objects.create(name=code, variant=1, is_active=True)
+        response = client.post(reverse('generate_test'), {"selected_subjects": []}, format='json', secure=True)
+        self.assertEqual(response.status_code, 200)
+        test = json.loads(response.content)['test']
+        self.assertEqual([item['name'] for item in test], ['HIS', 'RL', 'ML'])
+
+    def test_generate_test_gzip_is_stitched_from_segments(self):
+        client = APIClient()
+        user = CustomUser.objects.create_user(full_name="Test User", iin="123456789013")
+        client.force_authenticate(user=user)
+        for code in ('RL', 'ML'):
+            Subject.objects.create(name=code, variant=1, is_active=True)
+        response = client.post(reverse('generate_test'), {"selected_subjects": []}, format='json', secure=True,
+                               headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        test = json.loads(gzip.decompress(response.content))['test']
+        self.assertEqual([item['name'] for item in test], ['HIS', 'RL', 'ML'])
+
+    def test_manifest_mode_and_question_bodies(self):
+        client = APIClient()
+        client.force_authenticate(user=CustomUser.objects.create_user(full_name="Test User", iin="123456789013"))
+        for code in ('RL', 'ML'):
+            Subject.objects.create(name=code, variant=1, is_active=True)
+        response = client.post(reverse('generate_test') + '?mode=manifest', {"selected_subjects": []},
+                               format='json', secure=True)
+        manifest = json.loads(response.content)['test'][0]
+        self.assertEqual(manifest['name'], 'HIS')
+        self.assertNotIn('text', manifest['questions'][0])
+
+        # Новый процесс: вариант собирается по id из адреса
+        variant_cache.clear()
+        response = APIClient().get(manifest['questions_url'], secure=True)
+        self.assertIn('immutable', response['Cache-Control'])
+        question = json.loads(response.content)['questions'][0]
+        self.assertEqual(question, SubjectSerializer(self.subject).data['questions'][0])
+
+        url = reverse('question_bodies') + f'?s={self.subject.id}&h='
+        self.assertEqual(APIClient().get(url + '0' * 32, secure=True).status_code, 404)
+        self.assertEqual(APIClient().get(reverse('question_bodies') + '?h=' + '0' * 32, secure=True).status_code, 400)
+
+        # После правки старые хэши не отдаются
+        old_hash = manifest['questions'][0]['hash']
+        self.question.text = 'Q1 edited'
+        self.question.save()
+        self.assertEqual(APIClient().get(url + old_hash, secure=True).status_code, 404)
+
+        # Неактивный вариант не собирается даже по верному хэшу
+        new_hash = json.loads(client.post(
+            reverse('generate_test') + '?mode=manifest', {"selected_subjects": []}, format='json', secure=True
+        ).content)['test'][0]['questions'][0]['hash']
+        self.subject.is_active = False
+        self.subject.save()
+        variant_cache.clear()
+        with mock.patch.object(variant_cache, 'get') as get:
+            self.assertEqual(APIClient().get(url + new_hash, secure=True).status_code, 404)
+        get.assert_not_called()
+
+    def test_variant_etag_and_not_modified(self):
+        client = APIClient()
+        user = CustomUser.objects.create_user(full_name="Test User", iin="123456789013")
+        client.force_authenticate(user=user)
+        url = reverse('variant', args=[self.subject.id])
+        # Вариант отдаётся только тому, кому он выдан
+        self.assertEqual(client.get(url, secure=True).status_code, 404)
+
+        headers = {'Accept-Encoding': 'gzip', TICKET_HEADER: issue_ticket(user, [self.subject.id])}
+        response = client.get(url, secure=True, headers=headers)
+        self.assertEqual(json.loads(gzip.decompress(response.content)), SubjectSerializer(self.subject).data)
+        etag = response['ETag']
+
+        response = client.get(url, secure=True, headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.answer.text = 'A1 edited'
+        self.answer.save()
+        response = client.get(url, secure=True, headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class GradingTests(TestCase):
+    def setUp(self):
+        answer_key_index.clear()
+        self.subject = Subject.objects.create(name='HIS', variant=1, is_active=True)
+        self.sc = Question.objects.create(subject=self.subject, text='SC', question_type='SC')
+        self.sc_wrong = Answer.objects.create(question=self.sc, text='wrong', is_correct=False)
+        self.sc_right = Answer.objects.create(question=self.sc, text='right', is_correct=True)
+        self.mc = Question.objects.create(subject=self.subject, text='MC', question_type='MC')
+        self.mc_right = [
+            Answer.objects.create(question=self.mc, text=f'right {i}', is_correct=True) for i in range(2)
+        ]
+        Answer.objects.create(question=self.mc, text='wrong', is_correct=False)
+        self.mt = Question.objects.create(subject=self.subject, text='MT', question_type='MT')
+        MatchingPair.objects.create(
+            question=self.mt, left_side_1='l1', left_side_2='l2',
+            right_option_1='r1', right_option_2='r2', right_option_3='r3', right_option_4='r4',
+            correct_for_left_1=3, correct_for_left_2=1,
+        )
+
+    def answers(self):
+        return {
+            str(self.subject.id): {
+                str(self.sc.id): [str(self.sc_right.id)],
+                str(self.mc.id): [answer.id for answer in reversed(self.mc_right)],
+                str(self.mt.id): {'left_side_1': '3', 'left_side_2': '1'},
+            },
+            '999999': {'1': []},
+            'bad': {},
+        }
+
+    def test_point_rules_and_correct_answers_shape(self):
+        result = grade_answers(self.answers())
+        self.assertEqual(result.total_score, 5)
+        self.assertEqual(result.subject_scores, [(self.subject.id, 5)])
+        correct = result.correct_answers[self.subject.id]
+        self.assertEqual(correct[self.sc.id], {'question_type': 'SC', 'correct_answers': [self.sc_right.id]})
+        self.assertEqual(sorted(correct[self.mc.id]['correct_answers']), sorted(a.id for a in self.mc_right))
+        self.assertEqual(correct[self.mt.id]['correct_answers'], {'left_side_1': 3, 'left_side_2': 1})
+
+    def test_issued_variant_hides_matching_keys(self):
+        questions = SubjectSerializer(self.subject).data['questions']
+        pair = next(question for question in questions if question['id'] == self.mt.id)['matching_pairs'][0]
+        self.assertNotIn('correct_for_left_1', pair)
+        self.assertNotIn('correct_for_left_2', pair)
+
+    def test_wrong_answers_score_zero(self):
+        answers = {
+            str(self.subject.id): {
+                str(self.sc.id): [str(self.sc_wrong.id)],
+                str(self.mc.id): [self.mc_right[0].id],
+                str(self.mt.id): {'left_side_1': '1', 'left_side_2': ''},
+            }
+        }
+        self.assertEqual(grade_answers(answers).total_score, 0)
+
+    def test_query_count_does_not_grow_with_questions(self):
+        answers = self.answers()
+        for i in range(20):
+            question = Question.objects.create(subject=self.subject, text=f'extra {i}', question_type='SC')
+            answers[str(self.subject.id)][str(question.id)] = []
+        with self.assertNumQueries(4):
+            grade_answers(answers)
+
+    def test_warm_answer_keys_need_no_queries(self):
+        answer_key_index.warm()
+        answers = self.answers()
+        del answers['999999']
+        with self.assertNumQueries(0):
+            result = grade_answers(answers)
+        self.assertEqual(result.total_score, 5)
+
+    def test_answer_key_edit_invalidates_index(self):
+        answer_key_index.warm()
+        self.sc_wrong.is_correct = True
+        self.sc_wrong.save()
+        self.sc_right.is_correct = False
+        self.sc_right.save()
+        self.assertEqual(grade_answers(self.answers()).total_score, 4)
+        self.assertEqual(answer_key_index.stats()['rebuilds'], 1)
+
+    def test_question_from_other_variant_falls_back_to_database(self):
+        other = Subject.objects.create(name='RL', variant=1, is_active=True)
+        answers = {str(other.id): {str(self.sc.id): [str(self.sc_right.id)]}}
+        self.assertEqual(grade_answers(answers).total_score, 1)
+
+    def test_submit_answers_view(self):
+        client = APIClient()
+        user = CustomUser.objects.create_user(full_name="Test User", iin="123456789014")
+        client.force_authenticate(user=user)
+        response = client.post(reverse('submit_answers'), {'answers': self.answers()}, format='json', secure=True)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_score'], 5)
+        self.assertEqual(data['subject_results'][0]['score'], 5)
+        self.assertIn(str(self.sc.id), data['correct_answers'][str(self.subject.id)])
+
+
+class SaveTestResultTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(full_name="Test User", iin="123456789015")
+        self.subjects = [Subject.objects.create(name=code, variant=1) for code in ('HIS', 'RL', 'ML')]
+        self.grading = GradingResult([(subject.id, 3) for subject in self.subjects], {}, 9)
+
+    def test_result_and_subject_scores_are_written_together(self):
+        test_result = save_test_result(self.user, self.grading)
+        test_result.refresh_from_db()
+        self.assertEqual(test_result.total_score, 9)
+        self.assertEqual(
+            sorted(test_result.subject_results.values_list('subject_id', 'score')),
+            sorted((subject.id, 3) for subject in self.subjects),
+        )
+
+    def test_failure_leaves_no_zero_score_result(self):
+        with mock.patch.object(SubjectResult.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                save_test_result(self.user, self.grading)
+        self.assertFalse(TestResult.objects.filter(user=self.user).exists())
+
+    def test_payload_matches_serializer_without_reserializing_variants(self):
+        test_result = save_test_result(self.user, self.grading)
+        test_result = TestResult.objects.select_related('user').get(pk=test_result.pk)
+        expected = TestResultSerializer(test_result).data
+        expected['correct_answers'] = {}
+        variant_cache.get_many([subject.id for subject in self.subjects])
+        with self.assertNumQueries(0):
+            payload = result_payload(test_result, {}, self.grading.subject_scores)
+        self.assertEqual(json.loads(json.dumps(payload)), json.loads(json.dumps(expected)))
+
+        compact = result_payload(test_result, {}, compact=True)
+        self.assertEqual(compact['subject_results'][0], {
+            'subject': {'id': self.subjects[0].id, 'name': 'HIS', 'variant': 1}, 'score': 3,
+        })
+
+
+@override_settings(DEFERRED_GRADING=True)
+class DeferredGradingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(full_name="Test User", iin="123456789016")
+        self.client.force_authenticate(user=self.user)
+        self.subject = Subject.objects.create(name='HIS', variant=1, is_active=True)
+        self.question = Question.objects.create(subject=self.subject, text='SC', question_type='SC')
+        self.answer = Answer.objects.create(question=self.question, text='right', is_correct=True)
+
+    def submit(self):
+        answers = {str(self.subject.id): {str(self.question.id): [str(self.answer.id)]}}
+        return self.client.post(reverse('submit_answers'), {'answers': answers}, format='json', secure=True,
+                                headers={TICKET_HEADER: issue_ticket(self.user, [self.subject.id])})
+
+    def test_submit_returns_ticket_and_worker_grades_it(self):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        ticket = response.json()['ticket']
+        self.assertFalse(TestResult.objects.exists())
+
+        result_url = reverse('submission_result', args=[ticket])
+        self.assertEqual(self.client.get(result_url, secure=True).status_code, 202)
+        self.assertEqual(queue_stats()['pending'], 1)
+
+        self.assertEqual(process_batch(10), (1, 0))
+
+        response = self.client.get(result_url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['status'], SubmissionTicket.DONE)
+        self.assertEqual(data['total_score'], 1)
+        self.assertEqual(data['correct_answers'][str(self.subject.id)][str(self.question.id)]['correct_answers'],
+                         [self.answer.id])
+        self.assertEqual(queue_stats()['pending'], 0)
+
+    def test_ticket_is_visible_only_to_its_owner(self):
+        ticket = self.submit().json()['ticket']
+        other = CustomUser.objects.create_user(full_name="Other User", iin="123456789017")
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('submission_result', args=[ticket]), secure=True)
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_tickets_are_requeued(self):
+        self.submit()
+        claim_batch(10)
+        SubmissionTicket.objects.update(claimed_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(requeue_stale(60), 1)
+        self.assertEqual(SubmissionTicket.objects.get().status, SubmissionTicket.PENDING)
+
+    def test_slow_worker_does_not_grade_requeued_ticket_twice(self):
+        self.submit()
+        [stale] = claim_batch(10)
+        SubmissionTicket.objects.update(claimed_at=timezone.now() - timedelta(minutes=10))
+        requeue_stale(60)
+        # Тикет забрал второй воркер, повторно его не забрать
+        [fresh] = claim_batch(10)
+        self.assertEqual(claim_batch(10), [])
+
+        # Медленный воркер досчитал после возврата в очередь: его результат откатывается
+        self.assertTrue(process_ticket(stale))
+        self.assertFalse(TestResult.objects.exists())
+        self.assertTrue(process_ticket(fresh))
+        self.assertEqual(TestResult.objects.count(), 1)
+        self.assertEqual(SubmissionTicket.objects.get().status, SubmissionTicket.DONE)
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        variant_cache.clear()
+        answer_key_index.clear()
+        self.factory = AsyncRequestFactory()
+        self.user = CustomUser.objects.create_user(full_name="Test User", iin="123456789018")
+        self.token = Token.objects.create(user=self.user)
+        self.subjects = [Subject.objects.create(name=code, variant=1, is_active=True) for code in ('HIS', 'RL', 'ML')]
+        self.question = Question.objects.create(subject=self.subjects[0], text='SC', question_type='SC')
+        self.answer = Answer.objects.create(question=self.question, text='right', is_correct=True)
+
+    def post(self, data, token=True, headers=None):
+        headers = {**({'Authorization': f'Token {self.token.key}'} if token else {}), **(headers or {})}
+        return self.factory.post('/api/', data, content_type='application/json', headers=headers)
+
+    async def test_generate_test(self):
+        response = await AsyncGenerateTestView.as_view()(self.post({'selected_subjects': []}))
+        self.assertEqual(response.status_code, 200)
+        test = json.loads(response.content)['test']
+        self.assertEqual([item['name'] for item in test], ['HIS', 'RL', 'ML'])
+
+    async def test_requires_token(self):
+        response = await AsyncGenerateTestView.as_view()(self.post({'selected_subjects': []}, token=False))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_submit_answers(self):
+        answers = {str(self.subjects[0].id): {str(self.question.id): [str(self.answer.id)]}}
+        ticket = issue_ticket(self.user, [subject.id for subject in self.subjects])
+        response = await AsyncSubmitAnswersView.as_view()(
+            self.post({'answers': answers}, headers={TICKET_HEADER: ticket})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['total_score'], 1)
+        self.assertEqual(await TestResult.objects.filter(user=self.user).acount(), 1)
+
+    async def test_non_object_body_rejected(self):
+        for view in (AsyncGenerateTestView, AsyncSubmitAnswersView):
+            response = await view.as_view()(self.post([{'answers': {}}]))
+            self.assertEqual(response.status_code, 400)
+
+
+class ResultsExportTests(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name='Школа №1')
+        subjects = {code: Subject.objects.create(name=code, variant=1) for code in ('HIS', 'RL', 'ML', 'BIO', 'CHE')}
+        for i, name in enumerate(['Алиев Алихан Алиевич', 'Бек']):
+            user = CustomUser.objects.create_user(full_name=name, iin=f'10000000000{i}', school=self.school)
+            save_test_result(user, GradingResult([(subject.id, 5) for subject in subjects.values()], {}, 25))
+
+    def test_export_data_is_gathered_in_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            test_results = school_results(self.school.id, timezone.localdate())
+            build_results_file(test_results)
+        self.assertEqual(len(test_results), 2)
+
+    def test_only_best_result_per_user(self):
+        user = CustomUser.objects.get(iin='100000000000')
+        save_test_result(user, GradingResult([], {}, 1))
+        test_results = school_results(self.school.id, timezone.localdate())
+        self.assertEqual(sorted(tr.total_score for tr in test_results), [25, 25])
+
+    def test_range_keeps_best_result_per_user_and_day(self):
+        user = CustomUser.objects.get(iin='100000000000')
+        yesterday = timezone.now() - timedelta(days=1)
+        for score in (7, 3):
+            test_result = save_test_result(user, GradingResult([], {}, score))
+            TestResult.objects.filter(pk=test_result.pk).update(date_taken=yesterday)
+        today = timezone.localdate()
+        test_results = school_results(self.school.id, today - timedelta(days=1), today)
+        self.assertEqual(sorted(tr.total_score for tr in test_results if tr.user_id == user.id), [7, 25])
+        self.assertEqual(len(test_results), 3)
+
+    def test_workbook_layout(self):
+        workbook = load_workbook(build_results_file(school_results(self.school.id, timezone.localdate())))
+        self.assertEqual(workbook.sheetnames, ['BIO+CHE'])
+        ws = workbook['BIO+CHE']
+        self.assertEqual([cell.value for cell in ws[1]][:4],
+                         ["Название школы", "Имя пользователя", "Общий балл", "Дата прохождения"])
+        self.assertEqual(ws.max_row, 3)
+        self.assertTrue(ws['A1'].font.b)
+        self.assertTrue(ws['B2'].font.b)
+        self.assertEqual(ws.column_dimensions['B'].width, len('Алиев Алихан Алиевич') + 2)
+        self.assertEqual(ws.column_dimensions['A'].width, len("Название школы") + 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.schools = [School.objects.create(name=f'Школа {i}') for i in range(3)]
+        subject = Subject.objects.create(name='HIS', variant=1)
+        for i, school in enumerate(self.schools[:2]):
+            user = CustomUser.objects.create_user(full_name=f'Ученик {i}', iin=f'20000000000{i}', school=school)
+            save_test_result(user, GradingResult([(subject.id, 10)], {}, 10))
+        self.job = ExportJob.objects.create(date_from=timezone.localdate(), date_to=timezone.localdate())
+        self.job.schools.set(self.schools)
+
+    def test_job_builds_one_file_per_school(self):
+        job = claim_job()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+        self.assertEqual(job.total, 3)
+        self.assertTrue(run_job(job, workers=1))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.completed), (ExportJob.DONE, 3))
+        files = {job_file.school_id: job_file for job_file in job.files.all()}
+        self.assertEqual(files[self.schools[0].id].rows, 1)
+        self.assertFalse(files[self.schools[2].id].file)
+        with files[self.schools[0].id].file.open('rb') as fileobj:
+            self.assertEqual(load_workbook(fileobj).sheetnames, ['Без доп. предметов'])
+        self.assertIsNone(claim_job())
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        answer_key_index.clear()
+        self.school = School.objects.create(name='Школа')
+        self.subjects = {code: Subject.objects.create(name=code, variant=1) for code in ('HIS', 'RL', 'ML', 'BIO', 'CHE')}
+        self.users = []
+        for i, scores in enumerate([(10, 20), (30, 5), (4, 4)]):
+            user = CustomUser.objects.create_user(full_name=f'Ученик {i}', iin=f'40000000000{i}', school=self.school)
+            subject_scores = [(self.subjects['HIS'].id, scores[0]), (self.subjects['BIO'].id, scores[1]),
+                              (self.subjects['CHE'].id, 0)]
+            # Сводки обновляются после фиксации транзакции
+            with self.captureOnCommitCallbacks(execute=True):
+                save_test_result(user, GradingResult(subject_scores, {}, sum(scores)))
+            self.users.append(user)
+
+    def rollup_values(self):
+        return (
+            list(SchoolDailyRollup.objects.values_list(
+                'school_id', 'day', 'subject_pair', 'count', 'score_sum', 'score_sum_sq', 'score_min', 'score_max'
+            )),
+            sorted(SchoolDailySubjectRollup.objects.values_list(
+                'school_id', 'day', 'subject', 'count', 'score_sum', 'score_sum_sq', 'score_min', 'score_max'
+            )),
+        )
+
+    def test_rollups_are_updated_when_result_is_saved(self):
+        rollup = SchoolDailyRollup.objects.get()
+        self.assertEqual((rollup.school_id, rollup.subject_pair), (self.school.id, 'BIO+CHE'))
+        self.assertEqual((rollup.count, rollup.score_min, rollup.score_max), (3, 8, 35))
+        self.assertAlmostEqual(rollup.mean, (30 + 35 + 8) / 3)
+        his = SchoolDailySubjectRollup.objects.get(subject='HIS')
+        self.assertEqual((his.count, his.score_sum, his.score_sum_sq), (3, 44, 100 + 900 + 16))
+
+    def test_every_optional_subject_fits_subject_pair(self):
+        optional = [code for code, _ in Subject.SUBJECT_CHOICES if code not in ('HIS', 'RL', 'ML')]
+        max_length = SchoolDailyRollup._meta.get_field('subject_pair').max_length
+        self.assertLessEqual(len(subject_pair_key(optional)), max_length)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = self.rollup_values()
+        self.assertEqual(rebuild_rollups(chunk_size=2), 3)
+        self.assertEqual(self.rollup_values(), incremental)
+
+    def test_rollups_wait_for_commit(self):
+        user = CustomUser.objects.create_user(full_name='Ученик 3', iin='400000000003', school=self.school)
+        with self.captureOnCommitCallbacks() as callbacks:
+            save_test_result(user, GradingResult([(self.subjects['HIS'].id, 7)], {}, 7))
+        self.assertEqual(SchoolDailySubjectRollup.objects.get(subject='HIS').count, 3)
+        callbacks[0]()
+        self.assertEqual(SchoolDailySubjectRollup.objects.get(subject='HIS').count, 4)
+
+    def test_deleted_results_leave_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_user_action('delete', [self.users[1].iin])
+        rollup = SchoolDailyRollup.objects.get()
+        self.assertEqual((rollup.count, rollup.score_min, rollup.score_max), (2, 8, 30))
+
+        admin_user = CustomUser.objects.create_superuser(full_name='Админ', iin='400000000099', password='pass')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:tests_testresult_changelist'), {
+                'action': 'delete_selected', 'post': 'yes',
+                '_selected_action': list(TestResult.objects.filter(user=self.users[0]).values_list('pk', flat=True)),
+            }, secure=True)
+        rollup = SchoolDailyRollup.objects.get()
+        self.assertEqual((rollup.count, rollup.score_min, rollup.score_max), (1, 8, 8))
+        self.assertEqual(SchoolDailySubjectRollup.objects.get(subject='HIS').score_sum, 4)
+
+
+class TestResultChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(full_name='Админ', iin='500000000000', password='pass')
+        self.client.force_login(self.admin)
+        school = School.objects.create(name='Школа')
+        for i in range(5):
+            user = CustomUser.objects.create_user(full_name=f'Ученик {i}', iin=f'50000000001{i}', school=school)
+            save_test_result(user, GradingResult([], {}, i))
+        self.url = reverse('admin:tests_testresult_changelist')
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url, secure=True)
+        for i in range(5, 15):
+            user = CustomUser.objects.create_user(full_name=f'Ученик {i}', iin=f'5000000001{i:02d}')
+            save_test_result(user, GradingResult([], {}, i))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(large), len(small))
+
+    def test_keyset_paging(self):
+        with mock.patch.object(TestResultAdmin, 'list_per_page', 2):
+            seen = []
+            url = self.url
+            while url:
+                response = self.client.get(url, secure=True)
+                self.assertEqual(response.status_code, 200)
+                seen.extend(obj.pk for obj in response.context['cl'].result_list)
+                next_url = response.context.get('keyset_next_url')
+                url = self.url + next_url if next_url else None
+        expected = list(TestResult.objects.order_by('-date_taken', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+
+class AdminFilterTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(full_name='Админ', iin='600000000000', password='pass')
+        self.client.force_login(self.admin)
+        self.school = School.objects.create(name='Школа')
+        self.ivanov = CustomUser.objects.create_user(full_name='Иванов Иван', iin='600000000001', school=self.school)
+        self.petrov = CustomUser.objects.create_user(full_name='Петров Пётр', iin='600000000002', school=self.school)
+        save_test_result(self.ivanov, GradingResult([], {}, 10))
+        save_test_result(self.petrov, GradingResult([], {}, 20))
+        self.url = reverse('admin:tests_customuser_changelist')
+
+    def test_input_filters(self):
+        response = self.client.get(self.url, {'iin': '600000000002'}, secure=True)
+        self.assertEqual(list(response.context['cl'].result_list), [self.petrov])
+        self.assertContains(response, 'name="full_name"')
+
+        response = self.client.get(self.url, {'full_name': 'Иван'}, secure=True)
+        self.assertEqual(list(response.context['cl'].result_list), [self.ivanov])
+
+        url = reverse('admin:tests_testresult_changelist')
+        response = self.client.get(url, {'iin': '600000000001'}, secure=True)
+        self.assertEqual([tr.user for tr in response.context['cl'].result_list], [self.ivanov])
+
+    def test_facet_counts_are_cached_and_invalidated(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url, secure=True)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url, secure=True)
+        self.assertLess(len(second), len(first))
+        self.assertContains(response, 'Школа (2)')
+
+        # Массовое действие админки идёт через update() без сигналов
+        self.client.post(self.url, {
+            'action': 'deactivate_selected_users', '_selected_action': [self.petrov.pk],
+        }, secure=True)
+        response = self.client.get(self.url, secure=True)
+        self.assertContains(response, 'Нет (1)')
+
+        CustomUser.objects.create_user(full_name='Сидоров', iin='600000000003', school=self.school)
+        response = self.client.get(self.url, secure=True)
+        self.assertContains(response, 'Школа (3)')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = CustomUser.objects.create_user(full_name='Ученик', iin='700000000001')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('submission_result', args=[uuid.uuid4()])
+
+    def get(self):
+        return self.client.get(self.url, secure=True)
+
+    def test_cached_token_costs_no_auth_queries(self):
+        self.assertEqual(self.get().status_code, status.HTTP_404_NOT_FOUND)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get().status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse([q for q in queries if 'authtoken_token' in q['sql']])
+
+    def test_deactivation_revokes_cached_token(self):
+        self.get()
+        admin_user = CustomUser.objects.create_superuser(full_name='Админ', iin='700000000000', password='pass')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:deactivate_users'), {'iin_list': self.user.iin}, secure=True)
+        self.client.logout()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_snapshot_read_before_invalidation_is_not_stored(self):
+        stamp = token_cache.stamp()
+        stale = (self.token.created, ['stale'])
+        token_cache.invalidate([self.token.key])
+        token_cache.set(self.token.key, stale, stamp)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+        # Снимок из другого процесса (своё поколение) не перезаписывает метку сброса в общем кэше
+        token_cache.set(self.token.key, stale, token_cache.stamp())
+        token_cache.clear()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_revocation_reaches_local_copies_of_other_processes(self):
+        self.assertEqual(self.get().status_code, status.HTTP_404_NOT_FOUND)
+        snapshot = token_cache.get(self.token.key)
+        other_processes = [TokenCache(), TokenCache()]
+        for other_process in other_processes:
+            other_process.set(self.token.key, snapshot, other_process.stamp())
+        self.assertIsNotNone(async_to_sync(other_processes[0].aget_local)(self.token.key))
+
+        token_cache.invalidate([self.token.key])
+        self.assertIsNone(async_to_sync(other_processes[0].aget_local)(self.token.key))
+        self.assertIsNone(other_processes[1].get(self.token.key))
+
+    def test_deleted_token_is_rejected(self):
+        self.get()
+        self.token.delete()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RateLimitTests(TestCase):
+    def test_bucket_is_shared_between_stores(self):
+        # Два хранилища на одном файле — как два воркера на узле
+        first, second = TokenBucketStore(), TokenBucketStore()
+        self.assertEqual(first.take('k', 2, 60), (True, None))
+        self.assertEqual(second.take('k', 2, 60), (True, None))
+        allowed, wait = first.take('k', 2, 60)
+        self.assertFalse(allowed)
+        self.assertTrue(0 < wait <= 30)
+        self.assertTrue(second.take('other', 2, 60)[0])
+
+    def test_generate_test_is_limited(self):
+        user = CustomUser.objects.create_user(full_name='Ученик', iin='800000000001')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with mock.patch('tests.views.GenerateTestView.post', return_value=HttpResponse(b'{}')):
+            codes = [client.post(reverse('generate_test'), {}, format='json', secure=True).status_code
+                     for _ in range(3)]
+            response = client.post(reverse('generate_test'), {}, format='json', secure=True)
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertIn('Retry-After', response.headers)
+
+
+    def test_login_is_limited_per_iin_not_per_school_address(self):
+        client = APIClient()
+        url = reverse('api_token_auth')
+
+        def login(iin, ip='10.0.0.1'):
+            return client.post(
+                url, {'iin': iin, 'password': 'x'}, format='json', secure=True, REMOTE_ADDR=ip
+            ).status_code
+
+        # Без PBKDF2, иначе корзина успевает пополниться
+        with mock.patch('tests.views.authenticate', return_value=None):
+            # Весь класс входит с одного адреса
+            self.assertEqual({login(f'8100000000{i:02}') for i in range(25)}, {400})
+            codes = [login('810000000000') for _ in range(20)]
+            # Подбор с чужого адреса не блокирует вход из школы
+            self.assertEqual(login('810000000000', ip='10.0.0.2'), 400)
+        self.assertEqual(codes[-1], 429)
+
+    def test_exam_login_is_not_locked_from_another_address(self):
+        client = APIClient()
+        url = reverse('exam_login')
+
+        def login(ip):
+            return client.post(
+                url, {'iin': '810000000001', 'code': 'x'}, format='json', secure=True, REMOTE_ADDR=ip
+            ).status_code
+
+        codes = [login('10.0.0.2') for _ in range(21)]
+        self.assertEqual(codes[-1], 429)
+        self.assertEqual(login('10.0.0.1'), 400)
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        self.cache = TwoTierCache('test:two_tier')
+
+    def test_single_flight(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 42
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_set('key', compute)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_shared_tier_and_invalidation(self):
+        self.assertIsNone(self.cache.get_or_set('key', lambda: None))
+        # Другой процесс: свой локальный уровень, общий кэш тот же
+        other = TwoTierCache('test:two_tier')
+        self.assertIsNone(other.get_or_set('key', lambda: 'пересчитано'))
+        self.assertEqual(other.stats()['shared_hits'], 1)
+
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get_or_set('key', lambda: 1), 1)
+        self.assertEqual(self.cache.stats()['hit_ratio'], 0)
+
+
+class VariantRegistryTests(TestCase):
+    def setUp(self):
+        self.active = Subject.objects.create(name='HIS', variant=1)
+        # Неактивный дубль того же варианта раньше ронял Subject.objects.get()
+        self.inactive = Subject.objects.create(name='HIS', variant=1, is_active=False)
+
+    def test_pick_costs_no_queries(self):
+        pick_variants(['HIS'])
+        with self.assertNumQueries(0):
+            self.assertEqual(pick_variants(['HIS', 'HIS']), ([self.active.id, self.active.id], None))
+        self.assertEqual(pick_variants(['HIS', 'MAT']), (None, 'MAT'))
+
+    def test_registry_follows_is_active(self):
+        pick_variants(['HIS'])
+        self.active.is_active = False
+        self.active.save()
+        self.inactive.is_active = True
+        self.inactive.save()
+        self.assertEqual(pick_variants(['HIS']), ([self.inactive.id], None))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class InlineImageTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='HIS', variant=1)
+        png = base64.b64encode(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64).decode()
+        self.html = f'<p>Рисунок: <img src="data:image/png;base64,{png}" style="width: 50%;"></p>'
+
+    def test_images_are_extracted_on_save_and_deduplicated(self):
+        question = Question.objects.create(subject=self.subject, text=self.html, question_type='SC')
+        answer = Answer.objects.create(question=question, text=self.html, is_correct=True)
+        self.assertNotIn('base64', question.text)
+        self.assertIn('src="https://api.oysana.site/media/content/', question.text)
+        # Одна и та же картинка — один файл
+        self.assertEqual(answer.text, question.text)
+
+    def test_svg_is_left_inline(self):
+        svg = base64.b64encode(b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>').decode()
+        html = f'<img src="data:image/svg+xml;base64,{svg}">'
+        question = Question.objects.create(subject=self.subject, text=html, question_type='SC')
+        self.assertEqual(question.text, html)
+
+    def test_backfill_command(self):
+        question = Question.objects.create(subject=self.subject, text='', question_type='SC')
+        # update() обходит сигналы, как старые записи до появления извлечения
+        Question.objects.filter(pk=question.pk).update(text=self.html)
+        call_command('extract_inline_images', stdout=io.StringIO())
+        question.refresh_from_db()
+        self.assertNotIn('base64', question.text)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UserImportTests(TestCase):
+    def setUp(self):
+        self.existing = CustomUser.objects.create_user(full_name='Старое ФИО', iin='900000000001')
+        self.existing.set_password('secret')
+        self.existing.save()
+
+    def test_csv_import_with_row_errors(self):
+        content = (
+            'ИИН;ФИО;Школа;Тип использования\n'
+            '900000000001;Новое ФИО;Школа 1;subscription\n'
+            '900000000002;Ученик Два;Школа 1;\n'
+            '12345;Короткий ИИН;;\n'
+            '900000000002;Повтор;;\n'
+            '900000000003;;;\n'
+        ).encode('cp1251')
+        report = import_users(io.BytesIO(content), 'users.csv')
+        self.assertEqual((report.created, report.updated), (1, 1))
+        self.assertEqual([error['row'] for error in report.errors], [4, 5, 6])
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.full_name, 'Новое ФИО')
+        self.assertEqual(self.existing.usage_type, 'subscription')
+        self.assertTrue(self.existing.check_password('secret'))
+
+        new_user = CustomUser.objects.get(iin='900000000002')
+        self.assertTrue(new_user.check_password('900000000002'))
+        self.assertEqual(new_user.school, self.existing.school)
+        self.assertEqual(School.objects.filter(name='Школа 1').count(), 1)
+
+    def test_missing_or_blank_columns_keep_existing_values(self):
+        school = School.objects.create(name='Школа 1')
+        CustomUser.objects.filter(pk=self.existing.pk).update(school=school, usage_type='subscription')
+        other = CustomUser.objects.create_user(full_name='Ученик Два', iin='900000000002', school=school)
+        content = (
+            'ИИН;ФИО;Школа;Тип использования\n'
+            '900000000001;Новое ФИО;;\n'
+            '900000000002;Ученик Два;Школа 2;\n'
+        ).encode('utf-8')
+        import_users(io.BytesIO(content), 'users.csv')
+        import_users(io.BytesIO('ИИН;ФИО\n900000000001;Новое ФИО\n'.encode('utf-8')), 'users.csv')
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.school, self.existing.usage_type), (school, 'subscription'))
+        other.refresh_from_db()
+        self.assertEqual(other.school.name, 'Школа 2')
+
+    def test_queued_xlsx_import(self):
+        wb = Workbook()
+        wb.active.append(['IIN', 'full_name'])
+        wb.active.append([900000000004, 'Ученик Четыре'])
+        fileobj = io.BytesIO()
+        wb.save(fileobj)
+        user_import = UserImport.objects.create(file=SimpleUploadedFile('users.xlsx', fileobj.getvalue()))
+
+        self.assertEqual(claim_import(), user_import)
+        self.assertTrue(run_import(user_import))
+        user_import.refresh_from_db()
+        self.assertEqual((user_import.status, user_import.created), (UserImport.DONE, 1))
+        self.assertTrue(CustomUser.objects.filter(iin='900000000004').exists())
+
+
+class UserLifecycleTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='HIS', variant=1)
+        self.students = []
+        for i in range(5):
+            user = CustomUser.objects.create_user(full_name=f'Выпускник {i}', iin=f'95000000000{i}')
+            save_test_result(user, GradingResult([(self.subject.id, 5)], {}, 5))
+            Token.objects.create(user=user)
+            SubmissionTicket.objects.create(user=user, answers={})
+            self.students.append(user)
+        self.admin = CustomUser.objects.create_superuser(full_name='Админ', iin='950000000099', password='pass')
+
+    def test_chunked_delete_cascades(self):
+        iins = [user.iin for user in self.students] + [self.admin.iin, '959999999999']
+        chunks = []
+        rebuild_rollups()
+        with self.captureOnCommitCallbacks(execute=True):
+            report = apply_user_action('delete', iins, chunk_size=2, progress=lambda *args: chunks.append(args))
+        self.assertEqual(report, (7, 5))
+        self.assertEqual(chunks, [(2, 2), (2, 2), (2, 1), (1, 0)])
+        self.assertEqual(list(CustomUser.objects.all()), [self.admin])
+        self.assertFalse(TestResult.objects.exists())
+        self.assertFalse(SubjectResult.objects.exists())
+        self.assertFalse(SubmissionTicket.objects.exists())
+        self.assertFalse(Token.objects.exists())
+        self.assertFalse(SchoolDailyRollup.objects.exists())
+
+    @override_settings(USER_LIFECYCLE_SYNC_LIMIT=2)
+    def test_large_list_runs_as_background_job(self):
+        self.client.force_login(self.admin)
+        iin_list = '\n'.join(user.iin for user in self.students)
+        self.client.post(reverse('admin:deactivate_users'), {'iin_list': iin_list}, secure=True)
+        self.assertEqual(CustomUser.objects.filter(is_active=False).count(), 0)
+
+        job = claim_lifecycle_job()
+        self.assertTrue(run_lifecycle_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.total, job.affected), ('done', 5, 5, 5))
+        self.assertEqual(CustomUser.objects.filter(is_active=False).count(), 5)
+
+
+class ExamSessionTests(TestCase):
+    def setUp(self):
+        variant_cache.clear()
+        for code in ('HIS', 'RL', 'ML', 'MAT', 'PHY'):
+            for variant in (1, 2):
+                Subject.objects.create(name=code, variant=variant)
+        self.school = School.objects.create(name='Школа 1')
+        self.students = [
+            CustomUser.objects.create_user(full_name=f'Ученик {i}', iin=f'96000000000{i}', school=self.school)
+            for i in range(3)
+        ]
+        CustomUser.objects.create_user(full_name='Другая школа', iin='960000000099')
+        self.session = ExamSession.objects.create(
+            school=self.school, selected_subjects=['MAT', 'PHY'],
+            starts_at=timezone.now() + timedelta(minutes=10), ends_at=timezone.now() + timedelta(hours=4),
+        )
+
+    def prepare(self):
+        session = claim_session()
+        self.assertEqual(session, self.session)
+        self.assertTrue(run_session(session))
+        self.session.refresh_from_db()
+
+    def test_prepare_assigns_variants_and_tokens(self):
+        ExamSession.objects.create(
+            school=self.school, starts_at=timezone.now() + timedelta(days=3), ends_at=timezone.now() + timedelta(days=4)
+        )
+        self.prepare()
+        self.assertIsNone(claim_session())
+        self.assertEqual((self.session.status, self.session.prepared, self.session.total), ('ready', 3, 3))
+
+        assignments = ExamAssignment.objects.filter(session=self.session)
+        self.assertEqual(sorted(a.user_id for a in assignments), [user.id for user in self.students])
+        names = dict(Subject.objects.values_list('id', 'name'))
+        for assignment in assignments:
+            self.assertEqual([names[i] for i in assignment.subject_ids], ['HIS', 'RL', 'ML', 'MAT', 'PHY'])
+        self.assertEqual(Token.objects.filter(user__in=self.students).count(), 3)
+
+    def test_login_with_access_code_and_get_test(self):
+        self.prepare()
+        student = self.students[0]
+        client = APIClient()
+        url = reverse('exam_login')
+        response = client.post(url, {'iin': student.iin, 'code': '00000000'}, format='json', secure=True)
+        self.assertEqual(response.status_code, 400)
+
+        code = access_code(self.session.id, student.id)
+        with self.assertNumQueries(1):
+            response = client.post(url, {'iin': student.iin, 'code': code}, format='json', secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['token'], Token.objects.get(user=student).key)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        response = client.get(reverse('exam_test'), secure=True)
+        test = json.loads(response.content)['test']
+        assignment = ExamAssignment.objects.get(session=self.session, user=student)
+        self.assertEqual([item['id'] for item in test], assignment.subject_ids)
+
+    def test_login_closed_outside_session_window(self):
+        self.session.starts_at = timezone.now() + timedelta(hours=2)
+        self.session.save()
+        self.prepare()
+        student = self.students[0]
+        response = APIClient().post(reverse('exam_login'), {
+            'iin': student.iin, 'code': access_code(self.session.id, student.id)
+        }, format='json', secure=True)
+        self.assertEqual(response.status_code, 400)
+
+        client = APIClient()
+        client.force_authenticate(user=student)
+        self.assertEqual(client.get(reverse('exam_test'), secure=True).status_code, 404)
+
+    def test_admin_downloads_access_codes(self):
+        self.prepare()
+        admin_user = CustomUser.objects.create_superuser(full_name='Админ', iin='960000000098', password='pass')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:tests_examsession_changelist'), {
+            'action': 'download_access_codes', '_selected_action': [self.session.id],
+        }, secure=True)
+        rows = list(load_workbook(io.BytesIO(b''.join(response.streaming_content))).active.values)
+        self.assertEqual(len(rows), 4)
+        student = self.students[0]
+        self.assertIn((self.session.id, student.iin, student.full_name, access_code(self.session.id, student.id)), rows)
+
+    def test_admin_time_edit_keeps_session_ready(self):
+        self.prepare()
+        admin_user = CustomUser.objects.create_superuser(full_name='Админ', iin='960000000098', password='pass')
+        self.client.force_login(admin_user)
+        starts_at = timezone.localtime(self.session.starts_at)
+        ends_at = timezone.localtime(self.session.ends_at + timedelta(hours=1))
+        data = {
+            'school': self.school.id, 'selected_subjects': ['MAT', 'PHY'],
+            'starts_at_0': starts_at.strftime('%Y-%m-%d'), 'starts_at_1': starts_at.strftime('%H:%M:%S'),
+            'ends_at_0': ends_at.strftime('%Y-%m-%d'), 'ends_at_1': ends_at.strftime('%H:%M:%S'),
+        }
+        url = reverse('admin:tests_examsession_change', args=[self.session.id])
+        self.assertEqual(self.client.post(url, data, secure=True).status_code, 302)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'ready')
+
+        data['selected_subjects'] = ['MAT']
+        self.client.post(url, data, secure=True)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'pending')
+
+    def test_repeated_preparation_keeps_issued_variants(self):
+        self.prepare()
+        issued = dict(ExamAssignment.objects.values_list('user_id', 'subject_ids'))
+        newcomer = CustomUser.objects.create_user(full_name='Новенький', iin='960000000010', school=self.school)
+        ExamSession.objects.filter(pk=self.session.pk).update(status=ExamSession.PENDING)
+        self.prepare()
+
+        assignments = dict(ExamAssignment.objects.values_list('user_id', 'subject_ids'))
+        self.assertEqual({user_id: assignments[user_id] for user_id in issued}, issued)
+        self.assertEqual(len(assignments[newcomer.id]), 5)
+
+    def test_missing_subject_fails_preparation(self):
+        self.session.selected_subjects = ['BIO']
+        self.session.save()
+        self.assertFalse(run_session(claim_session()))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'failed')
+        self.assertIn('BIO', self.session.error)
+
+
+class SignedTicketTests(TestCase):
+    def setUp(self):
+        answer_key_index.clear()
+        self.user = CustomUser.objects.create_user(full_name='Ученик', iin='970000000001')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.questions = {}
+        for code in ('HIS', 'RL', 'ML'):
+            subject = Subject.objects.create(name=code, variant=1)
+            question = Question.objects.create(subject=subject, text='Q', question_type='SC')
+            answer = Answer.objects.create(question=question, text='A', is_correct=True)
+            self.questions[code] = (subject.id, question.id, answer.id)
+        other = Subject.objects.create(name='HIS', variant=2, is_active=False)
+        other_question = Question.objects.create(subject=other, text='Q', question_type='SC')
+        self.other = (other.id, other_question.id, Answer.objects.create(question=other_question, text='A',
+                                                                         is_correct=True).id)
+
+    def submit(self, answers, ticket=None):
+        # Лимит submit_answers — 2 в день
+        throttle_store.clear()
+        headers = {TICKET_HEADER: ticket} if ticket is not None else {}
+        return self.client.post(reverse('submit_answers'), {'answers': answers}, format='json', secure=True,
+                                headers=headers)
+
+    def test_generate_test_issues_ticket_for_served_variants(self):
+        response = self.client.post(reverse('generate_test'), {}, format='json', secure=True)
+        test = json.loads(response.content)['test']
+        ticket = response[TICKET_HEADER]
+
+        his_id, question_id, answer_id = self.questions['HIS']
+        other_id, other_question_id, other_answer_id = self.other
+        # Вопрос из чужого варианта в выданном предмете отклоняется
+        answers = {str(his_id): {str(question_id): [answer_id], str(other_question_id): [other_answer_id]}}
+        response = self.submit(answers, ticket)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(other_question_id), response.data['error'])
+
+        # Ответы проверяются по ключам выданных вариантов, без запросов за вопросами
+        answer_key_index.warm([item['id'] for item in test])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.submit({str(his_id): {str(question_id): [answer_id]}}, ticket)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_score'], 1)
+        self.assertFalse([q for q in queries if 'tests_question' in q['sql']])
+
+        # Без тикета ответ проверяется как раньше, пока не включён TEST_TICKET_REQUIRED
+        self.assertEqual(self.submit(answers).data['total_score'], 2)
+        with override_settings(TEST_TICKET_REQUIRED=True):
+            self.assertEqual(self.submit(answers).status_code, 400)
+
+    def test_rejects_foreign_subject_and_bad_tickets(self):
+        issued = [subject_id for subject_id, _, _ in self.questions.values()]
+        other_id, other_question_id, other_answer_id = self.other
+        answers = {str(other_id): {str(other_question_id): [other_answer_id]}}
+        response = self.submit(answers, issue_ticket(self.user, issued))
+        self.assertEqual(response.status_code, 400)
+
+        his_answers = {str(self.questions['HIS'][0]): {}}
+        stranger = CustomUser.objects.create_user(full_name='Другой', iin='970000000002')
+        self.assertEqual(self.submit(his_answers, issue_ticket(stranger, issued)).status_code, 400)
+        self.assertEqual(self.submit(his_answers, issue_ticket(self.user, issued) + 'x').status_code, 400)
+        with override_settings(TEST_TICKET_MAX_AGE=-1):
+            self.assertEqual(self.submit(his_answers, issue_ticket(self.user, issued)).status_code, 400)
+
+
+class IdempotentSubmissionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(full_name='Ученик', iin='980000000001')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.subject = Subject.objects.create(name='HIS', variant=1)
+        question = Question.objects.create(subject=self.subject, text='Q', question_type='SC')
+        answer = Answer.objects.create(question=question, text='A', is_correct=True)
+        self.answers = {str(self.subject.id): {str(question.id): [answer.id]}}
+
+    def submit(self, headers):
+        headers = {TICKET_HEADER: issue_ticket(self.user, [self.subject.id]), **headers}
+        return self.client.post(reverse('submit_answers'), {'answers': self.answers}, format='json', secure=True,
+                                headers=headers)
+
+    def test_retry_returns_stored_result_without_regrading(self):
+        headers = {IDEMPOTENCY_HEADER: 'attempt-1'}
+        first = self.submit(headers)
+        self.assertEqual(first.status_code, 200)
+        # Лимит 2 в день: повторы его не расходуют и не проверяют ответы заново
+        with mock.patch('tests.views.grade_answers') as grade:
+            for _ in range(3):
+                retry = self.submit(headers)
+                self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        grade.assert_not_called()
+        self.assertEqual(TestResult.objects.count(), 1)
+        # Квитанция хранит только ключ и ссылку на результат
+        self.assertEqual(SubmissionTicket.objects.values_list('answers', 'correct_answers').get(), ({}, None))
+
+        self.submit({IDEMPOTENCY_HEADER: 'attempt-2'})
+        self.assertEqual(TestResult.objects.count(), 2)
+
+    def test_ticket_derives_key(self):
+        headers = {TICKET_HEADER: issue_ticket(self.user, [self.subject.id])}
+        self.assertEqual(self.submit(headers).data['id'], self.submit(headers).data['id'])
+        self.assertEqual(TestResult.objects.count(), 1)
+
+    def test_concurrent_duplicate_is_rolled_back(self):
+        grading = grade_answers(self.answers)
+        winner, created = save_graded(self.user, self.answers, grading, 'k' * 64)
+        self.assertTrue(created)
+        # Проигравший параллельный повтор упирается в уникальный индекс
+        loser, created = save_graded(self.user, self.answers, grading, 'k' * 64)
+        self.assertFalse(created)
+        self.assertEqual(loser, winner)
+        self.assertEqual(TestResult.objects.count(), 1)
+        self.assertEqual(SubjectResult.objects.count(), 1)
+
+    def test_failed_submission_is_replaced(self):
+        key = hashlib.sha256(b'key:attempt-1').hexdigest()
+        failed = SubmissionTicket.objects.create(
+            user=self.user, answers={}, idempotency_key=key, status=SubmissionTicket.FAILED
+        )
+        response = self.submit({IDEMPOTENCY_HEADER: 'attempt-1'})
+        self.assertEqual(response.data['total_score'], 1)
+        self.assertFalse(SubmissionTicket.objects.filter(pk=failed.pk).exists())
+
+        failed = SubmissionTicket.objects.create(
+            user=self.user, answers={}, idempotency_key=key[::-1], status=SubmissionTicket.FAILED
+        )
+        ticket = enqueue(self.user, self.answers, key[::-1])
+        self.assertNotEqual(ticket.pk, failed.pk)
+        self.assertEqual(ticket.status, SubmissionTicket.PENDING)
+
+    def test_integrity_error_without_winner_is_raised(self):
+        grading = grade_answers(self.answers)
+        with mock.patch.object(SubmissionTicket.objects, 'create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                save_graded(self.user, self.answers, grading, 'k' * 64)
+
+    @override_settings(DEFERRED_GRADING=True)
+    def test_deferred_retry_returns_same_ticket(self):
+        headers = {IDEMPOTENCY_HEADER: 'attempt-1'}
+        ticket = self.submit(headers).data['ticket']
+        self.assertEqual(self.submit(headers).data['ticket'], ticket)
+        self.assertEqual(SubmissionTicket.objects.count(), 1)
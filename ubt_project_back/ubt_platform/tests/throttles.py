@@ -1,30 +1,98 @@
 from rest_framework.exceptions import Throttled
-from rest_framework.throttling import UserRateThrottle
+from rest_framework.throttling import SimpleRateThrottle
 
-class GenerateTestThrottle(UserRateThrottle):
+from .idempotency import idempotency_key, submission_exists
+from .rate_limit import throttle_store
+
+
+class BucketRateThrottle(SimpleRateThrottle):
+    """
+    Лимит из REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope], общий для всех воркеров узла.
+    Вместо истории запросов в кэше — корзина токенов в throttle_store.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        allowed, self.wait_time = throttle_store.take(key, self.num_requests, self.duration)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserBucketRateThrottle(BucketRateThrottle):
+    """Лимит на пользователя, для анонимных — на IP."""
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class GenerateTestThrottle(UserBucketRateThrottle):
     scope = 'generate_test'
-    rate = '2/day'
 
     def allow_request(self, request, view):
-        if not self.is_request_allowed(request):
-            wait_time = self.wait()
+        if not super().allow_request(request, view):
             raise Throttled(
                 detail="Rate limit exceeded. Please wait before retrying.",
-                wait=wait_time
+                wait=self.wait()
             )
-        self.increment_request_count(request)
         return True
 
-    def is_request_allowed(self, request):
-        return super().allow_request(request, None)
 
-    def increment_request_count(self, request):
-        self.cache_key = self.get_cache_key(request, None)
-        if self.cache_key:
-            self.history = self.cache.get(self.cache_key, [])
-            self.history.insert(0, self.timer())
-            self.cache.set(self.cache_key, self.history, self.duration)
-
-class SubmitAnswersThrottle(UserRateThrottle):
+class SubmitAnswersThrottle(UserBucketRateThrottle):
     scope = 'submit_answers'
-    rate = '2/day'
+
+    def allow_request(self, request, view):
+        # Повтор уже принятой отправки отдаёт сохранённый результат и не расходует лимит
+        if request.user and request.user.is_authenticated and \
+                submission_exists(request.user, idempotency_key(request)):
+            return True
+        return super().allow_request(request, view)
+
+
+class VariantThrottle(UserBucketRateThrottle):
+    scope = 'variant'
+
+
+class QuestionBodiesThrottle(BucketRateThrottle):
+    """Запросы тел вопросов с одного IP (без авторизации, школа за NAT — лимит высокий)."""
+    scope = 'question_bodies'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginThrottle(BucketRateThrottle):
+    """
+    Попытки входа в один аккаунт (по ИИН) с одного IP, без ИИН — с одного IP.
+    Корзина общая только для ИИН и адреса, поэтому подбор с чужого адреса
+    не блокирует вход самому ученику; общий поток с адреса ограничивает LoginIpThrottle.
+    """
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        data = request.data if isinstance(request.data, dict) else {}
+        iin = str(data.get('iin') or '')[:12]
+        ip = self.get_ident(request)
+        ident = f'iin:{iin}:{ip}' if iin else ip
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class LoginIpThrottle(BucketRateThrottle):
+    """Попытки входа с одного IP. Вся школа входит с одного адреса за NAT, поэтому лимит высокий."""
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class ExamLoginThrottle(LoginIpThrottle):
+    scope = 'exam_login'
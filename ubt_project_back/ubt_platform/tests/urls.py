@@ -1,11 +1,27 @@
 # urls.py
+from django.conf import settings
 from django.urls import path
 from rest_framework.authtoken.views import obtain_auth_token
 
-from .views import GenerateTestView, SubmitAnswersView, CustomAuthToken
+from .views import GenerateTestView, SubmitAnswersView, SubmissionResultView, CustomAuthToken, VariantView, \
+    QuestionBodiesView, ExamLoginView, ExamTestView
+from .async_views import AsyncGenerateTestView, AsyncSubmitAnswersView, AsyncCustomAuthToken
+
+if settings.ASYNC_API_VIEWS:
+    # Под ASGI горячие эндпоинты обслуживаются нативно асинхронными представлениями
+    generate_test_view, submit_answers_view, login_view = (
+        AsyncGenerateTestView, AsyncSubmitAnswersView, AsyncCustomAuthToken
+    )
+else:
+    generate_test_view, submit_answers_view, login_view = GenerateTestView, SubmitAnswersView, CustomAuthToken
 
 urlpatterns = [
-    path('generate_test/', GenerateTestView.as_view(), name='generate_test'),
-    path('submit_answers/', SubmitAnswersView.as_view(), name='submit_answers'),
-    path('login/', CustomAuthToken.as_view(), name='api_token_auth'),
+    path('generate_test/', generate_test_view.as_view(), name='generate_test'),
+    path('variants/<int:subject_id>/', VariantView.as_view(), name='variant'),
+    path('questions/', QuestionBodiesView.as_view(), name='question_bodies'),
+    path('submit_answers/', submit_answers_view.as_view(), name='submit_answers'),
+    path('submit_answers/<uuid:ticket>/', SubmissionResultView.as_view(), name='submission_result'),
+    path('login/', login_view.as_view(), name='api_token_auth'),
+    path('exam/login/', ExamLoginView.as_view(), name='exam_login'),
+    path('exam/test/', ExamTestView.as_view(), name='exam_test'),
 ]
\ No newline at end of file
@@ -0,0 +1,216 @@
+import codecs
+import csv
+import io
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .admin_filters import invalidate_facets
+from .authentication import token_cache
+from .models import CustomUser, School, TestResult, UserImport
+
+ImportReport = namedtuple('ImportReport', ['created', 'updated', 'errors'])
+
+# Заголовки столбцов (в нижнем регистре) -> поле
+COLUMNS = {
+    'iin': 'iin', 'иин': 'iin',
+    'full_name': 'full_name', 'фио': 'full_name',
+    'school': 'school', 'школа': 'school',
+    'usage_type': 'usage_type', 'тип использования': 'usage_type',
+}
+
+USAGE_TYPES = {value for value, _ in CustomUser.USAGE_TYPE_CHOICES}
+IIN_VALIDATOR = CustomUser._meta.get_field('iin').validators[0]
+
+
+def _open_text(fileobj):
+    """Текстовый поток CSV: UTF-8 (с BOM или без), иначе cp1251, как сохраняет Excel."""
+    head = fileobj.read(64 * 1024)
+    fileobj.seek(0)
+    try:
+        # Инкрементальный декодер не ругается на символ, обрезанный концом блока
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1251'
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+
+
+def read_rows(fileobj, filename):
+    """Строки файла по одной: (номер строки, {поле: значение}). Первая строка — заголовки."""
+    if filename.lower().endswith('.xlsx'):
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+    else:
+        text = _open_text(fileobj)
+        try:
+            dialect = csv.Sniffer().sniff(text.read(4096), delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        text.seek(0)
+        rows = csv.reader(text, dialect)
+
+    header = next(rows, None) or []
+    fields = [COLUMNS.get(str(cell or '').strip().lower()) for cell in header]
+    if 'iin' not in fields or 'full_name' not in fields:
+        raise ValueError('В первой строке должны быть столбцы ИИН и ФИО')
+
+    for number, row in enumerate(rows, start=2):
+        values = {}
+        for field, cell in zip(fields, row):
+            if field:
+                values[field] = '' if cell is None else str(cell).strip()
+        if any(values.values()):
+            yield number, values
+
+
+def _validate(values):
+    iin = values.get('iin', '')
+    # Excel хранит ИИН числом и теряет ведущие нули года рождения (2000-е)
+    if iin.isdigit() and 10 <= len(iin) < 12:
+        iin = iin.zfill(12)
+    try:
+        IIN_VALIDATOR(iin)
+    except ValidationError:
+        raise ValueError('ИИН должен состоять из 12 цифр')
+    if not values.get('full_name'):
+        raise ValueError('Не указано ФИО')
+    usage_type = values.get('usage_type', '')
+    if usage_type and usage_type not in USAGE_TYPES:
+        raise ValueError(f'Неизвестный тип использования: {usage_type}')
+    return iin, values['full_name'], values.get('school', ''), usage_type
+
+
+def _resolve_schools(names, school_ids):
+    """Дополняет school_ids {название: id}, создавая недостающие школы."""
+    missing = set(names) - school_ids.keys()
+    if not missing:
+        return
+    for school_id, name in School.objects.filter(name__in=missing).order_by('id').values_list('id', 'name'):
+        school_ids.setdefault(name, school_id)
+    to_create = [School(name=name) for name in missing - school_ids.keys()]
+    for school in School.objects.bulk_create(to_create):
+        school_ids[school.name] = school.pk
+
+
+def _import_chunk(rows, school_ids, hash_passwords):
+    """Одна пачка строк: проверка, школы, пароли новых учеников и upsert. Возвращает (создано, обновлено, ошибки)."""
+    errors = []
+    valid = {}
+    for number, values in rows:
+        try:
+            iin, full_name, school, usage_type = _validate(values)
+        except ValueError as e:
+            errors.append({'row': number, 'iin': values.get('iin', ''), 'error': str(e)})
+            continue
+        if iin in valid:
+            errors.append({'row': number, 'iin': iin, 'error': f'ИИН повторяется (строка {valid[iin][0]})'})
+            continue
+        valid[iin] = (number, full_name, school, usage_type)
+    if not valid:
+        return 0, 0, errors
+
+    _resolve_schools({school for _, _, school, _ in valid.values() if school}, school_ids)
+    existing = dict(CustomUser.objects.filter(iin__in=valid).values_list('iin', 'id'))
+    staff = set(CustomUser.objects.filter(iin__in=existing, is_staff=True).values_list('iin', flat=True))
+    for iin in staff:
+        errors.append({'row': valid.pop(iin)[0], 'iin': iin, 'error': 'Это сотрудник, строка пропущена'})
+
+    # Пароль по умолчанию — ИИН; хэшируется только у новых учеников
+    new_iins = [iin for iin in valid if iin not in existing]
+    passwords = dict(zip(new_iins, hash_passwords(new_iins)))
+
+    # Существующим обновляем только указанные в строке данные, пароль не трогаем:
+    # пустая школа или тип использования не сбрасывают сохранённые
+    groups = {}
+    for iin, (_, full_name, school, usage_type) in valid.items():
+        update_fields = ('full_name',) + (('school',) if school else ()) + (('usage_type',) if usage_type else ())
+        groups.setdefault(update_fields, []).append(CustomUser(
+            iin=iin, full_name=full_name, school_id=school_ids.get(school), usage_type=usage_type or 'single',
+            password=passwords.get(iin, ''),
+        ))
+    with transaction.atomic():
+        for update_fields, users in groups.items():
+            CustomUser.objects.bulk_create(
+                users, update_conflicts=True, unique_fields=['iin'], update_fields=list(update_fields),
+            )
+    if existing:
+        token_cache.invalidate_users(list(existing.values()))
+    return len(new_iins), len(valid) - len(new_iins), errors
+
+
+def import_users(fileobj, filename, workers=1, chunk_size=1000):
+    """
+    Загружает учеников из XLSX или CSV потоково, пачками по chunk_size строк.
+    Пароли новых учеников хэшируются в пуле из workers процессов.
+    """
+    created = updated = 0
+    errors = []
+    school_ids = {}
+    rows = read_rows(fileobj, filename)
+
+    executor = None
+    if workers > 1:
+        # Дочерним процессам не нужны соединения с базой родителя
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+    def hash_passwords(raw_passwords):
+        if executor is None:
+            return [make_password(raw) for raw in raw_passwords]
+        return list(executor.map(make_password, raw_passwords, chunksize=max(1, len(raw_passwords) // workers)))
+
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            chunk_created, chunk_updated, chunk_errors = _import_chunk(chunk, school_ids, hash_passwords)
+            created += chunk_created
+            updated += chunk_updated
+            errors.extend(chunk_errors)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        # bulk_create не отправляет сигналы
+        invalidate_facets(CustomUser, TestResult)
+    return ImportReport(created, updated, errors)
+
+
+def claim_import():
+    """Забирает самую старую загрузку из очереди или возвращает None."""
+    with transaction.atomic():
+        queryset = UserImport.objects.filter(status=UserImport.PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        user_import = queryset.first()
+        if user_import is None:
+            return None
+        user_import.status = UserImport.RUNNING
+        user_import.save(update_fields=['status'])
+    return user_import
+
+
+def run_import(user_import, workers=1):
+    try:
+        with user_import.file.open('rb') as fileobj:
+            report = import_users(fileobj, os.path.basename(user_import.file.name), workers)
+    except Exception as e:
+        UserImport.objects.filter(pk=user_import.pk).update(
+            status=UserImport.FAILED, finished_at=timezone.now(), error=repr(e)
+        )
+        return False
+
+    UserImport.objects.filter(pk=user_import.pk).update(
+        status=UserImport.DONE, finished_at=timezone.now(),
+        created=report.created, updated=report.updated, row_errors=report.errors,
+    )
+    return True
@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .admin_filters import invalidate_facets
+from .authentication import token_cache
+from .models import CustomUser, TestResult, SubjectResult, SubmissionTicket, UserLifecycleJob
+from .rollups import forget_results
+
+LifecycleReport = namedtuple('LifecycleReport', ['requested', 'affected'])
+
+
+def parse_iins(text):
+    """ИИН по одному на строку, без пустых строк и повторов, в исходном порядке."""
+    return list(dict.fromkeys(iin.strip() for iin in text.splitlines() if iin.strip()))
+
+
+def _delete_users(user_ids):
+    """
+    Удаляет учеников пачки вместе с результатами.
+
+    Баллы по предметам и тикеты без сигналов удаляются одним запросом по множеству,
+    результаты и сами ученики (до chunk_size) — обычным delete() с сигналами
+    (сброс кэшей фильтров и токенов). Сводки по дням удалённых результатов
+    пересчитываются после фиксации транзакции.
+    """
+    test_results = TestResult.objects.filter(user_id__in=user_ids)
+    forget_results(test_results)
+    SubjectResult.objects.filter(test_result__user_id__in=user_ids).delete()
+    SubmissionTicket.objects.filter(user_id__in=user_ids).delete()
+    test_results.delete()
+    CustomUser.objects.filter(id__in=user_ids).delete()
+
+
+def _apply_chunk(action, iins):
+    users = CustomUser.objects.filter(iin__in=iins).exclude(is_staff=True).exclude(is_superuser=True)
+    with transaction.atomic():
+        user_ids = list(users.values_list('id', flat=True))
+        if not user_ids:
+            return 0
+        if action == UserLifecycleJob.ACTIVATE:
+            CustomUser.objects.filter(id__in=user_ids).update(is_active=True, created_at=timezone.now())
+        elif action == UserLifecycleJob.DEACTIVATE:
+            CustomUser.objects.filter(id__in=user_ids).update(is_active=False)
+        elif action == UserLifecycleJob.DELETE:
+            _delete_users(user_ids)
+        else:
+            raise ValueError(f'Unknown action: {action}')
+    if action != UserLifecycleJob.DELETE:
+        # update() не отправляет сигналы
+        token_cache.invalidate_users(user_ids)
+    return len(user_ids)
+
+
+def apply_user_action(action, iins, chunk_size=None, progress=None):
+    """
+    Активирует, деактивирует или удаляет учеников по списку ИИН пачками
+    по chunk_size (USER_LIFECYCLE_CHUNK_SIZE), каждая пачка — своя короткая транзакция.
+    Сотрудники и суперпользователи не затрагиваются.
+    progress(обработано ИИН, изменено учеников) вызывается после каждой пачки.
+    """
+    chunk_size = chunk_size or settings.USER_LIFECYCLE_CHUNK_SIZE
+    affected = 0
+    try:
+        for start in range(0, len(iins), chunk_size):
+            chunk = iins[start:start + chunk_size]
+            chunk_affected = _apply_chunk(action, chunk)
+            affected += chunk_affected
+            if progress is not None:
+                progress(len(chunk), chunk_affected)
+    finally:
+        invalidate_facets(CustomUser, TestResult)
+    return LifecycleReport(len(iins), affected)
+
+
+def claim_lifecycle_job():
+    """Забирает самое старое задание из очереди или возвращает None."""
+    with transaction.atomic():
+        queryset = UserLifecycleJob.objects.filter(status=UserLifecycleJob.PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.first()
+        if job is None:
+            return None
+        job.status = UserLifecycleJob.RUNNING
+        job.total = len(parse_iins(job.iins))
+        job.processed = job.affected = 0
+        job.save(update_fields=['status', 'total', 'processed', 'affected'])
+    return job
+
+
+def run_lifecycle_job(job):
+    def progress(processed, affected):
+        UserLifecycleJob.objects.filter(pk=job.pk).update(
+            processed=F('processed') + processed, affected=F('affected') + affected
+        )
+
+    try:
+        apply_user_action(job.action, parse_iins(job.iins), progress=progress)
+    except Exception as e:
+        UserLifecycleJob.objects.filter(pk=job.pk).update(
+            status=UserLifecycleJob.FAILED, finished_at=timezone.now(), error=repr(e)
+        )
+        return False
+
+    UserLifecycleJob.objects.filter(pk=job.pk).update(status=UserLifecycleJob.DONE, finished_at=timezone.now())
+    return True
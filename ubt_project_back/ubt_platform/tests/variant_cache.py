@@ -0,0 +1,154 @@
+import hashlib
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from . import content_versions
+from .compression import Segment, accepted_encodings, gzip_join, set_content_encoding
+from .models import Subject
+from .serializers import SubjectSerializer
+from .variant_registry import is_active_variant
+
+TEST_PREFIX = Segment(b'{"test":[')
+QUESTIONS_PREFIX = Segment(b'{"questions":[')
+LIST_SEPARATOR = Segment(b',')
+LIST_SUFFIX = Segment(b']}')
+
+QUESTION_HASH_LENGTH = 32
+
+
+class VariantPayload:
+    __slots__ = ('subject_id', 'version', 'data', 'body', 'segment', 'manifest_segment', 'questions')
+
+    def __init__(self, subject_id, version, data, body, manifest_body, questions):
+        self.subject_id = subject_id
+        self.version = version
+        self.data = data
+        # Готовые JSON-байты, чтобы тёплый запрос не трогал сериализатор
+        self.body = body
+        # И заранее сжатые: gzip ответа склеивается из кусков без пересжатия
+        self.segment = Segment(body)
+        # Манифест: id вопросов и хэши их содержимого вместо самих текстов
+        self.manifest_segment = Segment(manifest_body)
+        # Тела вопросов текущей версии по хэшу: {hash: Segment}
+        self.questions = questions
+
+    @property
+    def etag(self):
+        return f'{self.subject_id}-{self.version}'
+
+
+class VariantPayloadCache(content_versions.VersionedSubjectCache):
+    """Кэш сериализованных вариантов (SubjectSerializer) в памяти процесса."""
+
+    def _build(self, subject_ids, versions):
+        subjects = Subject.objects.filter(id__in=subject_ids).prefetch_related(
+            'questions__answers', 'questions__matching_pairs'
+        )
+        renderer = JSONRenderer()
+        questions_url = reverse('question_bodies')
+        built = {}
+        for subject in subjects:
+            data = SubjectSerializer(subject).data
+            manifest_questions = []
+            questions = {}
+            for question in data['questions']:
+                question_body = renderer.render(question)
+                digest = hashlib.sha256(question_body).hexdigest()[:QUESTION_HASH_LENGTH]
+                questions[digest] = Segment(question_body)
+                manifest_questions.append({'id': question['id'], 'hash': digest})
+            manifest = {
+                'id': data['id'],
+                'name': data['name'],
+                'variant': data['variant'],
+                'questions': manifest_questions,
+                # Один и тот же адрес для всех, кому выпал этот вариант, — кэшируется браузером и прокси
+                'questions_url': f'{questions_url}?s={subject.id}&h=' + ','.join(q['hash'] for q in manifest_questions),
+            }
+            built[subject.id] = VariantPayload(
+                subject.id, versions[subject.id], data, renderer.render(data), renderer.render(manifest), questions
+            )
+        return built
+
+
+variant_cache = VariantPayloadCache()
+
+
+def _etag(tag, encoding):
+    # Сильный ETag свой у каждой кодировки: байты ответа разные
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def _json_list_response(request, prefix, items):
+    """JSON-ответ prefix + items через запятую + ']}', при поддержке gzip — из заранее сжатых кусков."""
+    segments = [prefix]
+    for index, segment in enumerate(items):
+        if index:
+            segments.append(LIST_SEPARATOR)
+        segments.append(segment)
+    segments.append(LIST_SUFFIX)
+
+    encoding = 'gzip' if 'gzip' in accepted_encodings(request) else None
+    if encoding:
+        body = gzip_join(segments)
+    else:
+        body = b''.join(segment.raw for segment in segments)
+    return set_content_encoding(HttpResponse(body, content_type='application/json'), encoding), encoding
+
+
+def generate_test_response(request, payloads, manifest=False):
+    """
+    Ответ generate_test из готовых вариантов.
+    В режиме manifest вместо текстов вопросов — их хэши и адрес question_bodies.
+    """
+    if manifest:
+        items = [payload.manifest_segment for payload in payloads]
+    else:
+        items = [payload.segment for payload in payloads]
+    response, encoding = _json_list_response(request, TEST_PREFIX, items)
+    tag = hashlib.sha1(':'.join(payload.etag for payload in payloads).encode()).hexdigest()
+    response['ETag'] = _etag(f'{tag}-manifest' if manifest else tag, encoding)
+    return response
+
+
+def find_question_bodies(subject_id, hashes):
+    """
+    Тела вопросов варианта по хэшам или None, если какого-то хэша нет в текущей версии варианта.
+    Собирается не больше одного варианта, и только активного: по произвольному id
+    неактивные варианты не собираются, старые версии не отдаются.
+    """
+    if not is_active_variant(subject_id):
+        return None
+    payload = variant_cache.get(subject_id)
+    if payload is None:
+        return None
+    try:
+        return [payload.questions[digest] for digest in hashes]
+    except KeyError:
+        return None
+
+
+def question_bodies_response(request, segments):
+    """Тела вопросов в порядке запроса. Содержимое по хэшу не меняется — кэшировать можно навсегда."""
+    response, _ = _json_list_response(request, QUESTIONS_PREFIX, segments)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def variant_response(request, payload):
+    """Один вариант: gzip по Accept-Encoding, ETag по версии контента и 304."""
+    encoding = 'gzip' if 'gzip' in accepted_encodings(request) else None
+    etag = _etag(payload.etag, encoding)
+
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        body = gzip_join([payload.segment]) if encoding else payload.body
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Вариант меняется только с версией: клиент всегда перепроверяет и получает 304
+    response['Cache-Control'] = 'private, no-cache'
+    return set_content_encoding(response, encoding if response.status_code == 200 else None)
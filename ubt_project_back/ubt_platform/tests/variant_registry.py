@@ -0,0 +1,44 @@
+import random
+from collections import defaultdict
+
+from .caching import model_cache
+from .models import Subject
+
+# Обязательные предметы, которые есть в каждом тесте
+DEFAULT_SUBJECTS = ['HIS', 'RL', 'ML']
+
+# Активные варианты по коду предмета: {код: (subject_id, ...)}.
+# Сбрасывается сигналом при любом сохранении или удалении Subject (см. signals.py),
+# в том числе при переключении is_active в списке админки.
+registry_cache = model_cache(Subject, 'active_variants')
+
+
+def _load_active_variants():
+    by_code = defaultdict(list)
+    for subject_id, code in Subject.objects.filter(is_active=True).order_by('id').values_list('id', 'name'):
+        by_code[code].append(subject_id)
+    return {code: tuple(ids) for code, ids in by_code.items()}
+
+
+def active_variants():
+    return registry_cache.get_or_set('by_code', _load_active_variants)
+
+
+def is_active_variant(subject_id):
+    """Есть ли такой активный вариант — по реестру, без запросов к базе."""
+    return any(subject_id in ids for ids in active_variants().values())
+
+
+def pick_variants(codes):
+    """
+    Случайный активный вариант для каждого кода, без запросов к базе.
+    Возвращает (subject_ids, None) или (None, код без активных вариантов).
+    """
+    registry = active_variants()
+    subject_ids = []
+    for code in codes:
+        ids = registry.get(code)
+        if not ids:
+            return None, code
+        subject_ids.append(random.choice(ids))
+    return subject_ids, None
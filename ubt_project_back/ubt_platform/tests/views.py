@@ -1,15 +1,98 @@
+from django.conf import settings
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.exceptions import Throttled
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.authtoken.models import Token
-from .models import Subject, Question, Answer, MatchingPair, TestResult, SubjectResult
-from .serializers import SubjectSerializer, TestResultSerializer
-import random
-
-from .throttles import SubmitAnswersThrottle, GenerateTestThrottle
+from .models import SubmissionTicket
+
+from .exam_sessions import find_login, current_subject_ids
+from .grading import grade_answers
+from .idempotency import idempotency_key, find_submission, save_graded
+from .results import save_test_result, result_payload, submission_payload
+from .signed_tickets import TICKET_HEADER, issue_ticket, ticket_answers, variant_issued
+from .submission_queue import enqueue
+from .throttles import SubmitAnswersThrottle, GenerateTestThrottle, LoginThrottle, LoginIpThrottle, \
+    ExamLoginThrottle, VariantThrottle, QuestionBodiesThrottle
+from .variant_cache import variant_cache, generate_test_response, variant_response, find_question_bodies, \
+    question_bodies_response, QUESTION_HASH_LENGTH
+from .variant_registry import DEFAULT_SUBJECTS, pick_variants
+
+
+# Общая логика generate_test и submit_answers: её же вызывают асинхронные представления (async_views.py)
+
+BAD_BODY = 'Expected a JSON object.'
+
+
+def read_selected_subjects(data):
+    """Доп. предметы из тела generate_test: (коды, None) или (None, ошибка)."""
+    if not isinstance(data, dict):
+        return None, BAD_BODY
+    selected_subjects = data.get('selected_subjects') or []
+    if not isinstance(selected_subjects, list) or not all(isinstance(code, str) for code in selected_subjects):
+        return None, 'selected_subjects must be a list of subject codes.'
+    return selected_subjects, None
+
+
+def issue_test(request, selected_subjects):
+    """Тест из случайных активных вариантов: (ответ, None) или (None, ошибка)."""
+    # Случайный активный вариант каждого предмета — из реестра в памяти, без запросов
+    subject_ids, missing = pick_variants(DEFAULT_SUBJECTS + selected_subjects)
+    if missing is not None:
+        return None, f'No variants for subject {missing}'
+
+    # Варианты берём из кэша уже закодированными в JSON и сжатыми
+    payloads = variant_cache.get_many(subject_ids)
+    response = generate_test_response(
+        request, [payloads[subject_id] for subject_id in subject_ids],
+        manifest=request.GET.get('mode') == 'manifest'
+    )
+    # Выданные варианты запоминает только подписанный тикет, в базу ничего не пишется
+    response[TICKET_HEADER] = issue_ticket(request.user, subject_ids)
+    return response, None
+
+
+def read_answers(data):
+    """Ответы из тела submit_answers: (ответы, None) или (None, ошибка)."""
+    if not isinstance(data, dict):
+        return None, BAD_BODY
+    answers = data.get('answers')
+    if not answers:
+        return None, 'No answers provided.'
+    if not isinstance(answers, dict):
+        return None, 'answers must be an object.'
+    return answers, None
+
+
+def accept_answers(request, answers, key, compact):
+    """Новая (не повторная) отправка: проверка или очередь. Возвращает (данные, HTTP-статус)."""
+    # С тикетом из generate_test проверяются только вопросы выданных вариантов
+    answers, error = ticket_answers(request, answers)
+    if error is not None:
+        return {'error': error}, status.HTTP_400_BAD_REQUEST
+
+    if settings.DEFERRED_GRADING:
+        # Ответы сохраняются в очередь, проверяет их process_submissions
+        ticket = enqueue(request.user, answers, key)
+        return {'ticket': str(ticket.ticket), 'status': ticket.status}, status.HTTP_202_ACCEPTED
+
+    # Ключи ответов загружаются пакетно, баллы считаются в памяти.
+    # correct_answers вида: { subject_id: { question_id: {...}, ...}, ... }
+    grading = grade_answers(answers)
+    if key is not None:
+        submission, created = save_graded(request.user, answers, grading, key)
+        return submission_payload(
+            submission, compact=compact, subject_scores=grading.subject_scores if created else None
+        )
+
+    test_result = save_test_result(request.user, grading)
+
+    # Дополнительно вложим correct_answers, чтобы фронт понимал, какие ответы верные
+    response_data = result_payload(
+        test_result, grading.correct_answers, grading.subject_scores, compact=compact
+    )
+    return response_data, status.HTTP_200_OK
 
 
 class GenerateTestView(APIView):
@@ -17,37 +100,72 @@ class GenerateTestView(APIView):
     throttle_classes = [GenerateTestThrottle]
 
     def post(self, request):
+        selected_subjects, error = read_selected_subjects(request.data)
+        if error is None:
+            response, error = issue_test(request, selected_subjects)
+        if error is not None:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        return response
+
+
+class VariantView(APIView):
+    """
+    Один вариант, выданный ученику (см. variant_issued): сжатое тело из кэша,
+    ETag и 304 при повторном запросе.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [VariantThrottle]
+
+    def get(self, request, subject_id):
+        payload = variant_cache.get(subject_id) if variant_issued(request, subject_id) else None
+        if payload is None:
+            return Response({'error': 'Variant not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return variant_response(request, payload)
+
+
+class QuestionBodiesView(APIView):
+    """
+    Тела вопросов по хэшам из манифеста generate_test (?h=hash1,hash2,...).
+
+    Без авторизации: хэш можно узнать только из манифеста, а ответ по одному
+    и тому же адресу неизменен и кэшируется браузерами и прокси.
+    Отдаются только вопросы текущей версии активного варианта ?s=id.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [QuestionBodiesThrottle]
+
+    def get(self, request):
         try:
-            selected_subjects = request.data.get('selected_subjects', [])
-            default_subjects = ['HIS', 'RL', 'ML', ]
-            all_subjects = default_subjects + selected_subjects
-
-            test_data = []
-
-            for subject_code in all_subjects:
-                variants = Subject.objects.filter(name=subject_code, is_active=True).values_list('variant', flat=True)
-                if not variants:
-                    return Response(
-                        {'error': f'No variants for subject {subject_code}'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                variant = random.choice(variants)
-                subject = Subject.objects.get(name=subject_code, variant=variant)
-                serializer = SubjectSerializer(subject)
-                test_data.append(serializer.data)
-
-            return Response({'test': test_data}, status=status.HTTP_200_OK)
-
-        except Throttled as e:
-            wait_time = e.wait
-            response = Response(
-                {"error": "Rate limit exceeded. Please try again later."},
-                status=status.HTTP_429_TOO_MANY_REQUESTS
-            )
-            if wait_time is not None:
-                response.headers['Retry-After'] = str(wait_time)
-                print("Retry-After header set to:", wait_time)
-            return response
+            subject_id = int(request.query_params.get('s', ''))
+        except ValueError:
+            return Response({'error': 'Invalid subject.'}, status=status.HTTP_400_BAD_REQUEST)
+        hashes = [digest for digest in request.query_params.get('h', '').split(',') if digest]
+        if not hashes or len(hashes) > 100 or any(len(digest) != QUESTION_HASH_LENGTH for digest in hashes):
+            return Response({'error': 'Invalid hashes.'}, status=status.HTTP_400_BAD_REQUEST)
+        segments = find_question_bodies(subject_id, hashes)
+        if segments is None:
+            return Response({'error': 'Question not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return question_bodies_response(request, segments)
+
+
+class ExamTestView(APIView):
+    """Заранее выданный тест открытого сейчас экзамена ученика (см. ExamSession)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        subject_ids = current_subject_ids(request.user)
+        if subject_ids is None:
+            return Response({'error': 'No exam in progress.'}, status=status.HTTP_404_NOT_FOUND)
+        payloads = variant_cache.get_many(subject_ids)
+        if len(payloads) != len(subject_ids):
+            return Response({'error': 'Exam variant not found.'}, status=status.HTTP_404_NOT_FOUND)
+        response = generate_test_response(
+            request, [payloads[subject_id] for subject_id in subject_ids],
+            manifest=request.query_params.get('mode') == 'manifest'
+        )
+        response[TICKET_HEADER] = issue_ticket(request.user, subject_ids)
+        return response
 
 
 class SubmitAnswersView(APIView):
@@ -55,128 +173,37 @@ class SubmitAnswersView(APIView):
     throttle_classes = [SubmitAnswersThrottle]
 
     def post(self, request):
-        answers = request.data.get('answers', {})
-        if not answers:
-            return Response({'error': 'No answers provided.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        user = request.user
-        total_score = 0
-        test_result = TestResult.objects.create(user=user, total_score=0)
-
-        # Здесь будем сохранять информацию о правильных ответах
-        # Данные вида: { subject_id: { question_id: {...}, ...}, ... }
-        correct_answers_dict = {}
-
-        for subject_id_str, subject_answers in answers.items():
-            try:
-                subject_id = int(subject_id_str)
-                subject = Subject.objects.get(id=subject_id)
-            except (ValueError, Subject.DoesNotExist):
-                # Skip invalid subject IDs
-                continue
-
-            subject_score = 0
-            correct_answers_dict[subject_id] = {}
-
-            for question_id_str, user_answers in subject_answers.items():
-                try:
-                    question_id = int(question_id_str)
-                    question = Question.objects.get(id=question_id)
-                except (ValueError, Question.DoesNotExist):
-                    # Skip invalid question IDs
-                    continue
-
-                # Подготовим структуру для хранения "правильных ответов" по каждому question_id
-                correct_answers_dict[subject_id][question_id] = {
-                    'question_type': question.question_type,
-                    'correct_answers': [],
-                }
-
-                if question.question_type == 'SC':
-                    # Найдём правильный ответ (их максимум один в SC)
-                    correct_answer = question.answers.filter(is_correct=True).first()
-                    if correct_answer:
-                        correct_answers_dict[subject_id][question_id]['correct_answers'] = [correct_answer.id]
-
-                    if not user_answers:
-                        # No answer selected
-                        pass  # Treat as incorrect
-                    else:
-                        try:
-                            user_answer_id = int(user_answers[0])
-                            if correct_answer and correct_answer.id == user_answer_id:
-                                subject_score += 1
-                        except (ValueError, IndexError):
-                            # Invalid answer format
-                            pass  # Treat as incorrect
-
-                elif question.question_type == 'MC':
-                    # Найдём все правильные ответы (их может быть несколько)
-                    correct_answer_ids = set(question.answers.filter(is_correct=True).values_list('id', flat=True))
-                    correct_answers_dict[subject_id][question_id]['correct_answers'] = list(correct_answer_ids)
-
-                    if not user_answers:
-                        # No answers selected
-                        pass  # Treat as incorrect
-                    else:
-                        try:
-                            user_answer_ids = set(map(int, user_answers))
-                            if user_answer_ids == correct_answer_ids:
-                                subject_score += 2
-                        except ValueError:
-                            # Invalid answer format
-                            pass  # Treat as incorrect
-
-                elif question.question_type == 'MT':
-                    # Предположим, что в модели один MatchingPair на вопрос (как у вас в примере)
-                    matching_pair = question.matching_pairs.first()
-                    if matching_pair:
-                        # Сохраняем правильную комбинацию
-                        correct_answers_dict[subject_id][question_id]['correct_answers'] = {
-                            'left_side_1': matching_pair.correct_for_left_1,
-                            'left_side_2': matching_pair.correct_for_left_2
-                        }
-
-
-                    left_side_1_value = user_answers.get('left_side_1')
-                    left_side_2_value = user_answers.get('left_side_2')
-
-                    # Check if any matching pair values are missing or empty
-                    if not left_side_1_value or not left_side_2_value:
-                        # One or more matches not selected
-                        pass  # Treat as incorrect
-                    else:
-                        try:
-                            left_side_1_value = int(left_side_1_value)
-                            left_side_2_value = int(left_side_2_value)
-                        except ValueError:
-                            # Invalid integer conversion
-                            pass  # Treat as incorrect
-                        else:
-                            if matching_pair and (
-                                matching_pair.correct_for_left_1 == left_side_1_value and
-                                matching_pair.correct_for_left_2 == left_side_2_value
-                            ):
-                                subject_score += 2
-
-
-            total_score += subject_score
-            SubjectResult.objects.create(test_result=test_result, subject=subject, score=subject_score)
-
-        test_result.total_score = total_score
-        test_result.save()
-
-        serializer = TestResultSerializer(test_result)
-
-        # Дополнительно вложим correct_answers_dict, чтобы фронт понимал, какие ответы верные
-        response_data = serializer.data
-        response_data['correct_answers'] = correct_answers_dict
-
-        return Response(response_data, status=status.HTTP_200_OK)
+        answers, error = read_answers(request.data)
+        if error is not None:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        compact = request.query_params.get('mode') == 'compact'
+
+        # Повтор отправки (сеть оборвалась до ответа): сохранённый результат без повторной проверки
+        key = idempotency_key(request)
+        submission = find_submission(request.user, key)
+        if submission is not None:
+            return Response(*submission_payload(submission, compact=compact))
+        return Response(*accept_answers(request, answers, key, compact))
+
+
+class SubmissionResultView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, ticket):
+        submission = SubmissionTicket.objects.select_related('test_result__user').filter(
+            ticket=ticket, user=request.user
+        ).first()
+        if submission is None:
+            return Response({'error': 'Ticket not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(*submission_payload(submission, compact=request.query_params.get('mode') == 'compact'))
 
 
 class CustomAuthToken(ObtainAuthToken):
+    throttle_classes = [LoginIpThrottle, LoginThrottle]
+
     def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
+            return Response({'error': BAD_BODY}, status=status.HTTP_400_BAD_REQUEST)
         iin = request.data.get('iin')
         password = request.data.get('password')
         user = authenticate(request, iin=iin, password=password)
@@ -189,4 +216,28 @@ class CustomAuthToken(ObtainAuthToken):
                 'full_name': user.full_name
             }, status=status.HTTP_200_OK)
 
-        return Response({"error": "Неверный ИИН"}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response({"error": "Неверный ИИН"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ExamLoginView(APIView):
+    """Вход на экзамен по ИИН и коду доступа: токен выдан заранее, пароль не проверяется."""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ExamLoginThrottle, LoginThrottle]
+
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({'error': BAD_BODY}, status=status.HTTP_400_BAD_REQUEST)
+        found = find_login(request.data.get('iin'), request.data.get('code'))
+        if found is None:
+            return Response({"error": "Неверный ИИН или код доступа"}, status=status.HTTP_400_BAD_REQUEST)
+        user, token, session = found
+        return Response({
+            'token': token.key,
+            'user_id': user.pk,
+            'iin': user.iin,
+            'full_name': user.full_name,
+            'exam_session': session.pk,
+            'starts_at': session.starts_at,
+            'ends_at': session.ends_at,
+        }, status=status.HTTP_200_OK)
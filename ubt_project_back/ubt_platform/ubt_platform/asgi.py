@@ -3,6 +3,9 @@ ASGI config for ubt_platform project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Set ``ASYNC_API_VIEWS=1`` to serve generate_test, submit_answers and login
+with the native async views from ``tests.async_views``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
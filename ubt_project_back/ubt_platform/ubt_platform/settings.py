@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 from django.conf.global_settings import X_FRAME_OPTIONS
 
@@ -96,14 +97,19 @@ CORS_ALLOW_HEADERS = [
     'content-type',
     'authorization',
     'Retry-After',
+    'x-test-ticket',
+    'idempotency-key',
 ]
 
 CORS_EXPOSE_HEADERS = [
     'Retry-After',
+    'X-Test-Ticket',
 ]
 
 ROOT_URLCONF = 'ubt_platform.urls'
 
+TEST_RUNNER = 'ubt_platform.test_runner.IsolatedTestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -135,10 +141,61 @@ DATABASES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'tests.authentication.CachedTokenAuthentication',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'generate_test': '2/day',
+        'submit_answers': '2/day',
+        'variant': '300/hour',
+        'question_bodies': '600/min',
+        # Вход: попытки в один аккаунт (по ИИН) с одного IP и все попытки с одного IP —
+        # вся школа входит с одного адреса за NAT
+        'login': '20/min',
+        'login_ip': '600/min',
+        'exam_login': '600/min',
+    },
 }
 
+# Файл SQLite со счётчиками лимитов, общий для всех воркеров на узле, но не между узлами:
+# за балансировщиком на N узлах каждый лимит фактически в N раз выше
+# (тесты пишут во временный каталог, см. ubt_platform/test_runner.py)
+THROTTLE_STORE_PATH = os.environ.get('THROTTLE_STORE_PATH') or os.path.join(
+    tempfile.gettempdir(), 'ubt_platform_throttle.sqlite3'
+)
+
+# Кэш токенов: локальный LRU в каждом процессе и, если задан алиас, общий кэш.
+# С общим кэшем отзыв токена или деактивация видны всем процессам сразу
+# (локальная копия сверяет счётчик сбросов), без него — через TOKEN_CACHE_TTL секунд
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 10
+TOKEN_CACHE_ALIAS = os.environ.get('TOKEN_CACHE_ALIAS') or None
+TOKEN_CACHE_SHARED_TTL = 600
+
+
+# Общий кэш: Redis, если задан REDIS_URL (нужен пакет redis) — обязателен для продакшена.
+# Без него кэш в памяти процесса: у каждого воркера свои копии вариантов и токенов,
+# а сброс версий контента и отзыв токенов доходят только до процесса, где они произошли.
+# Годится только для разработки и одного воркера (тесты — см. ubt_platform/test_runner.py)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'ubt',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+# Локальный уровень кэша tests.caching.TwoTierCache в каждом процессе
+CACHE_LOCAL_SIZE = 1000
+CACHE_LOCAL_TTL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -174,9 +231,16 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
+# Загруженные файлы (вложения Summernote, вынесенные картинки вопросов) Django отдаёт
+# только при DEBUG (см. ubt_platform/urls.py): в продакшене MEDIA_URL должен раздавать
+# веб-сервер из MEDIA_ROOT (например, location /media/ { alias .../media/; } в nginx)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Адрес API для абсолютных ссылок на картинки, вынесенные из текстов вопросов
+# (фронтенд на другом домене, как и с attachment_absolute_uri у Summernote)
+CONTENT_MEDIA_BASE_URL = os.environ.get('CONTENT_MEDIA_BASE_URL', 'https://api.oysana.site')
+
 SUMMERNOTE_CONFIG = {
     'iframe': True,  # Использовать iframe для изоляции стилей
     'summernote': {
@@ -215,3 +279,34 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 4000
+
+# Отложенная проверка ответов: submit_answers только ставит ответы в очередь,
+# проверяет их воркер `manage.py process_submissions`
+DEFERRED_GRADING = os.environ.get('DEFERRED_GRADING', '') == '1'
+
+# Асинхронные generate_test, submit_answers и login (для запуска под ASGI, см. asgi.py)
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS', '') == '1'
+
+# Выше этого числа строк админка показывает примерное количество записей (PostgreSQL)
+ADMIN_APPROXIMATE_COUNT_THRESHOLD = 100000
+
+# Сколько секунд держать в кэше количества у фильтров админки.
+# Правки пользователей сбрасывают их сразу, новые результаты учитываются по истечении срока.
+ADMIN_FACET_CACHE_TIMEOUT = 300
+
+# Массовые действия с учениками по списку ИИН: размер пачки (одна транзакция)
+# и длина списка, начиная с которой он уходит в фоновое задание
+USER_LIFECYCLE_CHUNK_SIZE = 500
+USER_LIFECYCLE_SYNC_LIMIT = 2000
+
+# Экзамены по расписанию: подготовка за сутки до начала, пачками по EXAM_PREPARE_CHUNK_SIZE учеников;
+# вход по коду доступа открывается за EXAM_LOGIN_EARLY секунд до начала
+EXAM_PREPARE_AHEAD = 24 * 60 * 60
+EXAM_PREPARE_CHUNK_SIZE = 500
+EXAM_LOGIN_EARLY = 30 * 60
+
+# Подписанный тикет выданного теста (заголовок X-Test-Ticket): срок действия в секундах
+# и обязательность при отправке ответов. Пока фронтенд не отправляет заголовок, ответы
+# без тикета проверяются как раньше; TEST_TICKET_REQUIRED=1 включить после его выхода
+TEST_TICKET_MAX_AGE = 6 * 60 * 60
+TEST_TICKET_REQUIRED = os.environ.get('TEST_TICKET_REQUIRED', '') == '1'
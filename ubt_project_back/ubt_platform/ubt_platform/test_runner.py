@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedTestRunner(DiscoverRunner):
+    """
+    Тесты не трогают общие файлы узла: кэш и счётчики лимитов лежат во временном каталоге
+    и очищаются перед каждым тестом. Кэш файловый, а не в памяти: как и Redis в продакшене,
+    он хранится вне процесса, поэтому тесты видят только то, что переживает сериализацию.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._settings = override_settings(
+            THROTTLE_STORE_PATH=os.path.join(self._tmpdir.name, 'throttle.sqlite3'),
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.path.join(self._tmpdir.name, 'cache'),
+            }},
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        self._tmpdir.cleanup()
+        super().teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        return isolated_result(super().get_resultclass() or unittest.TextTestResult)
+
+
+def isolated_result(base):
+    class IsolatedTestResult(base):
+        def startTest(self, test):
+            from django.core.cache import cache
+            from tests.rate_limit import throttle_store
+
+            cache.clear()
+            throttle_store.clear()
+            super().startTest(test)
+
+    return IsolatedTestResult
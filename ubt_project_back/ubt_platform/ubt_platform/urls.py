@@ -13,5 +13,6 @@ urlpatterns = [
     path('summernote/', include('django_summernote.urls')),
 ]
 
+# Без DEBUG медиафайлы раздаёт веб-сервер (см. MEDIA_URL в settings.py)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)